@@ -3,17 +3,47 @@
 This project focuses on developing proficiency in Git for version control, managing Python virtual environments, and handling various types of data. The project entails retrieving data from the web, processing it with suitable Python collections, and saving the processed data to files. 
  '''
 # Standard library imports
+import io
 import csv
+import gzip
+import bz2
+import lzma
+import zlib
+import codecs
+import itertools
 import pathlib
 import os
 import json
 import re
+import time
+import shutil
+import math
+import heapq
+import hashlib
+import sqlite3
+import threading
+import multiprocessing
+from contextlib import closing
+from html.parser import HTMLParser
+from array import array
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # External library imports (requires virtual environment)
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+# Optional: Zstandard-compressed datasets (.zst) can only be read if the zstandard package is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+zstandard_missing_message = "Zstandard-compressed data needs the optional zstandard package (py -m pip install zstandard)"
 
 # Local module imports
 import bethspornitz_project_setup
@@ -26,11 +56,584 @@ import bethspornitz_project_setup
 #Base data path (reused across functions)
 base_data_path = pathlib.Path.cwd().joinpath('data')
 
+# Size of each piece of text read when streaming (in characters)
+txt_chunk_size = 1024 * 1024
+
+# Number of most frequent words listed in each text analysis
+txt_top_k = 10
+
+# How every process pool starts its workers. Forked workers copy this process while download and
+# background-write threads are running, and can inherit a lock one of them holds (and hang on it);
+# forkserver workers start from a clean server process instead ('spawn' where forkserver is not available)
+process_pool_context = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+# Settings copied into every worker process when its pool starts. Forkserver workers import this module
+# afresh, so without this they would see the defaults instead of values changed at runtime (for example
+# base_data_path in tests, or columnar_cache_enabled and pipeline_csv_chunk_size set before main())
+worker_setting_names = [
+    'base_data_path', 'txt_chunk_size', 'txt_top_k', 'download_chunk_size', 'artifact_store_max_bytes',
+    'ngram_epsilon', 'ngram_delta', 'chart_backend', 'chart_histogram_bins', 'histogram_block_values',
+    'quantile_sketch_k', 'distinct_sketch_precision', 'csv_chunk_size', 'csv_preview_rows', 'csv_histogram_bins',
+    'covid_date_column', 'covid_group_column', 'covid_value_columns', 'covid_rolling_days', 'covid_report_rows',
+    'excel_chunk_size', 'columnar_cache_enabled', 'json_items_path', 'pipeline_csv_chunk_size',
+]
+
+# Get the current values of the worker settings
+def get_worker_settings():
+    return {name: globals()[name] for name in worker_setting_names}
+
+# Runs first in every worker process: apply the parent's settings, then the pool's own initializer
+def start_worker_process(settings, initializer=None):
+    globals().update(settings)
+    if initializer:
+        initializer()
+
+# Create a process pool whose workers start from process_pool_context with the current settings
+def create_process_pool(max_workers, initializer=None):
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=process_pool_context,
+        initializer=start_worker_process, initargs=(get_worker_settings(), initializer),
+    )
+
 def create_folder(folder_type, dataset_name):
     folder_path = base_data_path.joinpath(folder_type, dataset_name)
     folder_path.mkdir(parents=True, exist_ok=True)
     return folder_path
 
+# Saved files are tracked by their path under data/, for example csv/covid_csv/covid_csv.csv,
+# so the artifact store and the text index still work if the project moves
+def get_data_key(file_path):
+    file_path = pathlib.Path(file_path).resolve()
+    try:
+        return file_path.relative_to(base_data_path.resolve()).as_posix()
+    except ValueError:
+        return file_path.as_posix()
+
+##############################
+# HTTP (shared by every fetch function)
+##############################
+
+# Connection pool sizes: how many hosts keep open connections, and how many connections per host
+http_pool_hosts = 10
+http_pool_size_per_host = 4
+
+# Folder for the ETag / Last-Modified values of every downloaded URL
+http_cache_folder_name = 'http_cache'
+
+# Size of each piece written to disk when streaming a download (in bytes)
+download_chunk_size = 64 * 1024
+
+# Transfer encodings the server may compress responses with: gzip and deflate always,
+# plus br and zstd when the brotli and zstandard packages are installed
+http_accept_encoding = ACCEPT_ENCODING
+
+# One session per process, so connections are kept alive and reused between downloads
+http_session = None
+
+# Get the shared HTTP session, creating it the first time
+def get_http_session():
+    global http_session
+    if http_session is None:
+        http_session = requests.Session()
+        http_session.headers['Accept-Encoding'] = http_accept_encoding
+        adapter = HTTPAdapter(pool_connections=http_pool_hosts, pool_maxsize=http_pool_size_per_host)
+        http_session.mount('http://', adapter)
+        http_session.mount('https://', adapter)
+    return http_session
+
+# Path of the cache entry for a URL
+def get_http_cache_path(url):
+    url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return base_data_path.joinpath(http_cache_folder_name, f"{url_hash}.json")
+
+# Load the cache entry for a URL, or None if there is none
+def load_http_cache_entry(url):
+    cache_path = get_http_cache_path(url)
+    try:
+        with cache_path.open('r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+# Remember the validators of a response once its body has been saved to file_path
+# Pass expected_size when the file should hold the body byte for byte, so a failed write is never cached
+def save_http_cache_entry(url, file_path, response, expected_size=None):
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if not etag and not last_modified:
+        return
+    file_path = pathlib.Path(file_path)
+    if not file_path.exists() or (expected_size is not None and file_path.stat().st_size != expected_size):
+        return
+
+    cache_path = get_http_cache_path(url)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    entry = {
+        'url': url,
+        'path': str(file_path),
+        'size': file_path.stat().st_size,
+        'etag': etag,
+        'last_modified': last_modified,
+    }
+
+    # Write to a temporary file first so a crash never leaves a half-written entry
+    temp_path = cache_path.with_suffix('.tmp')
+    with temp_path.open('w', encoding='utf-8') as file:
+        json.dump(entry, file)
+    os.replace(temp_path, cache_path)
+
+# Send a GET through the shared session, asking the server to skip the body if file_path is still current
+# A response with status 304 means the saved file can be used as it is
+def cached_get(url, file_path, **kwargs):
+    headers = dict(kwargs.pop('headers', None) or {})
+
+    # Only revalidate if the saved file is the one the cache entry describes
+    entry = load_http_cache_entry(url)
+    file_path = pathlib.Path(file_path)
+    if entry and entry['path'] == str(file_path) and file_path.exists() and file_path.stat().st_size == entry['size']:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    return get_http_session().get(url, headers=headers, **kwargs)
+
+# Read a binary file in chunks
+def read_binary_chunks(file_path, chunk_size=download_chunk_size):
+    with open(file_path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+# Stream a download to file_path and yield its bytes as they arrive, so analysis can start right away
+# The body is written to <file>.part and renamed into place only once it is complete.
+# If an earlier download was interrupted, only the missing bytes are requested (HTTP Range),
+# as long as the server confirms the file has not changed since (If-Range).
+# Finished downloads are added to the artifact store. Returns the response status: after a 304 nothing
+# is yielded, since the saved file is current (iter_download_chunks yields the saved file instead).
+def stream_download(url, file_path, chunk_size=download_chunk_size):
+    file_path = pathlib.Path(file_path)
+    part_path = file_path.with_name(file_path.name + '.part')
+    part_info_path = file_path.with_name(file_path.name + '.part.json')
+
+    headers = {}
+    resume_from = 0
+    if part_path.exists() and part_info_path.exists():
+        with part_info_path.open('r', encoding='utf-8') as file:
+            part_info = json.load(file)
+        validator = part_info.get('etag') or part_info.get('last_modified')
+        resume_from = part_path.stat().st_size
+        if part_info.get('url') == url and validator and resume_from:
+            headers['Range'] = f"bytes={resume_from}-"
+            headers['If-Range'] = validator
+            # Byte ranges only line up with the saved bytes if the body is not re-compressed
+            headers['Accept-Encoding'] = 'identity'
+        else:
+            resume_from = 0
+
+    # Hash the body as it is written, so storing it afterwards does not read it again
+    digest = hashlib.sha256()
+
+    with cached_get(url, file_path, headers=headers, stream=True) as response:
+        if response.status_code == 416 and resume_from:
+            # The saved part is already as long as the body, so it cannot be resumed: start over
+            response.close()
+            part_path.unlink(missing_ok=True)
+            part_info_path.unlink(missing_ok=True)
+            return (yield from stream_download(url, file_path, chunk_size))
+
+        response.raise_for_status()  # Raise HTTPError for bad responses
+
+        if response.status_code == 304:
+            part_path.unlink(missing_ok=True)
+            part_info_path.unlink(missing_ok=True)
+            print(f"Not modified, using saved {file_path}")
+            return response.status_code
+
+        if response.status_code == 206:
+            content_range = response.headers.get('Content-Range', '')
+            if not resume_from or not content_range.startswith(f"bytes {resume_from}-"):
+                part_path.unlink(missing_ok=True)
+                part_info_path.unlink(missing_ok=True)
+                raise ValueError(f"Unexpected partial response for {url}: {content_range}")
+            print(f"Resuming download of {file_path} from byte {resume_from}")
+            for chunk in read_binary_chunks(part_path, chunk_size):
+                digest.update(chunk)
+                yield chunk
+            mode = 'ab'
+        else:
+            # Save the validators so the download can be resumed if it is interrupted
+            with part_info_path.open('w', encoding='utf-8') as file:
+                json.dump({
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }, file)
+            mode = 'wb'
+
+        with part_path.open(mode) as file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+                digest.update(chunk)
+                yield chunk
+
+    os.replace(part_path, file_path)
+    part_info_path.unlink(missing_ok=True)
+    save_http_cache_entry(url, file_path, response)
+    store_artifact(file_path, url, digest.hexdigest())
+    print(f"Download saved to {file_path}")
+    return response.status_code
+
+# Yield the bytes of a download as they arrive, or the bytes of the saved file if the server answered 304
+def iter_download_chunks(url, file_path, chunk_size=download_chunk_size):
+    status_code = yield from stream_download(url, file_path, chunk_size)
+    if status_code == 304:
+        yield from read_binary_chunks(file_path, chunk_size)
+
+# Download a URL to file_path without holding the body in memory (a 304 leaves the saved file as it is)
+def download_file(url, file_path, chunk_size=download_chunk_size):
+    for chunk in stream_download(url, file_path, chunk_size):
+        pass
+    return pathlib.Path(file_path)
+
+# Threads that save downloaded bodies to disk while they are being parsed
+background_write_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='background-write')
+
+# Save a downloaded body to file_path as it was received, then remember its validators and store it
+# Runs in a background thread; returns True once the file is saved, or False (and prints why) if it is not.
+def save_body_in_background(url, file_path, body, response):
+    temp_path = file_path.with_name(file_path.name + '.tmp')
+    try:
+        with temp_path.open('wb') as file:
+            file.write(body)
+        os.replace(temp_path, file_path)
+        save_http_cache_entry(url, file_path, response, expected_size=len(body))
+        store_artifact(file_path, url, hashlib.sha256(body).hexdigest())
+        print(f"Download saved to {file_path}")
+        return True
+    except OSError as e:
+        temp_path.unlink(missing_ok=True)
+        print(f"OSError occurred while saving {file_path}: {e}")
+        return False
+
+# Download a URL into memory so it can be parsed straight away, and save the raw bytes in the background
+# Returns (body, writer): the body as bytes, and a future that finishes once file_path is written.
+# Both are None if the server answered 304, so the caller reads the saved file instead.
+def fetch_into_buffer(url, file_path):
+    file_path = pathlib.Path(file_path)
+    response = cached_get(url, file_path)
+    response.raise_for_status()  # Raise HTTPError for bad responses
+    if response.status_code == 304:
+        print(f"Not modified, using saved {file_path}")
+        return None, None
+    body = response.content
+    return body, background_write_pool.submit(save_body_in_background, url, file_path, body, response)
+
+# Wait for a body saved by fetch_into_buffer; returns True if it is on disk (or there was nothing to save)
+# Errors are printed rather than raised, so they never hide an error from the analysis.
+def wait_for_saved_body(writer):
+    if writer is None:
+        return True
+    try:
+        return writer.result()
+    except Exception as e:
+        print(f"An unexpected error occurred while saving the download: {e}")
+        return False
+
+# Read-only file object over a stream of byte chunks, so parsers like pd.read_csv
+# can read a download while it is still arriving
+class ChunkStream(io.RawIOBase):
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self.buffer:
+            self.buffer = next(self.chunks, None)
+            if self.buffer is None:
+                self.buffer = b''
+                return 0
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+# Open a download as a buffered file object that reads the bytes as they arrive
+# Compressed downloads are saved as they are and decompressed as they are read
+def open_download_stream(url, file_path, chunk_size=download_chunk_size):
+    chunks = decompress_chunks(iter_download_chunks(url, file_path, chunk_size))
+    return io.BufferedReader(ChunkStream(chunks), buffer_size=chunk_size)
+
+##############################
+# Compression (pre-compressed datasets such as .csv.gz or .json.gz)
+##############################
+
+# File suffixes of compressed datasets, and the bytes every file of each format starts with
+compression_suffixes = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}
+compression_magic = {'gzip': b'\x1f\x8b', 'bz2': b'BZh', 'xz': b'\xfd7zXZ\x00', 'zstd': b'\x28\xb5\x2f\xfd'}
+
+# How many bytes are read to detect the compression format
+compression_sniff_size = 6
+
+# Get the compression suffix of a URL or file name ('.gz', ...), or '' if it is not compressed
+def get_compression_suffix(path_or_url):
+    suffix = pathlib.PurePosixPath(urlsplit(str(path_or_url)).path).suffix.lower()
+    return suffix if suffix in compression_suffixes else ''
+
+# Remove the compression suffix from a file name, so reports are named after the plain file
+def strip_compression_suffix(filename):
+    filename = str(filename)
+    suffix = get_compression_suffix(filename)
+    return filename[:-len(suffix)] if suffix else filename
+
+# Detect the compression format from the first bytes of a file, or None if it is not compressed
+# The bytes are checked rather than the suffix, in case a server already decompressed the body
+def detect_compression(data):
+    for compression, magic in compression_magic.items():
+        if data.startswith(magic):
+            return compression
+    return None
+
+# Create a decompressor that takes compressed data in pieces
+def create_decompressor(compression):
+    if compression == 'gzip':
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    elif compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    elif compression == 'xz':
+        return lzma.LZMADecompressor()
+    elif compression == 'zstd' and zstandard:
+        return zstandard.ZstdDecompressor().decompressobj()
+    elif compression == 'zstd':
+        raise ValueError(zstandard_missing_message)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+# Decompress a stream of byte chunks as they arrive; chunks that are not compressed pass through unchanged
+# Files made of several compressed parts back to back (like concatenated .gz files) are read in full.
+def decompress_chunks(chunks):
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= compression_sniff_size:
+            break
+
+    compression = detect_compression(head)
+    if compression is None:
+        if head:
+            yield head
+        yield from chunks
+        return
+
+    decompressor = create_decompressor(compression)
+    for chunk in itertools.chain([head], chunks):
+        while chunk:
+            if decompressor.eof:
+                decompressor = create_decompressor(compression)
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data if decompressor.eof else b''
+    if not decompressor.eof:
+        raise ValueError(f"Compressed {compression} data ended early")
+
+# Decompress a whole body held in memory (bodies that are not compressed are returned as they are)
+def decompress_bytes(body):
+    if detect_compression(body[:compression_sniff_size]) is None:
+        return body
+    return b''.join(decompress_chunks([body]))
+
+# Decode a stream of byte chunks into text, including characters split between two chunks
+def decode_text_chunks(chunks, encoding='utf-8'):
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+# Open a saved dataset file, decompressing it on the fly if it is compressed
+# Takes the same mode and arguments as open(); use 'rt' for text
+def open_dataset_file(file_path, mode='rb', **kwargs):
+    with open(file_path, 'rb') as file:
+        compression = detect_compression(file.read(compression_sniff_size))
+    if compression == 'gzip':
+        return gzip.open(file_path, mode, **kwargs)
+    elif compression == 'bz2':
+        return bz2.open(file_path, mode, **kwargs)
+    elif compression == 'xz':
+        return lzma.open(file_path, mode, **kwargs)
+    elif compression == 'zstd' and zstandard:
+        return zstandard.open(file_path, mode, **kwargs)
+    elif compression == 'zstd':
+        raise ValueError(zstandard_missing_message)
+    elif compression:
+        raise ValueError(f"Unsupported compression: {compression}")
+    return open(file_path, mode, **kwargs)
+
+##############################
+# Artifact store (every downloaded version, stored once by content hash)
+##############################
+
+# Largest total size of stored versions before the least recently used ones are removed
+artifact_store_max_bytes = 1024 * 1024 * 1024
+
+# Folder for the store: blobs/<hash[:2]>/<hash>, manifests/<dataset file>.json and index.json
+artifact_store_folder_name = 'store'
+
+# Only one thread at a time changes the store
+artifact_store_lock = threading.Lock()
+
+# Get the folder of the artifact store
+def get_artifact_store_path():
+    return base_data_path.joinpath(artifact_store_folder_name)
+
+# Get the path a blob with the given SHA-256 digest is stored at
+def get_artifact_blob_path(digest):
+    return get_artifact_store_path().joinpath('blobs', digest[:2], digest)
+
+# Get the manifest path for a dataset file
+def get_artifact_manifest_path(key):
+    return get_artifact_store_path().joinpath('manifests', key.replace('/', '__') + '.json')
+
+# Load a JSON file, or return a default if it does not exist yet
+def load_json_or_default(file_path, default):
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+# Save a JSON file through a temporary file so it is never left half-written
+def save_json_atomically(file_path, data):
+    file_path = pathlib.Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = file_path.with_name(file_path.name + '.tmp')
+    with temp_path.open('w', encoding='utf-8') as file:
+        json.dump(data, file, indent=4)
+    os.replace(temp_path, file_path)
+
+# Get the SHA-256 digest of a file, reading it in chunks
+def hash_file(file_path, chunk_size=download_chunk_size):
+    digest = hashlib.sha256()
+    for chunk in read_binary_chunks(file_path, chunk_size):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+# Store the current contents of a downloaded file and make it the dataset's current version
+# Identical contents are stored only once, however many datasets or runs produce them.
+# Pass digest if the SHA-256 was already computed while downloading.
+def store_artifact(file_path, url=None, digest=None):
+    file_path = pathlib.Path(file_path)
+    if not file_path.exists():
+        return None
+    digest = digest or hash_file(file_path)
+    key = get_data_key(file_path)
+    blob_path = get_artifact_blob_path(digest)
+
+    with artifact_store_lock:
+        if not blob_path.exists():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = blob_path.with_name(blob_path.name + '.tmp')
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, blob_path)
+
+        index_path = get_artifact_store_path().joinpath('index.json')
+        index = load_json_or_default(index_path, {})
+        index[digest] = {'size': blob_path.stat().st_size, 'last_used': time.time()}
+
+        # The newest version goes last; a version seen again moves back to the end
+        manifest_path = get_artifact_manifest_path(key)
+        manifest = load_json_or_default(manifest_path, {'path': key, 'current': None, 'versions': []})
+        manifest['versions'] = [version for version in manifest['versions'] if version['hash'] != digest]
+        manifest['versions'].append({
+            'hash': digest,
+            'size': index[digest]['size'],
+            'url': url,
+            'stored_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+        manifest['current'] = digest
+        save_json_atomically(manifest_path, manifest)
+
+        evict_artifacts(index)
+        save_json_atomically(index_path, index)
+
+    return digest
+
+# Remove the least recently used versions until the store fits in artifact_store_max_bytes
+# The current version of every dataset is always kept
+def evict_artifacts(index, max_bytes=None):
+    max_bytes = artifact_store_max_bytes if max_bytes is None else max_bytes
+    total = sum(entry['size'] for entry in index.values())
+    if total <= max_bytes:
+        return []
+
+    manifest_paths = list(get_artifact_store_path().joinpath('manifests').glob('*.json'))
+    manifests = {path: load_json_or_default(path, None) for path in manifest_paths}
+    current = {manifest['current'] for manifest in manifests.values() if manifest}
+
+    evicted = []
+    for digest, entry in sorted(index.items(), key=lambda item: item[1]['last_used']):
+        if total <= max_bytes:
+            break
+        if digest in current:
+            continue
+        get_artifact_blob_path(digest).unlink(missing_ok=True)
+        total -= entry['size']
+        evicted.append(digest)
+
+    for digest in evicted:
+        del index[digest]
+
+    # Drop evicted versions from the manifests so they only list versions that can be restored
+    for manifest_path, manifest in manifests.items():
+        if manifest and any(version['hash'] in evicted for version in manifest['versions']):
+            manifest['versions'] = [version for version in manifest['versions'] if version['hash'] not in evicted]
+            save_json_atomically(manifest_path, manifest)
+
+    if evicted:
+        print(f"Removed {len(evicted)} old versions from the artifact store")
+    return evicted
+
+# List the stored versions of a dataset file, oldest first
+def list_artifact_versions(file_path):
+    manifest = load_json_or_default(get_artifact_manifest_path(get_data_key(file_path)), None)
+    return manifest['versions'] if manifest else []
+
+# Get the path of a stored version (for example to compare it with the current file)
+def get_artifact_version_path(digest):
+    blob_path = get_artifact_blob_path(digest)
+    if not blob_path.exists():
+        raise FileNotFoundError(f"Version {digest} is not in the artifact store")
+
+    with artifact_store_lock:
+        index_path = get_artifact_store_path().joinpath('index.json')
+        index = load_json_or_default(index_path, {})
+        if digest in index:
+            index[digest]['last_used'] = time.time()
+            save_json_atomically(index_path, index)
+    return blob_path
+
+# Put a stored version back in place of the dataset file, without going to the network
+def restore_artifact_version(file_path, digest):
+    file_path = pathlib.Path(file_path)
+    blob_path = get_artifact_version_path(digest)
+    temp_path = file_path.with_name(file_path.name + '.tmp')
+    shutil.copyfile(blob_path, temp_path)
+    os.replace(temp_path, file_path)
+    store_artifact(file_path, digest=digest)
+    print(f"Restored version {digest[:12]} of {file_path}")
+    return file_path
+
 ##############################
 # TXT
 ##############################
@@ -44,96 +647,1124 @@ def write_txt_file(folder_path, filename, data):
 
 # Fetch data from a text file
 def fetch_and_write_txt_data(folder_path, filename, url):
-    response = requests.get(url)
+    file_path = folder_path / filename
+    if get_compression_suffix(url):
+        # Compressed sources are saved as they are and decompressed when read
+        try:
+            download_file(url, file_path)
+        except requests.RequestException as e:
+            print(f"Failed to fetch data: {e}")
+            return None
+        with open_dataset_file(file_path, 'rt', encoding='utf-8', newline='') as file:
+            return file.read()
+    response = cached_get(url, file_path)
      # Set the encoding explicitly to 'utf-8'
     response.encoding = 'utf-8'  # You can adjust this if the content requires a different encoding
-    if response.status_code == 200:
+    if response.status_code == 304:
+        print(f"Not modified, using saved {file_path}")
+        with file_path.open('r', encoding='utf-8', newline='') as file:
+            return file.read()
+    elif response.status_code == 200:
         write_txt_file(folder_path, filename, response.text)
+        save_http_cache_entry(url, file_path, response)
+        store_artifact(file_path, url)
         return response.text
     else:
         print(f"Failed to fetch data: {response.status_code}")
         return None
 
+# Open a streaming response for a text URL without downloading the body yet
+# Status 304 means the file saved at file_path is still current
+def fetch_txt_stream(url, file_path):
+    response = cached_get(url, file_path, stream=True)
+    # Set the encoding explicitly to 'utf-8'
+    response.encoding = 'utf-8'
+    if response.status_code in (200, 304):
+        return response
+    else:
+        print(f"Failed to fetch data: {response.status_code}")
+        response.close()
+        return None
+
+# Save text chunks to a file as they pass through to the analysis
+def write_txt_chunks(folder_path, filename, chunks):
+    file_path = folder_path / filename
+    with file_path.open('w', encoding='utf-8') as file:
+        for chunk in chunks:
+            file.write(chunk)
+            yield chunk
+    print(f"Text data saved to {file_path}")
+
+# Read a text file in chunks so the whole file is never held in memory
+def read_txt_chunks(file_path, chunk_size=txt_chunk_size):
+    with open_dataset_file(file_path, 'rt', encoding='utf-8', newline='') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+# HTML tags that start a new line of text on the page, so words on either side stay separate
+html_break_tags = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'footer', 'form',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'table', 'td', 'th', 'tr', 'ul',
+}
+
+# HTML tags whose contents are never shown on the page
+html_hidden_tags = {'script', 'style', 'title', 'template', 'noscript'}
+
+# How much of the start of a document is checked, and the start that marks it as HTML rather than plain text
+html_sniff_size = 1024
+html_start_pattern = re.compile(r'\s*<(!doctype|html|head|title|body|meta|!--)', re.IGNORECASE)
+
+# Collect the visible text of an HTML page as it is fed in pieces
+# Tags, attributes, comments and the contents of hidden tags are dropped
+class VisibleTextParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self.hidden_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in html_hidden_tags:
+            self.hidden_depth += 1
+        elif tag in html_break_tags:
+            self.pieces.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in html_break_tags:
+            self.pieces.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in html_hidden_tags:
+            self.hidden_depth = max(0, self.hidden_depth - 1)
+        elif tag in html_break_tags:
+            self.pieces.append('\n')
+
+    def handle_data(self, data):
+        if not self.hidden_depth:
+            self.pieces.append(data)
+
+    # Return the text collected since the last call
+    def take_text(self):
+        text = ''.join(self.pieces)
+        self.pieces.clear()
+        return text
+
+# Check whether the start of a document looks like HTML
+def looks_like_html(text):
+    return bool(html_start_pattern.match(text))
+
+# Turn chunks of HTML into chunks of visible text as they arrive
+def extract_html_text_chunks(chunks):
+    parser = VisibleTextParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        text = parser.take_text()
+        if text:
+            yield text
+    parser.close()
+    text = parser.take_text()
+    if text:
+        yield text
+
+# Get the visible text of a whole HTML document
+def extract_html_text(html_data):
+    return ''.join(extract_html_text_chunks([html_data]))
+
+# Pass text chunks through unchanged, or extract their visible text if the source is HTML
+# html=None checks the start of the text; True or False forces the choice
+def extract_visible_txt_chunks(chunks, html=None):
+    chunks = iter(chunks)
+
+    # Gather enough of the start of the text to recognise HTML, even if the chunks are tiny
+    head_chunks = []
+    head_size = 0
+    if html is None:
+        for chunk in chunks:
+            head_chunks.append(chunk)
+            head_size += len(chunk)
+            if head_size >= html_sniff_size:
+                break
+        html = looks_like_html(''.join(head_chunks))
+
+    def all_chunks():
+        yield from head_chunks
+        yield from chunks
+
+    return extract_html_text_chunks(all_chunks()) if html else all_chunks()
+
+# Read the visible text of a saved file in chunks (HTML files are detected and stripped of markup)
+def read_visible_txt_chunks(file_path, chunk_size=txt_chunk_size, html=None):
+    return extract_visible_txt_chunks(read_txt_chunks(file_path, chunk_size), html)
+
+# Build the byte translation table used by the tokenizer
+# Whitespace, hyphens and slashes become spaces, A-Z becomes a-z, and other ASCII characters are deleted
+def build_txt_byte_table():
+    table = bytearray(range(256))
+    delete = bytearray()
+    for code in range(128):
+        char = chr(code)
+        if char.isspace() or char in '-/':
+            table[code] = ord(' ')
+        elif char.isalpha():
+            table[code] = ord(char.lower())
+        else:
+            delete.append(code)
+    return bytes(table), bytes(delete)
+
+txt_byte_table, txt_byte_delete = build_txt_byte_table()
+
+# Runs of non-ASCII characters (rare in most texts, so handled separately)
+txt_non_ascii_pattern = re.compile(r'[^\x00-\x7f]+')
+
+# Clean text in a single pass and count its letters
+# Returns lowercase words separated by whitespace, plus the letter count
+def clean_txt_text(text):
+    non_ascii_letter_count = 0
+
+    # Non-ASCII whitespace still separates words and non-ASCII letters still count as letters,
+    # but neither is kept in the cleaned text
+    if not text.isascii():
+        def replace_non_ascii(match):
+            nonlocal non_ascii_letter_count
+            non_ascii_letter_count += sum(1 for char in match.group() if char.isalpha())
+            return ''.join(' ' for char in match.group() if char.isspace())
+        text = txt_non_ascii_pattern.sub(replace_non_ascii, text)
+
+    # Lowercase, separate and strip the text with one C-level table lookup per character
+    clean_bytes = text.encode('ascii').translate(txt_byte_table, txt_byte_delete)
+
+    # Only letters and spaces are left, so everything that is not a space is a letter
+    letter_count = len(clean_bytes) - clean_bytes.count(b' ') + non_ascii_letter_count
+
+    return clean_bytes.decode('ascii'), letter_count
+
+# Split text into lowercase words and count its letters
+def tokenize_txt_text(text):
+    clean_text, letter_count = clean_txt_text(text)
+    return clean_text.split(), letter_count
+
+# Split a stream of text chunks into batches of words, in order
+# Yields (words, letter_count) for each chunk; a word cut off at the end of a chunk
+# is held back and joined to the start of the next one
+def split_words_in_chunks(chunks):
+    # Cleaned start of a word that was cut off at the end of the previous chunk
+    carry = ''
+
+    for chunk in chunks:
+        clean_chunk, letter_count = clean_txt_text(chunk)
+
+        clean_chunk = carry + clean_chunk
+        words = clean_chunk.split()
+
+        # Hold back the last word if the chunk ends in the middle of it
+        if clean_chunk and not clean_chunk[-1].isspace():
+            carry = words.pop()
+        else:
+            carry = ''
+
+        yield words, letter_count
+
+    if carry:
+        yield [carry], 0
+
+# Count words and letters from a stream of text chunks
+def count_words_in_chunks(chunks):
+    word_freq = Counter()
+    word_count = 0
+    letter_count = 0
+
+    for words, chunk_letter_count in split_words_in_chunks(chunks):
+        word_count += len(words)
+        word_freq.update(words)
+        letter_count += chunk_letter_count
+
+    return word_count, word_freq, letter_count
+
+# Get the k most frequent words without sorting the whole vocabulary
+# Ties keep the order the words were first seen (like a stable sort),
+# or alphabetical order with alphabetical_ties=True
+def top_k_words(word_freq, k=txt_top_k, alphabetical_ties=False):
+    if alphabetical_ties:
+        return heapq.nsmallest(k, word_freq.items(), key=lambda x: (-x[1], x[0]))
+    return heapq.nlargest(k, word_freq.items(), key=lambda x: x[1])
+
+# Build the analysis report for a text file
+def format_txt_analysis(word_count, word_freq, letter_count, top_k=txt_top_k, alphabetical_ties=False):
+    analysis = (
+        f"Total Word Count: {word_count}\n"
+        f"Unique Words Count: {len(word_freq)}\n"
+        f"Total Letter Count: {letter_count}\n\n"
+        f"Top {top_k} Most Frequent Words:\n"
+    )
+
+    # Append the top words by frequency
+    for word, freq in top_k_words(word_freq, top_k, alphabetical_ties):
+        analysis += f"{word}: {freq}\n"
+
+    return analysis
+
 # Process and analyze text data
-def process_txt_file(dataset_name, filename, url):
+# Set streaming=True to read the download in chunks with flat memory use
+# HTML pages are detected automatically and only their visible text is counted (html=True or False forces it)
+def process_txt_file(dataset_name, filename, url, streaming=False, chunk_size=txt_chunk_size, top_k=txt_top_k, html=None):
     folder_path = create_folder('txt', dataset_name)
+
+    if streaming and get_compression_suffix(url):
+        # Decompress and decode the download as it arrives; the compressed file is saved as it is
+        try:
+            chunks = decode_text_chunks(decompress_chunks(iter_download_chunks(url, folder_path / filename)))
+            chunks = extract_visible_txt_chunks(chunks, html)
+            word_count, word_freq, letter_count = count_words_in_chunks(chunks)
+        except requests.RequestException as e:
+            print(f"Failed to fetch data: {e}")
+            return
+        analysis = format_txt_analysis(word_count, word_freq, letter_count, top_k)
+        write_txt_file(folder_path, f"analysis_{strip_compression_suffix(filename)}", analysis)
+        return
+
+    if streaming:
+        file_path = folder_path / filename
+        response = fetch_txt_stream(url, file_path)
+        if response:
+            with response:
+                if response.status_code == 304:
+                    print(f"Not modified, using saved {file_path}")
+                    chunks = read_txt_chunks(file_path, chunk_size)
+                else:
+                    chunks = response.iter_content(chunk_size=chunk_size, decode_unicode=True)
+                    chunks = write_txt_chunks(folder_path, filename, chunks)
+                chunks = extract_visible_txt_chunks(chunks, html)
+                word_count, word_freq, letter_count = count_words_in_chunks(chunks)
+            if response.status_code == 200:
+                save_http_cache_entry(url, file_path, response)
+                store_artifact(file_path, url)
+            analysis = format_txt_analysis(word_count, word_freq, letter_count, top_k)
+            write_txt_file(folder_path, f"analysis_{strip_compression_suffix(filename)}", analysis)
+        return
     
     text_data = fetch_and_write_txt_data(folder_path, filename, url)
     
     if text_data:
+        # Keep only the visible text of HTML pages
+        if html or (html is None and looks_like_html(text_data)):
+            text_data = extract_html_text(text_data)
 
-        # Replace hyphens and slashes with spaces to prevent word combinations
-        text_data = text_data.replace('-', ' ').replace('/', ' ')
+        # Clean the text, split it into words and count letters in one pass
+        words, letter_count = tokenize_txt_text(text_data)
 
-        # Remove non-alphabetic characters and make lowercase
-        clean_text = re.sub(r'[^A-Za-z\s]', '', text_data).lower()
+        # Get word count and frequency of each word
+        word_count = len(words)
+        word_freq = Counter(words)
 
-        # Normalize multiple spaces and other whitespace characters
-        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+        # Save the analysis to a file
+        analysis = format_txt_analysis(word_count, word_freq, letter_count, top_k)
+        write_txt_file(folder_path, f"analysis_{strip_compression_suffix(filename)}", analysis)
 
-        # Split the text into words
-        words = clean_text.split()
+# Re-analyze a text file that was already downloaded, reading it in chunks
+def analyze_local_txt_file(dataset_name, filename, chunk_size=txt_chunk_size, top_k=txt_top_k, html=None):
+    folder_path = create_folder('txt', dataset_name)
+    chunks = read_visible_txt_chunks(folder_path / filename, chunk_size, html)
+    word_count, word_freq, letter_count = count_words_in_chunks(chunks)
+    analysis = format_txt_analysis(word_count, word_freq, letter_count, top_k)
+    write_txt_file(folder_path, f"analysis_{strip_compression_suffix(filename)}", analysis)
+    return analysis
 
-        # Get word count and unique words using set
-        word_count = len(words)
-        unique_words = set(words)
+##############################
+# TXT corpus (many documents)
+##############################
 
-        # Get frequency of each word
-        word_freq = Counter(words)
+# Reports written under data/txt start with one of these, so they are never read back as documents
+txt_report_prefixes = ('analysis_', 'comparison_', 'corpus_analysis')
 
-        # Sort words by frequency
-        sorted_word_freq = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+# Find every downloaded text document under a folder (compressed ones too), skipping analysis reports
+def find_txt_files(folder_path):
+    folder_path = pathlib.Path(folder_path)
+    return sorted(
+        file_path for file_path in folder_path.rglob('*.txt*')
+        if strip_compression_suffix(file_path.name).endswith('.txt')
+        and not file_path.name.startswith(txt_report_prefixes)
+    )
+
+# Count words and letters in one text file, reading it in chunks
+def count_words_in_file(file_path, chunk_size=txt_chunk_size):
+    return count_words_in_chunks(read_visible_txt_chunks(file_path, chunk_size))
+
+# Worker task: count every document in a shard and return the counts in shard order
+def count_words_in_shard(file_paths, chunk_size=txt_chunk_size):
+    return [(file_path, count_words_in_file(file_path, chunk_size)) for file_path in file_paths]
+
+# Split a list of documents into shards of roughly equal size
+def split_into_shards(file_paths, shard_count):
+    shard_count = max(1, min(shard_count, len(file_paths)))
+    return [file_paths[index::shard_count] for index in range(shard_count)]
+
+# Count every document in parallel and merge the counts into a corpus total
+# Documents are merged in sorted path order, so the result is the same for any number of workers
+def count_words_in_corpus(file_paths, workers=None, chunk_size=txt_chunk_size):
+    file_paths = sorted(pathlib.Path(file_path) for file_path in file_paths)
+    workers = workers or os.cpu_count() or 1
+
+    # Several shards per worker so one slow document does not leave the other cores idle
+    shards = split_into_shards(file_paths, workers * 4)
+
+    document_counts = {}
+    if workers == 1:
+        for shard in shards:
+            document_counts.update(count_words_in_shard(shard, chunk_size))
+    else:
+        with create_process_pool(workers) as executor:
+            for shard_counts in executor.map(count_words_in_shard, shards, [chunk_size] * len(shards)):
+                document_counts.update(shard_counts)
+
+    # Reduce: merge the per-document counts in a fixed order
+    corpus_freq = Counter()
+    corpus_word_count = 0
+    corpus_letter_count = 0
+    ordered_counts = {file_path: document_counts[file_path] for file_path in file_paths}
+    for word_count, word_freq, letter_count in ordered_counts.values():
+        corpus_word_count += word_count
+        corpus_freq.update(word_freq)
+        corpus_letter_count += letter_count
+
+    return ordered_counts, (corpus_word_count, corpus_freq, corpus_letter_count)
+
+# Analyze many text documents as a corpus using all cores
+# Writes analysis_<filename> next to each document and corpus_analysis.txt under data/txt/<corpus_name>
+def process_txt_corpus(corpus_name, file_paths, workers=None, chunk_size=txt_chunk_size, top_k=txt_top_k):
+    document_counts, corpus_counts = count_words_in_corpus(file_paths, workers, chunk_size)
+
+    for file_path, counts in document_counts.items():
+        analysis = format_txt_analysis(*counts, top_k)
+        write_txt_file(file_path.parent, f"analysis_{strip_compression_suffix(file_path.name)}", analysis)
+
+    analysis = f"Documents: {len(document_counts)}\n"
+    analysis += format_txt_analysis(*corpus_counts, top_k)
+    analysis += "\nWords per Document:\n"
+    for file_path, (word_count, word_freq, letter_count) in document_counts.items():
+        analysis += f"{file_path.name}: {word_count}\n"
+
+    folder_path = create_folder('txt', corpus_name)
+    write_txt_file(folder_path, 'corpus_analysis.txt', analysis)
+    return analysis
 
-        # Count the total number of alphabetic characters (letters)
-        letter_count = sum(1 for char in text_data if char.isalpha())
+##############################
+# TXT vocabulary (words as integer ids)
+##############################
 
-        # Prepare the analysis results
-        analysis = (
-            f"Total Word Count: {word_count}\n"
-            f"Unique Words Count: {len(unique_words)}\n"
-            f"Total Letter Count: {letter_count}\n\n"
-            "Top 10 Most Frequent Words:\n"
+# Create an empty vocabulary: a list of words (index = id) and a dict from word to id
+def create_vocabulary():
+    return {'words': [], 'ids': {}}
+
+# Give each new word the next free id and return the ids for all words
+# Known words are looked up in one pass at C speed; only batches with new words are walked in Python
+def intern_words(vocabulary, words):
+    ids = vocabulary['ids']
+    word_ids = list(map(ids.get, words))
+    if None in word_ids:
+        vocabulary_words = vocabulary['words']
+        for index, word_id in enumerate(word_ids):
+            if word_id is None:
+                word = words[index]
+                word_id = ids.get(word)
+                if word_id is None:
+                    word_id = len(vocabulary_words)
+                    ids[word] = word_id
+                    vocabulary_words.append(word)
+                word_ids[index] = word_id
+    return word_ids
+
+# Count words as vocabulary ids, and letters, from a stream of text chunks
+# Each batch of words is interned and added to a uint64 array of counts indexed by word id,
+# so no Counter of str keys is built. Returns (word_count, counts, letter_count).
+def count_word_ids_in_chunks(vocabulary, chunks):
+    counts = np.zeros(len(vocabulary['words']), dtype=np.uint64)
+    word_count = 0
+    letter_count = 0
+
+    for words, chunk_letter_count in split_words_in_chunks(chunks):
+        word_ids = np.array(intern_words(vocabulary, words), dtype=np.intp)
+        batch_counts = np.bincount(word_ids, minlength=len(vocabulary['words'])).astype(np.uint64)
+        if len(batch_counts) > len(counts):
+            counts = np.concatenate([counts, np.zeros(len(batch_counts) - len(counts), dtype=np.uint64)])
+        counts += batch_counts
+        word_count += len(words)
+        letter_count += chunk_letter_count
+
+    return word_count, counts, letter_count
+
+# Save the vocabulary as a JSON list of words (the position of each word is its id)
+def save_vocabulary(vocabulary, file_path):
+    with open(file_path, 'w', encoding='utf-8') as file:
+        json.dump(vocabulary['words'], file)
+        print(f"Vocabulary saved to {file_path}")
+
+# Load a vocabulary saved with save_vocabulary
+def load_vocabulary(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        words = json.load(file)
+    return {'words': words, 'ids': {word: word_id for word_id, word in enumerate(words)}}
+
+# Save word counts as a NumPy array of unsigned 64-bit integers
+def save_word_counts(counts, file_path):
+    np.save(file_path, np.frombuffer(counts, dtype=np.uint64))
+    print(f"Word counts saved to {file_path}")
+
+# Load word counts, padded with zeros for words added to the vocabulary after they were saved
+def load_word_counts(file_path, vocabulary_size):
+    counts = np.load(file_path)
+    if len(counts) < vocabulary_size:
+        counts = np.concatenate([counts, np.zeros(vocabulary_size - len(counts), dtype=np.uint64)])
+    return counts
+
+# Count each saved text dataset against one shared vocabulary and save the results
+# Writes data/txt/vocabulary.json and data/txt/<dataset>/word_counts.npy
+def process_txt_vocabulary(dataset_names, chunk_size=txt_chunk_size):
+    txt_folder_path = base_data_path.joinpath('txt')
+    vocabulary_path = txt_folder_path.joinpath('vocabulary.json')
+
+    # Keep existing ids so counts saved earlier stay valid
+    vocabulary = load_vocabulary(vocabulary_path) if vocabulary_path.exists() else create_vocabulary()
+
+    for dataset_name in sorted(dataset_names):
+        folder_path = create_folder('txt', dataset_name)
+        chunks = read_visible_txt_chunks(folder_path / f"{dataset_name}.txt", chunk_size)
+        word_count, counts, letter_count = count_word_ids_in_chunks(vocabulary, chunks)
+        save_word_counts(counts, folder_path / 'word_counts.npy')
+
+    save_vocabulary(vocabulary, vocabulary_path)
+    return vocabulary
+
+# Load the saved counts of several datasets as one matrix (one row per dataset, one column per word id)
+def load_word_count_matrix(dataset_names):
+    vocabulary = load_vocabulary(base_data_path.joinpath('txt', 'vocabulary.json'))
+    vocabulary_size = len(vocabulary['words'])
+    rows = [
+        load_word_counts(base_data_path.joinpath('txt', dataset_name, 'word_counts.npy'), vocabulary_size)
+        for dataset_name in dataset_names
+    ]
+    return vocabulary, np.vstack(rows)
+
+# Compare the word counts of two datasets with array operations
+# Writes data/txt/<dataset_a>/comparison_<dataset_b>.txt
+def compare_txt_datasets(dataset_a, dataset_b, top_k=txt_top_k):
+    vocabulary, matrix = load_word_count_matrix([dataset_a, dataset_b])
+    words = vocabulary['words']
+    counts_a, counts_b = matrix.astype(np.int64)
+
+    in_a = counts_a > 0
+    in_b = counts_b > 0
+    shared = in_a & in_b
+
+    # Compare rates per 1000 words so datasets of different sizes can be compared
+    rate_a = counts_a * 1000 / max(counts_a.sum(), 1)
+    rate_b = counts_b * 1000 / max(counts_b.sum(), 1)
+    delta = rate_a - rate_b
+
+    analysis = (
+        f"Comparison of {dataset_a} and {dataset_b}\n\n"
+        f"Shared Words Count: {int(shared.sum())}\n"
+        f"Words Only in {dataset_a}: {int((in_a & ~in_b).sum())}\n"
+        f"Words Only in {dataset_b}: {int((in_b & ~in_a).sum())}\n"
+    )
+
+    # Pick the largest differences in each direction without sorting every word
+    for title, scores in ((f"More Frequent in {dataset_a}", delta), (f"More Frequent in {dataset_b}", -delta)):
+        k = min(top_k, len(scores))
+        top_ids = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=np.int64)
+        top_ids = top_ids[np.lexsort((top_ids, -scores[top_ids]))]
+        analysis += f"\n{title} (per 1000 words):\n"
+        for word_id in top_ids:
+            analysis += f"{words[word_id]}: {rate_a[word_id]:.2f} vs {rate_b[word_id]:.2f}\n"
+
+    write_txt_file(base_data_path.joinpath('txt', dataset_a), f"comparison_{dataset_b}.txt", analysis)
+    return analysis
+
+##############################
+# TXT inverted index
+##############################
+
+# Inverted index of every text document under data/txt (term -> documents and word positions)
+def get_txt_index_path():
+    return base_data_path.joinpath('txt', 'index.sqlite3')
+
+# Open the index database, creating its tables the first time
+def open_txt_index(index_path=None):
+    index_path = pathlib.Path(index_path or get_txt_index_path())
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(index_path)
+    connection.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS documents (
+            doc_id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            word_count INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            term TEXT NOT NULL,
+            doc_id INTEGER NOT NULL,
+            positions BLOB NOT NULL,
+            PRIMARY KEY (term, doc_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    return connection
+
+# Add one document to the index, replacing any older version of it
+# Positions are word numbers within the document, stored as packed unsigned ints
+def index_txt_document(connection, file_path, chunk_size=txt_chunk_size):
+    file_path = pathlib.Path(file_path)
+    stat = file_path.stat()
+    path = get_data_key(file_path)
+
+    positions = {}
+    word_count = 0
+    for words, letter_count in split_words_in_chunks(read_visible_txt_chunks(file_path, chunk_size)):
+        for word in words:
+            term_positions = positions.get(word)
+            if term_positions is None:
+                term_positions = positions[word] = array('I')
+            term_positions.append(word_count)
+            word_count += 1
+
+    with connection:
+        row = connection.execute("SELECT doc_id FROM documents WHERE path = ?", (path,)).fetchone()
+        if row:
+            connection.execute("DELETE FROM postings WHERE doc_id = ?", (row[0],))
+            connection.execute("DELETE FROM documents WHERE doc_id = ?", (row[0],))
+        doc_id = connection.execute(
+            "INSERT INTO documents (path, size, mtime_ns, word_count) VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, word_count),
+        ).lastrowid
+        connection.executemany(
+            "INSERT INTO postings (term, doc_id, positions) VALUES (?, ?, ?)",
+            ((term, doc_id, term_positions.tobytes()) for term, term_positions in positions.items()),
         )
 
-        # Append top 10 words by frequency
-        for word, freq in sorted_word_freq[:10]:
-            analysis += f"{word}: {freq}\n"
+# Bring the index up to date with the text documents under data/txt
+# Only new or changed documents are re-read; documents that were deleted are dropped
+def update_txt_index(index_path=None, chunk_size=txt_chunk_size):
+    file_paths = find_txt_files(base_data_path.joinpath('txt'))
+    indexed_count = 0
+
+    with closing(open_txt_index(index_path)) as connection:
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in connection.execute("SELECT path, size, mtime_ns FROM documents")
+        }
+
+        for file_path in file_paths:
+            stat = file_path.stat()
+            if known.get(get_data_key(file_path)) != (stat.st_size, stat.st_mtime_ns):
+                index_txt_document(connection, file_path, chunk_size)
+                indexed_count += 1
+
+        current_paths = {get_data_key(file_path) for file_path in file_paths}
+        with connection:
+            for path in set(known) - current_paths:
+                doc_id = connection.execute("SELECT doc_id FROM documents WHERE path = ?", (path,)).fetchone()[0]
+                connection.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    print(f"Indexed {indexed_count} new or changed documents out of {len(file_paths)}")
+    return indexed_count
+
+# Get the positions of a term in every document that contains it
+def get_term_postings(connection, term):
+    rows = connection.execute(
+        "SELECT documents.path, postings.positions FROM postings "
+        "JOIN documents ON documents.doc_id = postings.doc_id WHERE postings.term = ?",
+        (term,),
+    )
+    return {path: array('I', positions) for path, positions in rows}
+
+# Look up one word: returns {document path: [word positions]}
+def search_txt_term(term, index_path=None):
+    words, letter_count = tokenize_txt_text(term)
+    if len(words) != 1:
+        return {}
+    with closing(open_txt_index(index_path)) as connection:
+        postings = get_term_postings(connection, words[0])
+    return {path: positions.tolist() for path, positions in sorted(postings.items())}
+
+# Look up an exact phrase: returns {document path: [position of the first word of each match]}
+def search_txt_phrase(phrase, index_path=None):
+    words, letter_count = tokenize_txt_text(phrase)
+    if not words:
+        return {}
+
+    with closing(open_txt_index(index_path)) as connection:
+        postings = [get_term_postings(connection, word) for word in words]
+
+    # Only documents that contain every word can contain the phrase
+    paths = set(postings[0]).intersection(*postings[1:])
+    matches = {}
+    for path in sorted(paths):
+        starts = set(postings[0][path])
+        for offset, term_postings in enumerate(postings[1:], start=1):
+            starts &= {position - offset for position in term_postings[path]}
+            if not starts:
+                break
+        if starts:
+            matches[path] = sorted(starts)
+    return matches
+
+# Look up every word that starts with a prefix: returns {word: {document path: count}}
+def search_txt_prefix(prefix, index_path=None):
+    words, letter_count = tokenize_txt_text(prefix)
+    if len(words) != 1:
+        return {}
+    prefix = words[0]
+
+    matches = {}
+    with closing(open_txt_index(index_path)) as connection:
+        # Words only contain a-z, and '{' sorts right after 'z', so this is a range scan on the index
+        rows = connection.execute(
+            "SELECT postings.term, documents.path, length(postings.positions) FROM postings "
+            "JOIN documents ON documents.doc_id = postings.doc_id "
+            "WHERE postings.term >= ? AND postings.term < ? ORDER BY postings.term, documents.path",
+            (prefix, prefix + '{'),
+        )
+        for term, path, byte_count in rows:
+            matches.setdefault(term, {})[path] = byte_count // array('I').itemsize
+    return matches
 
-        # Save the analysis to a file
-        write_txt_file(folder_path, f"analysis_{filename}", analysis)
+##############################
+# TXT n-grams
+##############################
+
+# Default accuracy of the approximate n-gram counts (see create_count_min_sketch)
+ngram_epsilon = 0.0001
+ngram_delta = 0.01
+
+# Names used in the n-gram report
+ngram_names = {1: 'Words', 2: 'Bigrams', 3: 'Trigrams'}
+
+# Turn batches of words into batches of n-grams ("word word ..."), including n-grams that span two batches
+def iter_ngram_batches(word_batches, n):
+    previous = []
+    for words in word_batches:
+        words = previous + words
+        yield list(map(' '.join, zip(*(words[index:] for index in range(n)))))
+        previous = words[max(0, len(words) - n + 1):] if n > 1 else []
+
+# Create a Count-Min sketch: a fixed-size table of counters that estimates how often each item was seen
+# With width = ceil(e / epsilon) and depth = ceil(ln(1 / delta)), an estimate is never below the
+# true count and, with probability at least 1 - delta, is at most epsilon * (total items counted) above it.
+# Memory is width * depth * 8 bytes no matter how many distinct items are counted.
+def create_count_min_sketch(epsilon=ngram_epsilon, delta=ngram_delta):
+    width = math.ceil(math.e / epsilon)
+    depth = math.ceil(math.log(1 / delta))
+    return {
+        'epsilon': epsilon,
+        'delta': delta,
+        'table': np.zeros((depth, width), dtype=np.uint64),
+        'total': 0,
+    }
+
+# Get the counter column of each item in every row of the sketch
+# One 64-bit hash per item is split into two halves that are combined to make one hash per row
+def get_count_min_columns(sketch, items):
+    depth, width = sketch['table'].shape
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little') for item in items),
+        dtype=np.uint64,
+        count=len(items),
+    )
+    low = hashes & np.uint64(0xFFFFFFFF)
+    high = (hashes >> np.uint64(32)) | np.uint64(1)
+    rows = np.arange(depth, dtype=np.uint64)[:, None]
+    return ((low + rows * high) % np.uint64(width)).astype(np.intp)
+
+# Add counts for a batch of distinct items to the sketch
+def update_count_min_sketch(sketch, items, counts):
+    columns = get_count_min_columns(sketch, items)
+    counts = np.asarray(counts, dtype=np.uint64)
+    for row, row_columns in enumerate(columns):
+        np.add.at(sketch['table'][row], row_columns, counts)
+    sketch['total'] += int(counts.sum())
+
+# Estimate the count of each item (the smallest of its counters)
+def query_count_min_sketch(sketch, items):
+    if not items:
+        return np.zeros(0, dtype=np.uint64)
+    columns = get_count_min_columns(sketch, items)
+    table = sketch['table']
+    return np.min(table[np.arange(table.shape[0])[:, None], columns], axis=0)
+
+# Merge sketches built with the same epsilon and delta (for example by different worker processes)
+def merge_count_min_sketches(sketches):
+    merged = create_count_min_sketch(sketches[0]['epsilon'], sketches[0]['delta'])
+    for sketch in sketches:
+        merged['table'] += sketch['table']
+        merged['total'] += sketch['total']
+    return merged
+
+# Count n-grams exactly: returns (total n-grams, Counter of every n-gram)
+def count_ngrams_exact(ngram_batches):
+    ngram_freq = Counter()
+    total = 0
+    for ngrams in ngram_batches:
+        ngram_freq.update(ngrams)
+        total += len(ngrams)
+    return total, ngram_freq
+
+# Count n-grams approximately in bounded memory: returns (total n-grams, sketch, heavy-hitter candidates)
+# The candidates are the items with the largest estimates so far; at most 2 * top_k are kept
+# between batches, so memory depends on the sketch size and the batch size, not on the corpus
+def count_ngrams_approximate(ngram_batches, top_k=txt_top_k, epsilon=ngram_epsilon, delta=ngram_delta):
+    sketch = create_count_min_sketch(epsilon, delta)
+    candidates = {}
+    for ngrams in ngram_batches:
+        batch_freq = Counter(ngrams)
+        items = list(batch_freq)
+        update_count_min_sketch(sketch, items, list(batch_freq.values()))
+
+        estimates = query_count_min_sketch(sketch, items)
+        candidates.update(zip(items, estimates.tolist()))
+        if len(candidates) > 2 * top_k:
+            candidates = dict(heapq.nlargest(2 * top_k, candidates.items(), key=lambda x: x[1]))
+    return sketch['total'], sketch, candidates
+
+# Get the top n-grams from the approximate counts, re-estimating every candidate at the end
+def top_k_approximate_ngrams(sketch, candidates, k=txt_top_k):
+    items = sorted(candidates)
+    estimates = query_count_min_sketch(sketch, items).tolist()
+    return heapq.nsmallest(k, zip(items, estimates), key=lambda x: (-x[1], x[0]))
+
+# Count bigrams and trigrams (or any n) in a saved text file and write analysis_ngrams_<filename>
+# Set approximate=True to use a Count-Min sketch with bounded memory instead of exact Counters
+def process_txt_ngrams(dataset_name, filename, n_values=(2, 3), approximate=False, top_k=txt_top_k,
+                       epsilon=ngram_epsilon, delta=ngram_delta, chunk_size=txt_chunk_size):
+    folder_path = create_folder('txt', dataset_name)
+    analysis = ""
+
+    for n in n_values:
+        # Read the file again for each n so only one set of counts is in memory at a time
+        word_batches = (words for words, letter_count in split_words_in_chunks(read_visible_txt_chunks(folder_path / filename, chunk_size)))
+        ngram_batches = iter_ngram_batches(word_batches, n)
+        name = ngram_names.get(n, f"{n}-grams")
+
+        if approximate:
+            total, sketch, candidates = count_ngrams_approximate(ngram_batches, top_k, epsilon, delta)
+            top_ngrams = top_k_approximate_ngrams(sketch, candidates, top_k)
+            analysis += (
+                f"Total {name} Count: {total}\n"
+                f"Counts are estimates: never too low, and with probability {1 - delta:.2%} "
+                f"at most {math.ceil(epsilon * total)} too high\n"
+                f"Sketch Memory: {sketch['table'].nbytes} bytes\n\n"
+            )
+        else:
+            total, ngram_freq = count_ngrams_exact(ngram_batches)
+            top_ngrams = top_k_words(ngram_freq, top_k)
+            analysis += (
+                f"Total {name} Count: {total}\n"
+                f"Unique {name} Count: {len(ngram_freq)}\n\n"
+            )
+
+        analysis += f"Top {top_k} Most Frequent {name}:\n"
+        for ngram, freq in top_ngrams:
+            analysis += f"{ngram}: {freq}\n"
+        analysis += "\n"
+
+    write_txt_file(folder_path, f"analysis_ngrams_{strip_compression_suffix(filename)}", analysis)
+    return analysis
 
 # Example usage for TXT
 #process_txt_file('data-txt', 'data-txt.txt', 'https://www.gutenberg.org/cache/epub/1513/pg1513.txt')
+#process_txt_file('data-txt', 'data-txt.txt', 'https://www.gutenberg.org/cache/epub/1513/pg1513.txt', streaming=True)
+#process_txt_corpus('corpus', find_txt_files(base_data_path.joinpath('txt')))
+#process_txt_vocabulary(['romeo_and_juliet_txt', 'princess_bride_txt'])
+#compare_txt_datasets('romeo_and_juliet_txt', 'princess_bride_txt')
+#update_txt_index()
+#search_txt_phrase('wherefore art thou')
+#process_txt_ngrams('romeo_and_juliet_txt', 'romeo_and_juliet_txt.txt', approximate=True)
 
 
 
 ##############################
-# Excel
+# Charts (rendered headless in worker processes, off the analysis path)
 ##############################
 
-def write_excel_file(folder_path, filename, data):
-    file_path = folder_path.joinpath(filename)
-    try:
-        folder_path = pathlib.Path(folder_path)
-        folder_path.mkdir(parents=True, exist_ok=True)
-        with open(file_path, 'wb') as file:
-            file.write(data)
-            print(f"Excel data saved to {file_path}")
-    except IOError as e:
-        print(f"IOError occurred while writing file: {e}")
-    except OSError as e:
-        print(f"OSError occurred while creating directories: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred while writing file: {e}")
-    finally:
-        print("Write operation attempted.")
-    return file_path  # Return the file path for further analysis
+# Non-interactive matplotlib backend: charts are only saved to files, never shown
+chart_backend = 'Agg'
+
+# Worker processes that render queued charts (0 = render right away in the calling process)
+# Charts made inside a worker process (like the analysis workers of the concurrent pipeline) are always
+# rendered right away on that worker's figure, since the worker is already off the main path.
+chart_workers = 2
+
+# Bins of a histogram made from a whole column (as in df[column].hist())
+chart_histogram_bins = 10
+
+# The figure every chart of this process is drawn on (created the first time a chart is rendered)
+chart_figure = None
+
+# The chart pool of this process, and the (file path, future) of every chart it has not finished yet
+# Both belong to the process that created them, so forked worker processes start their own.
+chart_pool = None
+chart_pool_pid = None
+pending_charts = []
+chart_lock = threading.Lock()
+
+# Get the figure this process draws charts on, importing matplotlib the first time
+# (so runs without charts never pay for importing matplotlib and building its font cache)
+def get_chart_figure():
+    global chart_figure
+    if chart_figure is None:
+        import matplotlib
+        matplotlib.use(chart_backend)
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        chart_figure = Figure()
+        FigureCanvasAgg(chart_figure)
+    return chart_figure
+
+# Draw a histogram from counts that were already binned, looking like df[column].hist(), and save it
+# The figure is cleared and reused instead of creating a new one through pyplot.
+def render_histogram_chart(file_path, counts, bin_edges, title=None, xlabel=None, ylabel=None):
+    figure = get_chart_figure()
+    figure.clear()
+    ax = figure.add_subplot()
+    ax.hist(bin_edges[:-1], bins=bin_edges, weights=counts)
+    ax.grid(True)
+    if title:
+        ax.set_title(title)
+    if xlabel:
+        ax.set_xlabel(xlabel)
+    if ylabel:
+        ax.set_ylabel(ylabel)
+    figure.savefig(file_path)
+    return file_path
+
+# Get the chart pool of this process, starting it the first time (its workers import matplotlib, not this process)
+def get_chart_pool():
+    global chart_pool, chart_pool_pid, pending_charts
+    with chart_lock:
+        if chart_pool_pid != os.getpid():
+            chart_pool = create_process_pool(chart_workers, initializer=get_chart_figure)
+            chart_pool_pid = os.getpid()
+            pending_charts = []
+        return chart_pool
+
+# Queue a histogram of already binned counts to be saved to file_path by the chart pool
+def queue_histogram_chart(file_path, counts, bin_edges, title=None, xlabel=None, ylabel=None):
+    arguments = (pathlib.Path(file_path), np.asarray(counts), np.asarray(bin_edges), title, xlabel, ylabel)
+    if not chart_workers or multiprocessing.parent_process() is not None:
+        render_histogram_chart(*arguments)
+        return
+    future = get_chart_pool().submit(render_histogram_chart, *arguments)
+    with chart_lock:
+        pending_charts.append((arguments[0], future))
+
+# Wait until every chart queued by this process is saved
+# Returns {file path: error message} for the charts that failed (errors are also printed)
+def wait_for_charts():
+    global pending_charts
+    with chart_lock:
+        charts = pending_charts if chart_pool_pid == os.getpid() else []
+        pending_charts = []
+
+    errors = {}
+    for file_path, future in charts:
+        try:
+            future.result()
+        except Exception as e:
+            errors[file_path] = str(e)
+            print(f"An error occurred while rendering chart {file_path}: {e}")
+    return errors
+
+##############################
+# Histograms (bin counts of every numeric column, saved next to histogram.png)
+##############################
+
+# The bins of every numeric column are saved as data, so charts can be drawn again without the source file
+histograms_file_name = 'histograms.json'
+
+# Values binned at a time by update_histograms (a block holds this many values over all its columns)
+histogram_block_values = 65536
+
+# Get equal-width bin edges between the lowest and highest value of each column, like np.histogram_bin_edges
+# (a column holding a single value gets the range value - 0.5 to value + 0.5, and an empty column 0 to 1).
+# A range too narrow to split into bins (where np.histogram gives up) is widened like a single value.
+def get_histogram_bin_edges(mins, maxs, bins=chart_histogram_bins):
+    first = np.asarray(mins, dtype=np.float64).reshape(-1)
+    last = np.asarray(maxs, dtype=np.float64).reshape(-1)
+    first, last = np.where(np.isnan(first), 0.0, first), np.where(np.isnan(last), 1.0, last)
+    narrow = (np.diff(np.linspace(first, last, bins + 1, axis=1), axis=1) <= 0).any(axis=1)
+    first, last = np.where(narrow, first - 0.5, first), np.where(narrow, last + 0.5, last)
+    return np.linspace(first, last, bins + 1, axis=1)
+
+# Create empty histograms for columns whose values lie between mins and maxs
+# counts[i] holds the bins of columns[i], between bin_edges[i]; exact is False once counts are estimated
+def create_histograms(columns, mins, maxs, bins=chart_histogram_bins):
+    return {
+        'columns': list(columns),
+        'bin_edges': get_histogram_bin_edges(mins, maxs, bins),
+        'counts': np.zeros((len(columns), bins), dtype=np.int64),
+        'exact': True,
+    }
+
+# Count the values of a chunk into the histograms of its columns, every column in one vectorized pass
+# Values are binned exactly like np.histogram does; values outside the bin edges (and missing ones) are left out.
+def update_histograms(histograms, df, block_values=None):
+    if not histograms['columns'] or len(df) == 0:
+        return histograms
+    return count_histogram_values(histograms, df[histograms['columns']].to_numpy(dtype=np.float64, na_value=np.nan), block_values)
+
+# Count a 2D array of values (one column per histogram) into the histograms
+# The values are read column by column in blocks, so the temporary arrays stay small and in cache.
+def count_histogram_values(histograms, all_values, block_values=None):
+    columns = histograms['columns']
+    bin_edges = histograms['bin_edges']
+    bins = bin_edges.shape[1] - 1
+    first, last = bin_edges[:, :1], bin_edges[:, -1:]
+    scale = bins / (last - first)
+
+    # Bin i of column j is counted at j * bins + i.
+    # Values that are left out are counted in one extra slot at the end, which is dropped.
+    count_offsets = (np.arange(len(columns)) * bins)[:, None]
+    left_out = len(columns) * bins
+    counts = np.zeros(left_out + 1, dtype=np.int64)
+
+    # to_numpy gives one column after another in memory, so the transposed array is read row by row
+    columns_values = all_values.T
+    block_rows = max(1, (block_values or histogram_block_values) // len(columns))
+    positions_block = np.empty((len(columns), block_rows))
+    indexes_block = np.empty((len(columns), block_rows), dtype=np.intp)
+
+    for start in range(0, columns_values.shape[1], block_rows):
+        values = columns_values[:, start:start + block_rows]
+        positions = positions_block[:, :values.shape[1]]
+        indexes = indexes_block[:, :values.shape[1]]
+
+        # Most blocks lie within the bin edges (min and max are NaN if a value is missing, which fails the check)
+        all_kept = bool((values.min(axis=1) >= first[:, 0]).all() and (values.max(axis=1) <= last[:, 0]).all())
+        if not all_kept:
+            with np.errstate(invalid='ignore'):
+                keep = (values >= first) & (values <= last)
+
+        np.subtract(values, first, out=positions)
+        positions *= scale
+        with np.errstate(invalid='ignore'):
+            indexes[...] = positions
+        np.minimum(indexes, bins - 1, out=indexes)
+
+        # Correct values within a rounding error of a bin edge (the last bin includes its right edge);
+        # only these few values are compared with the edges themselves
+        positions -= indexes
+        near = (positions < 1e-6) | (positions > 1 - 1e-6)
+        if not all_kept:
+            near &= keep
+        if near.any():
+            near_columns, near_rows = np.nonzero(near)
+            near_values, near_indexes = values[near_columns, near_rows], indexes[near_columns, near_rows]
+            near_indexes -= near_values < bin_edges[near_columns, near_indexes]
+            near_indexes += (near_values >= bin_edges[near_columns, near_indexes + 1]) & (near_indexes != bins - 1)
+            indexes[near_columns, near_rows] = near_indexes
+
+        indexes += count_offsets
+        if not all_kept:
+            indexes[~keep] = left_out
+        counts += np.bincount(indexes.ravel(), minlength=left_out + 1)
+
+    histograms['counts'] += counts[:left_out].reshape(len(columns), bins)
+    return histograms
+
+# Merge the histograms of two parts of a table (binned with the same edges, as with create_histograms)
+def merge_histograms(histograms_a, histograms_b):
+    if histograms_a['columns'] != histograms_b['columns'] or not np.array_equal(histograms_a['bin_edges'], histograms_b['bin_edges']):
+        raise ValueError("Histograms can only be merged if they have the same columns and bin edges")
+    merged = dict(histograms_a)
+    merged['counts'] = histograms_a['counts'] + histograms_b['counts']
+    merged['exact'] = histograms_a['exact'] and histograms_b['exact']
+    return merged
+
+# Compute the histograms of every numeric column of a table held in memory
+# (fmin and fmax skip missing values; a column without values gets NaN and so the range 0 to 1)
+def compute_histograms(df, bins=chart_histogram_bins):
+    numeric_df = df.select_dtypes(include=['number'])
+    values = numeric_df.to_numpy(dtype=np.float64, na_value=np.nan)
+    mins = np.fmin.reduce(values, axis=0, initial=np.nan)
+    maxs = np.fmax.reduce(values, axis=0, initial=np.nan)
+    histograms = create_histograms(numeric_df.columns, mins, maxs, bins)
+    if len(values) == 0 or not histograms['columns']:
+        return histograms
+    return count_histogram_values(histograms, values)
+
+# Get the bin counts and edges of one column
+def get_column_histogram(histograms, column):
+    index = histograms['columns'].index(column)
+    return histograms['counts'][index], histograms['bin_edges'][index]
+
+# Get the column to plot: 'c1' if it has a histogram, otherwise the first column (None if there are none)
+def get_histogram_column(histograms):
+    if 'c1' in histograms['columns']:
+        return 'c1'
+    elif histograms['columns']:
+        return histograms['columns'][0]
+    print("No numeric columns available for plotting.")
+    return None
+
+# Save histograms to <folder>/histograms.json
+def save_histograms(histograms, folder_path):
+    data = {
+        'exact': histograms['exact'],
+        'histograms': [
+            {'column': column, 'bin_edges': bin_edges.tolist(), 'counts': counts.tolist()}
+            for column, bin_edges, counts in zip(histograms['columns'], histograms['bin_edges'], histograms['counts'])
+        ],
+    }
+    save_json_atomically(pathlib.Path(folder_path).joinpath(histograms_file_name), data)
+
+# Load the histograms saved in a folder by save_histograms
+def load_histograms(folder_path):
+    with pathlib.Path(folder_path).joinpath(histograms_file_name).open('r', encoding='utf-8') as file:
+        data = json.load(file)
+    entries = data['histograms']
+    bins = len(entries[0]['counts']) if entries else chart_histogram_bins
+    return {
+        'columns': [entry['column'] for entry in entries],
+        'bin_edges': np.array([entry['bin_edges'] for entry in entries], dtype=np.float64).reshape(len(entries), bins + 1),
+        'counts': np.array([entry['counts'] for entry in entries], dtype=np.int64).reshape(len(entries), bins),
+        'exact': data['exact'],
+    }
+
+# Save the histograms of a table next to its chart and queue the chart of one column as histogram.png
+def save_and_queue_histogram(histograms, folder_path, column, title=None, xlabel=None, ylabel=None):
+    save_histograms(histograms, folder_path)
+    counts, bin_edges = get_column_histogram(histograms, column)
+    if counts.sum() == 0:
+        print(f"Histogram of {column} skipped: the column has no values.")
+        return
+    queue_histogram_chart(pathlib.Path(folder_path).joinpath('histogram.png'), counts, bin_edges, title, xlabel, ylabel)
+
+# Draw a chart again from the histograms saved in a folder, without reading the source data
+# Saves histogram_<column>.png (or file_name) in the same folder
+def redraw_histogram(folder_path, column=None, file_name=None, title=None, xlabel=None, ylabel=None):
+    histograms = load_histograms(folder_path)
+    column = column if column is not None else get_histogram_column(histograms)
+    if column is None:
+        return None
+    counts, bin_edges = get_column_histogram(histograms, column)
+    file_path = pathlib.Path(folder_path).joinpath(file_name or f"histogram_{column}.png")
+    queue_histogram_chart(file_path, counts, bin_edges, title, xlabel, ylabel)
+    return file_path
+
+##############################
+# Excel
+##############################
 
 def fetch_and_write_excel_file(folder_path, filename, url):
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise HTTPError for bad responses
-        file_path = write_excel_file(folder_path, filename, response.content)
+        # Stream the body straight to disk instead of holding it in memory
+        file_path = download_file(url, folder_path.joinpath(filename))
+        print(f"Excel data saved to {file_path}")
         return file_path
     except requests.RequestException as e:
         print(f"RequestException occurred while fetching data: {e}")
@@ -153,57 +1784,76 @@ def save_analysis_results_to_txt(folder_path, filename, analysis):
         file.write(analysis)
         print(f"Analysis results saved to {file_path}")
 
-def process_excel_file(dataset_name, filename, url):
+# Determine the file extension and use the appropriate engine
+def get_excel_engine(file_path):
+    file_extension = pathlib.Path(strip_compression_suffix(file_path)).suffix
+    if file_extension == '.xlsx':
+        return 'openpyxl'
+    elif file_extension == '.xls':
+        return 'xlrd'
+    raise ValueError(f"Unsupported file extension: {file_extension}")
+
+# Analyze a saved Excel file and save the report and histogram (errors are raised to the caller)
+# Pass chunk_size to stream the sheet in chunks of that many rows, reading only the columns in usecols
+# and the rows picked by skiprows and nrows (see analyze_excel_file_in_chunks)
+def analyze_excel_file(dataset_name, file_path, chunk_size=None, usecols=None, skiprows=0, nrows=None):
+    if chunk_size:
+        return analyze_excel_file_in_chunks(dataset_name, file_path, chunk_size, usecols, skiprows, nrows)
+
+    engine = get_excel_engine(file_path)
+
+    # Load the Excel file into a pandas DataFrame (decompressing it if needed),
+    # or from its columnar cache if the file has not changed since it was last parsed
+    def read_excel(file_path):
+        with open_dataset_file(file_path) as file:
+            return pd.read_excel(file, engine=engine)
+    df = read_table_cached(file_path, read_excel)
+
+    # Create a folder specifically for analysis results
+    write_excel_report(create_folder('excel', dataset_name), df)
+
+# Write excel_analysis.txt and histogram.png for a sheet into a folder
+def write_excel_report(analysis_folder_path, df):
+    # Inspect column names to identify valid columns
+    print("\nColumn Names:\n")
+    print(df.columns)
+
+    # Create a text analysis report
+    analysis = "\nData Preview:\n"
+    analysis += df.head().to_string()  # Convert data preview to string
+
+    analysis += "\n\nSummary Statistics:\n"
+    analysis += df.describe().to_string()  # Convert summary stats to string
+
+    # Check Missing Data
+    analysis += "\n\nMissing Data:\n"
+    analysis += df.isnull().sum().to_string()
+
+    # Save the text report
+    save_analysis_results_to_txt(analysis_folder_path, 'excel_analysis.txt', analysis)
+
+    # Example: Plotting a histogram (saved in the background by the chart pool)
+    # The bins of every numeric column are saved next to it in histograms.json
+    histograms = compute_histograms(df)
+    if 'c1' in histograms['columns']:  # Ensure 'c1' column exists
+        save_and_queue_histogram(histograms, analysis_folder_path, 'c1', 'Histogram of c1', 'c1', 'Frequency')
+    else:
+        save_histograms(histograms, analysis_folder_path)
+        print("Column 'c1' does not exist in the DataFrame.")
+
+# Set chunk_size to stream large workbooks in chunks; usecols, skiprows and nrows limit what is read
+# Set all_sheets=True to analyze every sheet of the workbook in parallel (see analyze_excel_workbook)
+def process_excel_file(dataset_name, filename, url, chunk_size=None, usecols=None, skiprows=0, nrows=None, all_sheets=False):
     folder_path = create_folder('excel', dataset_name)
     # Fetch and write the Excel file
     file_path = fetch_and_write_excel_file(folder_path, filename, url)
     
     if file_path:
         try:
-            # Determine the file extension and use the appropriate engine
-            file_extension = pathlib.Path(file_path).suffix
-            if file_extension == '.xlsx':
-                engine = 'openpyxl'
-            elif file_extension == '.xls':
-                engine = 'xlrd'
+            if all_sheets:
+                analyze_excel_workbook(dataset_name, file_path)
             else:
-                raise ValueError(f"Unsupported file extension: {file_extension}")
-            
-            # Load the Excel file into a pandas DataFrame
-            df = pd.read_excel(file_path, engine=engine)
-            
-            # Inspect column names to identify valid columns
-            print("\nColumn Names:\n")
-            print(df.columns)
-
-            # Create a folder specifically for analysis results
-            analysis_folder_path = create_folder('excel', dataset_name)
-
-            # Create a text analysis report
-            analysis = "\nData Preview:\n"
-            analysis += df.head().to_string()  # Convert data preview to string
-            
-            analysis += "\n\nSummary Statistics:\n"
-            analysis += df.describe().to_string()  # Convert summary stats to string
-
-            # Check Missing Data
-            analysis += "\n\nMissing Data:\n"
-            analysis += df.isnull().sum().to_string()
-
-            # Save the text report
-            save_analysis_results_to_txt(analysis_folder_path, 'excel_analysis.txt', analysis)
-
-             # Example: Plotting a histogram
-            if 'c1' in df.columns:  # Ensure 'c1' column exists
-                ax = df['c1'].hist()  # Replace 'c1' with the appropriate column
-                plt.title('Histogram of c1')  # Add a title
-                plt.xlabel('c1')  # Label x-axis
-                plt.ylabel('Frequency')  # Label y-axis
-                plt.savefig(analysis_folder_path / 'histogram.png')  # Save plot as an image
-                plt.close()  # Close the plot to avoid display issues
-            else:
-                print("Column 'c1' does not exist in the DataFrame.")
-        
+                analyze_excel_file(dataset_name, file_path, chunk_size, usecols, skiprows, nrows)
         except Exception as e:
             print(f"An error occurred while analyzing the Excel data: {e}")
         finally:
@@ -211,34 +1861,18 @@ def process_excel_file(dataset_name, filename, url):
 
 # Example usage
 #process_excel_file('data-excel', 'data-excel.xls', 'https://github.com/bharathirajatut/sample-excel-dataset/raw/master/cattle.xls')
+#process_excel_file('data-excel', 'data-excel.xls', 'https://github.com/bharathirajatut/sample-excel-dataset/raw/master/cattle.xls', chunk_size=excel_chunk_size, usecols=['c1', 'p1'])
+#process_excel_file('data-excel', 'data-excel.xls', 'https://github.com/bharathirajatut/sample-excel-dataset/raw/master/cattle.xls', all_sheets=True)
 
 ###########################
 # CSV
 ###########################
 
-def write_csv_file(folder_path, filename, data):
-    file_path = folder_path.joinpath(filename)
-    try:
-        folder_path = pathlib.Path(folder_path)
-        folder_path.mkdir(parents=True, exist_ok=True)
-        with open(file_path, 'wb') as file:
-            file.write(data)
-            print(f"CSV data saved to {file_path}")
-    except IOError as e:
-        print(f"IOError occurred while writing file: {e}")
-    except OSError as e:
-        print(f"OSError occurred while creating directories: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred while writing file: {e}")
-    finally:
-        print("Write operation attempted.")
-    return file_path  # Return the file path for further analysis
-
 def fetch_and_write_csv_file(folder_path, filename, url):
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise HTTPError for bad responses
-        file_path = write_csv_file(folder_path, filename, response.content)
+        # Stream the body straight to disk instead of holding it in memory
+        file_path = download_file(url, folder_path.joinpath(filename))
+        print(f"CSV data saved to {file_path}")
         return file_path
     except requests.RequestException as e:
         print(f"RequestException occurred while fetching data: {e}")
@@ -258,95 +1892,1362 @@ def save_analysis_results_to_txt(folder_path, filename, analysis):
         file.write(analysis)
         print(f"Analysis results saved to {file_path}")
 
-def process_csv_file(dataset_name, filename, url):
+# Analyze a saved CSV file and save the report and histogram (errors are raised to the caller)
+# Pass chunk_size to read the file in chunks of that many rows (see analyze_csv_file_in_chunks)
+def analyze_csv_file(dataset_name, file_path, chunk_size=None):
+    if chunk_size:
+        return analyze_csv_file_in_chunks(dataset_name, file_path, chunk_size)
+
+    # Load the CSV file into a pandas DataFrame (decompressing it if needed, by its content rather than its suffix),
+    # or from its columnar cache if the file has not changed since it was last parsed
+    def read_csv(file_path):
+        with open_dataset_file(file_path) as file:
+            return pd.read_csv(file)
+    if isinstance(file_path, (str, os.PathLike)):
+        df = read_table_cached(file_path, read_csv)
+    else:
+        df = pd.read_csv(file_path)
+
+    # Inspect column names to identify valid columns
+    print("\nColumn Names:\n")
+    print(df.columns)
+
+    # Create a text analysis report
+    analysis = "\nData Preview:\n"
+    analysis += df.head().to_string()  # Convert data preview to string
+
+    analysis += "\n\nSummary Statistics:\n"
+    analysis += df.describe().to_string()  # Convert summary stats to string
+
+    # Check for missing data
+    analysis += "\n\nMissing Data:\n"
+    analysis += df.isnull().sum().to_string()
+
+    # Create a folder specifically for analysis results
+    analysis_folder_path = create_folder('csv', dataset_name)
+
+    # Save the text report in the analysis folder
+    save_analysis_results_to_txt(analysis_folder_path, 'csv_analysis.txt', analysis)
+
+    # Plot a histogram of 'c1', or of the first numeric column if there is no 'c1' (saved in the background
+    # by the chart pool). The bins of every numeric column are saved next to it in histograms.json
+    histograms = compute_histograms(df)
+    column = get_histogram_column(histograms)
+    if column is not None:
+        save_and_queue_histogram(histograms, analysis_folder_path, column)
+
+    # Daily deltas, rolling averages and peaks for time series like covid_csv
+    if has_covid_columns(df.columns):
+        analyze_covid_data(dataset_name, df)
+
+# Set streaming=True to start parsing the CSV while it is still downloading
+# Set chunk_size to a number of rows to analyze the file in chunks, for files larger than memory
+# Set incremental=True for append-only files: only new rows are downloaded and analyzed
+def process_csv_file(dataset_name, filename, url, streaming=False, chunk_size=None, incremental=False):
     folder_path = create_folder('csv', dataset_name)
-    # Fetch and write the CSV file
-    file_path = fetch_and_write_csv_file(folder_path, filename, url)
-    
-    if file_path:
+
+    if incremental:
         try:
-            # Load the CSV file into a pandas DataFrame
-            df = pd.read_csv(file_path)
-            
-            # Inspect column names to identify valid columns
-            print("\nColumn Names:\n")
-            print(df.columns)
-            
-            # Create a text analysis report
-            analysis = "\nData Preview:\n"
-            analysis += df.head().to_string()  # Convert data preview to string
-            
-            analysis += "\n\nSummary Statistics:\n"
-            analysis += df.describe().to_string()  # Convert summary stats to string
-
-            # Check for missing data
-            analysis += "\n\nMissing Data:\n"
-            analysis += df.isnull().sum().to_string()
-
-            # Create a folder specifically for analysis results
-            analysis_folder_path = create_folder('csv', dataset_name)
-
-            # Save the text report in the analysis folder
-            save_analysis_results_to_txt(analysis_folder_path, 'csv_analysis.txt', analysis)
-
-           # Example: Plotting a histogram for the first numeric column found
-            numeric_columns = df.select_dtypes(include=['number']).columns
-            if 'c1' in df.columns:
-                df['c1'].hist()  # If 'c1' exists, use it
-                plt.savefig(analysis_folder_path.joinpath('histogram.png'))
-                plt.show()
-            elif len(numeric_columns) > 0:
-                # If 'c1' doesn't exist, but there are other numeric columns, use the first one
-                df[numeric_columns[0]].hist()
-                plt.savefig(analysis_folder_path.joinpath('histogram.png'))
-                plt.show()
-            else:
-                print("No numeric columns available for plotting.")
-        
+            file_path = folder_path.joinpath(filename)
+            fetch_appended_bytes(url, file_path)
+            analyze_csv_file_incrementally(dataset_name, file_path, chunk_size or csv_chunk_size)
         except Exception as e:
-            print(f"An error occurred while analyzing the CSV data: {e}")
+            print(f"An error occurred while analyzing the CSV data incrementally: {e}")
         finally:
             print("Analysis operation attempted.")
+        return
+
+    if streaming:
+        try:
+            # The download is saved to disk as pandas reads it
+            analyze_csv_file(dataset_name, open_download_stream(url, folder_path.joinpath(filename)), chunk_size)
+        except Exception as e:
+            print(f"An error occurred while streaming the CSV data: {e}")
+        finally:
+            print("Analysis operation attempted.")
+        return
+
+    # Chunked and compressed files are streamed to disk and read from there, so memory use stays bounded
+    # by the chunk size (the chunked analysis also needs the file for its second pass over the rows)
+    if chunk_size or get_compression_suffix(url) or get_compression_suffix(filename):
+        file_path = fetch_and_write_csv_file(folder_path, filename, url)
+
+        if file_path:
+            try:
+                analyze_csv_file(dataset_name, file_path, chunk_size)
+            except Exception as e:
+                print(f"An error occurred while analyzing the CSV data: {e}")
+            finally:
+                print("Analysis operation attempted.")
+        return
+
+    # Fetch the CSV file into memory and parse it from there while the raw bytes are saved
+    file_path = folder_path.joinpath(filename)
+    try:
+        body, writer = fetch_into_buffer(url, file_path)
+    except requests.RequestException as e:
+        print(f"RequestException occurred while fetching data: {e}")
+        return
+    finally:
+        print("Fetch operation attempted.")
+
+    try:
+        if body is None or detect_compression(body[:compression_sniff_size]):
+            # Not modified: read the saved file (from its columnar cache if it has one).
+            # A body that turns out to be compressed is also read back from disk, instead of decompressing a copy.
+            if not wait_for_saved_body(writer):
+                raise OSError(f"{file_path} could not be saved")
+            analyze_csv_file(dataset_name, file_path)
+        else:
+            analyze_csv_file(dataset_name, io.BytesIO(body))
+    except Exception as e:
+        print(f"An error occurred while analyzing the CSV data: {e}")
+    finally:
+        wait_for_saved_body(writer)
+        print("Analysis operation attempted.")
 
 # Example usage
 #process_csv_file('data-csv', 'data-csv.csv','https://raw.githubusercontent.com/MainakRepositor/Datasets/master/World%20Happiness%20Data/2020.csv')
+#process_csv_file('covid_csv', 'covid_csv.csv', 'https://raw.githubusercontent.com/datasets/covid-19/main/data/countries-aggregated.csv', chunk_size=csv_chunk_size)
+#process_csv_file('covid_csv', 'covid_csv.csv', 'https://raw.githubusercontent.com/datasets/covid-19/main/data/countries-aggregated.csv', incremental=True)
 
-################
-# JSON
-###############
+##############################
+# Table sketches (approximate quantiles and distinct counts in bounded memory)
+##############################
 
-def write_json_file(folder_path, filename, data):
-    file_path = folder_path.joinpath(filename)
+# Accuracy of the quantile sketch: quantiles are off by at most about 3.3 / k of the rows
+# (k=1000 gives about 0.3%), and the sketch keeps at most about 3 * k values however long the column is
+quantile_sketch_k = 1000
+
+# Accuracy of the distinct-count sketch: 2 ** precision one-byte registers,
+# with a typical error of 1.04 / sqrt(2 ** precision) (precision 14 gives about 0.8% in 16 KB)
+distinct_sketch_precision = 14
+
+# Create a KLL quantile sketch: values are kept in levels, and a value at level h stands for 2 ** h values
+# When a level fills up, it is sorted and every other value moves up a level, so memory stays bounded.
+# k defaults to quantile_sketch_k as it is when the sketch is created
+def create_quantile_sketch(k=None):
+    k = quantile_sketch_k if k is None else k
+    return {'k': k, 'levels': [np.empty(0)], 'count': 0, 'min': None, 'max': None}
+
+# Number of values a level may hold before it is compacted (lower levels hold fewer)
+def get_quantile_level_capacity(k, level, level_count):
+    return max(2, math.ceil(k * (2 / 3) ** (level_count - 1 - level)))
+
+# Compact every level that is over capacity, starting from the bottom
+def compress_quantile_sketch(sketch):
+    levels = sketch['levels']
+    level = 0
+    while level < len(levels):
+        if len(levels[level]) > get_quantile_level_capacity(sketch['k'], level, len(levels)):
+            if level + 1 == len(levels):
+                levels.append(np.empty(0))
+            values = np.sort(levels[level])
+            # An odd value out stays behind, so the total weight is kept exactly
+            keep = values[:len(values) % 2]
+            values = values[len(keep):]
+            # Keep the even or the odd positions at random (seeded by the data, so results are repeatable)
+            offset = np.random.default_rng([sketch['count'], level]).integers(2)
+            levels[level + 1] = np.concatenate([levels[level + 1], values[offset::2]])
+            levels[level] = keep
+        level += 1
+    return sketch
+
+# Add a batch of values to a quantile sketch (missing values are skipped)
+def update_quantile_sketch(sketch, values):
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return sketch
+    sketch['count'] += len(values)
+    sketch['min'] = float(values.min()) if sketch['min'] is None else min(sketch['min'], float(values.min()))
+    sketch['max'] = float(values.max()) if sketch['max'] is None else max(sketch['max'], float(values.max()))
+    sketch['levels'][0] = np.concatenate([sketch['levels'][0], values])
+    return compress_quantile_sketch(sketch)
+
+# Merge quantile sketches built with the same k (for example from different chunks or worker processes)
+def merge_quantile_sketches(sketches):
+    merged = create_quantile_sketch(sketches[0]['k'])
+    for sketch in sketches:
+        if sketch['count'] == 0:
+            continue
+        for level, values in enumerate(sketch['levels']):
+            if level == len(merged['levels']):
+                merged['levels'].append(np.empty(0))
+            merged['levels'][level] = np.concatenate([merged['levels'][level], values])
+        merged['count'] += sketch['count']
+        merged['min'] = sketch['min'] if merged['min'] is None else min(merged['min'], sketch['min'])
+        merged['max'] = sketch['max'] if merged['max'] is None else max(merged['max'], sketch['max'])
+    return compress_quantile_sketch(merged)
+
+# Get every value kept by a quantile sketch with its weight (how many values it stands for)
+def get_quantile_sketch_items(sketch):
+    values = np.concatenate(sketch['levels'])
+    weights = np.concatenate([np.full(len(level_values), 2 ** level, dtype=np.int64) for level, level_values in enumerate(sketch['levels'])])
+    return values, weights
+
+# Estimate quantiles (0 to 1) with linear interpolation like pandas, which makes them exact
+# while the sketch is still small enough to hold every value
+def query_quantile_sketch(sketch, quantiles):
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+    if sketch['count'] == 0:
+        return np.full(len(quantiles), np.nan)
+
+    values, weights = get_quantile_sketch_items(sketch)
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    cumulative_weights = np.cumsum(weights[order])
+
+    # Value at each (0-based) position of the sorted column, as the sketch sees it
+    def value_at(positions):
+        indexes = np.searchsorted(cumulative_weights, positions + 1, side='left')
+        return values[np.minimum(indexes, len(values) - 1)]
+
+    positions = quantiles * (sketch['count'] - 1)
+    lower = np.floor(positions)
+    lower_values = value_at(lower)
+    upper_values = value_at(np.ceil(positions))
+    estimates = lower_values + (upper_values - lower_values) * (positions - lower)
+    return np.clip(estimates, sketch['min'], sketch['max'])
+
+# Check whether a quantile sketch still holds every value it was given (its quantiles are exact)
+def is_quantile_sketch_exact(sketch):
+    return len(sketch['levels']) == 1
+
+# Create a HyperLogLog sketch: each register keeps the longest run of leading zero bits
+# seen among the hashes that fall into it, which reveals roughly how many distinct values were seen
+# precision defaults to distinct_sketch_precision as it is when the sketch is created
+def create_distinct_sketch(precision=None):
+    precision = distinct_sketch_precision if precision is None else precision
+    return {'precision': precision, 'registers': np.zeros(1 << precision, dtype=np.uint8)}
+
+# Hash the values of a column to 64-bit integers (missing values are skipped)
+# Numbers are hashed as floats, so 5 and 5.0 in different chunks are the same value
+def hash_column_values(series):
+    series = series.dropna()
+    if is_numeric_column_type(series.dtype):
+        series = series.astype(np.float64)
+    return pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64)
+
+# Add a batch of hashed values to a distinct-count sketch
+def update_distinct_sketch(sketch, hashes):
+    precision = sketch['precision']
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    if len(hashes) == 0:
+        return sketch
+
+    # The first bits choose the register, the rest give the rank (position of the first 1 bit)
+    registers = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    bit_length = np.zeros(len(rest), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        larger = rest >= np.uint64(1 << shift)
+        bit_length[larger] += shift
+        rest = np.where(larger, rest >> np.uint64(shift), rest)
+    bit_length += rest > 0
+    ranks = (64 - precision - bit_length + 1).astype(np.uint8)
+
+    np.maximum.at(sketch['registers'], registers, ranks)
+    return sketch
+
+# Merge distinct-count sketches built with the same precision
+def merge_distinct_sketches(sketches):
+    merged = create_distinct_sketch(sketches[0]['precision'])
+    for sketch in sketches:
+        np.maximum(merged['registers'], sketch['registers'], out=merged['registers'])
+    return merged
+
+# Estimate the number of distinct values seen by a sketch
+def estimate_distinct_count(sketch):
+    registers = sketch['registers']
+    size = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / size)
+    estimate = alpha * size * size / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+
+    # Few distinct values: count the empty registers instead (linear counting), which is more accurate
+    empty_registers = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * size and empty_registers:
+        estimate = size * math.log(size / empty_registers)
+    return round(estimate)
+
+##############################
+# CSV in chunks (online statistics for files larger than memory)
+##############################
+
+# Rows read at a time when a CSV file is analyzed in chunks
+csv_chunk_size = 100000
+
+# Number of rows shown in the Data Preview section, and bins in the histogram (as in df.head() and df.hist())
+csv_preview_rows = 5
+csv_histogram_bins = 10
+
+# Running statistics of one numeric column: number of values, mean, sum of squared
+# differences from the mean (m2, for the variance), min and max
+def create_running_stats():
+    return {'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None}
+
+# Combine the running statistics of two parts of a column (Welford's method for merging partial results)
+# The result is the same as if every value had been seen by one set of statistics.
+def merge_running_stats(stats_a, stats_b):
+    if stats_b['count'] == 0:
+        return dict(stats_a)
+    if stats_a['count'] == 0:
+        return dict(stats_b)
+    count = stats_a['count'] + stats_b['count']
+    delta = stats_b['mean'] - stats_a['mean']
+    return {
+        'count': count,
+        'mean': stats_a['mean'] + delta * stats_b['count'] / count,
+        'm2': stats_a['m2'] + stats_b['m2'] + delta * delta * stats_a['count'] * stats_b['count'] / count,
+        'min': min(stats_a['min'], stats_b['min']),
+        'max': max(stats_a['max'], stats_b['max']),
+    }
+
+# Get the running statistics of every numeric column of a chunk at once
+def compute_running_stats(numeric_df):
+    counts = numeric_df.count()
+    means = numeric_df.mean()
+    m2s = ((numeric_df - means) ** 2).sum()
+    mins = numeric_df.min()
+    maxs = numeric_df.max()
+
+    column_stats = {}
+    for column in numeric_df.columns:
+        stats = create_running_stats()
+        if counts[column]:
+            stats.update(
+                count=int(counts[column]), mean=float(means[column]), m2=float(m2s[column]),
+                min=float(mins[column]), max=float(maxs[column]),
+            )
+        column_stats[column] = stats
+    return column_stats
+
+# Check whether a column type counts as numeric for the statistics (booleans do not, as in df.describe())
+def is_numeric_column_type(dtype):
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+# Get the type a column would have if both chunks had been read at once
+# (for example int64 and float64 give float64, and numbers mixed with text give object)
+def merge_column_types(dtype_a, dtype_b):
+    if dtype_a == dtype_b:
+        return dtype_a
+    if is_numeric_column_type(dtype_a) and is_numeric_column_type(dtype_b):
+        return np.result_type(dtype_a, dtype_b)
+    return np.dtype(object)
+
+# Create an empty summary of a table: the first rows, the type and null count of each column,
+# running statistics and a quantile sketch per numeric column, and a distinct-count sketch per column
+def create_table_summary():
+    return {
+        'rows': 0, 'preview': None, 'columns': [], 'dtypes': {}, 'nulls': {},
+        'stats': {}, 'quantiles': {}, 'distinct': {},
+    }
+
+# Summarize one chunk of rows (quantile_k and distinct_precision size its sketches, None for the defaults)
+def summarize_table_chunk(chunk, quantile_k=None, distinct_precision=None):
+    summary = create_table_summary()
+    summary['rows'] = len(chunk)
+    summary['preview'] = chunk.head(csv_preview_rows)
+    summary['columns'] = list(chunk.columns)
+    summary['dtypes'] = dict(chunk.dtypes.items())
+    summary['nulls'] = {column: int(null_count) for column, null_count in chunk.isnull().sum().items()}
+
+    numeric_df = chunk.select_dtypes(include=['number'])
+    summary['stats'] = compute_running_stats(numeric_df)
+    for column in numeric_df.columns:
+        summary['quantiles'][column] = update_quantile_sketch(create_quantile_sketch(quantile_k), numeric_df[column].to_numpy(dtype=np.float64, na_value=np.nan))
+    for column in chunk.columns:
+        summary['distinct'][column] = update_distinct_sketch(create_distinct_sketch(distinct_precision), hash_column_values(chunk[column]))
+    return summary
+
+# Merge the summaries of two parts of a table (the first part comes first in the file)
+# Summaries of chunks read by different worker processes can be merged the same way.
+def merge_table_summaries(summary_a, summary_b):
+    if summary_a['preview'] is None:
+        return summary_b
+    if summary_b['preview'] is None:
+        return summary_a
+
+    merged = create_table_summary()
+    merged['rows'] = summary_a['rows'] + summary_b['rows']
+    merged['preview'] = pd.concat([summary_a['preview'], summary_b['preview']]).head(csv_preview_rows)
+    merged['columns'] = summary_a['columns'] + [column for column in summary_b['columns'] if column not in summary_a['columns']]
+
+    for column in merged['columns']:
+        merged['nulls'][column] = summary_a['nulls'].get(column, 0) + summary_b['nulls'].get(column, 0)
+
+        # A column with text in any chunk is not numeric, just like when the whole file is read at once
+        dtypes = [summary['dtypes'][column] for summary in (summary_a, summary_b) if column in summary['dtypes']]
+        merged['dtypes'][column] = dtypes[0] if len(dtypes) == 1 else merge_column_types(*dtypes)
+
+        for key, merge in (('stats', None), ('quantiles', merge_quantile_sketches), ('distinct', merge_distinct_sketches)):
+            parts = [summary[key][column] for summary in (summary_a, summary_b) if column in summary[key]]
+            if len(parts) == 1:
+                merged[key][column] = parts[0]
+            elif parts:
+                merged[key][column] = merge(parts) if merge else merge_running_stats(*parts)
+    return merged
+
+# Add one chunk of rows to a table summary
+def update_table_summary(summary, chunk, quantile_k=None, distinct_precision=None):
+    return merge_table_summaries(summary, summarize_table_chunk(chunk, quantile_k, distinct_precision))
+
+# Check whether every sketch of a summary has the given sizes (sketches of different sizes cannot be merged)
+def has_sketch_sizes(summary, quantile_k, distinct_precision):
+    return (
+        all(sketch['k'] == quantile_k for sketch in summary['quantiles'].values())
+        and all(sketch['precision'] == distinct_precision for sketch in summary['distinct'].values())
+    )
+
+# Get the numeric columns of a summarized table, in file order
+def get_summary_numeric_columns(summary):
+    return [column for column in summary['columns'] if is_numeric_column_type(summary['dtypes'][column])]
+
+# Get the first rows of a summarized table, with the column types of the whole table
+def get_summary_preview(summary):
+    return summary['preview'].astype(summary['dtypes'])
+
+# Build the Summary Statistics table of a summarized table, laid out like df.describe()
+# The 25%, 50% and 75% rows come from the quantile sketches
+def describe_table_summary(summary):
+    description = {}
+    for column in get_summary_numeric_columns(summary):
+        stats = summary['stats'][column]
+        count = stats['count']
+        lower_quartile, median, upper_quartile = query_quantile_sketch(summary['quantiles'][column], [0.25, 0.5, 0.75])
+        description[column] = {
+            'count': float(count),
+            'mean': stats['mean'] if count else np.nan,
+            'std': math.sqrt(stats['m2'] / (count - 1)) if count > 1 else np.nan,
+            'min': stats['min'] if count else np.nan,
+            '25%': lower_quartile,
+            '50%': median,
+            '75%': upper_quartile,
+            'max': stats['max'] if count else np.nan,
+        }
+    return pd.DataFrame(description, index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'], dtype='float64')
+
+# Build the Approximate Statistics section: how accurate the quartiles are, and distinct values per column
+def format_approximate_statistics(summary):
+    numeric_columns = get_summary_numeric_columns(summary)
+    estimated = [column for column in numeric_columns if not is_quantile_sketch_exact(summary['quantiles'][column])]
+    if estimated:
+        k = summary['quantiles'][estimated[0]]['k']
+        analysis = f"25%, 50% and 75% of {', '.join(map(str, estimated))} are estimates, off by at most about {3.3 / k:.1%} of the rows\n"
+    else:
+        analysis = "25%, 50% and 75% are exact\n"
+    distinct_counts = pd.Series(
+        {column: estimate_distinct_count(summary['distinct'][column]) for column in summary['columns']},
+        index=summary['columns'], dtype='int64',
+    )
+    analysis += "\nDistinct Values (estimated):\n"
+    analysis += distinct_counts.to_string()
+    return analysis
+
+# Create empty histograms for the numeric columns of a summarized table, between their min and max
+def create_summary_histograms(summary, bins=csv_histogram_bins):
+    columns = get_summary_numeric_columns(summary)
+    mins = [summary['stats'][column]['min'] if summary['stats'][column]['count'] else np.nan for column in columns]
+    maxs = [summary['stats'][column]['max'] if summary['stats'][column]['count'] else np.nan for column in columns]
+    return create_histograms(columns, mins, maxs, bins)
+
+# Count every numeric column of a CSV file into fixed bins in one second pass, reading it in chunks
+# The bin edges come from the min and max in the summary of the first pass.
+def compute_csv_histograms(file_path, summary, bins=csv_histogram_bins, chunk_size=csv_chunk_size):
+    histograms = create_summary_histograms(summary, bins)
+    if not histograms['columns']:
+        return histograms
+    with pd.read_csv(file_path, usecols=histograms['columns'], chunksize=chunk_size) as reader:
+        for chunk in reader:
+            histograms = update_histograms(histograms, chunk)
+    return histograms
+
+# Count the values seen by the quantile sketches of a summarized table into equal-width bins
+# between each column's min and max. The counts are exact while a sketch still holds every value,
+# and estimates after that.
+def compute_sketch_histograms(summary, bins=csv_histogram_bins):
+    histograms = create_summary_histograms(summary, bins)
+    for index, column in enumerate(histograms['columns']):
+        sketch = summary['quantiles'][column]
+        values, weights = get_quantile_sketch_items(sketch)
+        histograms['counts'][index] = np.histogram(values, bins=histograms['bin_edges'][index], weights=weights)[0]
+        histograms['exact'] = histograms['exact'] and is_quantile_sketch_exact(sketch)
+    return histograms
+
+# Write the report of a summarized table to data/<folder_type>/<dataset>/<report_name> and return the folder
+def write_table_summary_report(dataset_name, summary, folder_type='csv', report_name='csv_analysis.txt'):
+    # Inspect column names to identify valid columns
+    print("\nColumn Names:\n")
+    print(pd.Index(summary['columns']))
+
+    # Create a text analysis report
+    analysis = "\nData Preview:\n"
+    analysis += get_summary_preview(summary).to_string()
+
+    analysis += "\n\nSummary Statistics:\n"
+    analysis += describe_table_summary(summary).to_string()
+
+    # Check for missing data
+    analysis += "\n\nMissing Data:\n"
+    analysis += pd.Series(summary['nulls'], index=summary['columns'], dtype='int64').to_string()
+
+    # Accuracy of the quartiles and estimated distinct values, from the sketches
+    analysis += "\n\nApproximate Statistics:\n"
+    analysis += format_approximate_statistics(summary)
+
+    # Create a folder specifically for analysis results
+    analysis_folder_path = create_folder(folder_type, dataset_name)
+
+    # Save the text report in the analysis folder
+    save_analysis_results_to_txt(analysis_folder_path, report_name, analysis)
+    return analysis_folder_path
+
+# Analyze a CSV file in chunks of chunk_size rows, so memory use does not grow with the file
+# Writes the same report sections as analyze_csv_file (with estimated quartiles), plus Approximate Statistics.
+# The histograms need a second pass over the file, so when the CSV comes from a stream
+# that can only be read once they are estimated from the quantile sketches instead.
+# quantile_k and distinct_precision size the sketches (None for quantile_sketch_k and distinct_sketch_precision)
+def analyze_csv_file_in_chunks(dataset_name, file_path, chunk_size=csv_chunk_size, quantile_k=None, distinct_precision=None):
+    summary = create_table_summary()
+    covid_aggregates = None
+    with pd.read_csv(file_path, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            summary = update_table_summary(summary, chunk, quantile_k, distinct_precision)
+            # Time series like covid_csv are aggregated from the same chunks
+            if has_covid_columns(chunk.columns):
+                if covid_aggregates is None:
+                    covid_aggregates = create_covid_aggregates(create_folder('csv', dataset_name).joinpath('covid_daily.csv'))
+                update_covid_aggregates(covid_aggregates, chunk)
+
+    analysis_folder_path = write_table_summary_report(dataset_name, summary)
+    if covid_aggregates:
+        write_covid_report(dataset_name, finish_covid_aggregates(covid_aggregates))
+
+    if isinstance(file_path, (str, os.PathLike)):
+        histograms = compute_csv_histograms(file_path, summary, chunk_size=chunk_size)
+    else:
+        print("Histograms estimated from the quantile sketches: a streamed CSV can only be read once.")
+        histograms = compute_sketch_histograms(summary)
+    column = get_histogram_column(histograms)
+    if column is not None:
+        save_and_queue_histogram(histograms, analysis_folder_path, column)
+    return summary
+
+##############################
+# CSV incremental (append-only datasets that grow by new rows, like covid_csv)
+##############################
+
+# Bytes compared at the start of the file and just before the saved offset, to notice a file that was
+# rewritten rather than appended to (the whole file is then analyzed again)
+incremental_check_size = 4096
+
+# The saved statistics of data/csv/<dataset>/<file> are kept in <file>.summary.npz
+def get_table_summary_path(file_path):
+    file_path = pathlib.Path(file_path)
+    return file_path.with_name(file_path.name + '.summary.npz')
+
+# Save a table summary and extra values (like the byte offset reached) to one .npz file
+# Sketch arrays are stored as arrays; everything else goes in a JSON string
+def save_table_summary(summary, summary_path, **extra):
+    arrays = {}
+    metadata = {
+        'rows': summary['rows'],
+        'preview': summary['preview'].to_csv(index=False),
+        'columns': summary['columns'],
+        'dtypes': [str(summary['dtypes'][column]) for column in summary['columns']],
+        'nulls': [summary['nulls'][column] for column in summary['columns']],
+        'stats': [summary['stats'].get(column) for column in summary['columns']],
+        'quantiles': [],
+        'distinct': [],
+        'extra': extra,
+    }
+    for index, column in enumerate(summary['columns']):
+        sketch = summary['quantiles'].get(column)
+        if sketch:
+            metadata['quantiles'].append({key: sketch[key] for key in ('k', 'count', 'min', 'max')} | {'levels': len(sketch['levels'])})
+            for level, values in enumerate(sketch['levels']):
+                arrays[f"quantiles_{index}_{level}"] = values
+        else:
+            metadata['quantiles'].append(None)
+        sketch = summary['distinct'][column]
+        metadata['distinct'].append(sketch['precision'])
+        arrays[f"distinct_{index}"] = sketch['registers']
+
+    temp_path = summary_path.with_name(summary_path.name + '.tmp')
+    with temp_path.open('wb') as file:
+        np.savez(file, metadata=np.array(json.dumps(metadata)), **arrays)
+    os.replace(temp_path, summary_path)
+
+# Load a table summary saved with save_table_summary: returns (summary, extra), or (None, None)
+def load_table_summary(summary_path):
+    if not summary_path.exists():
+        return None, None
+    with np.load(summary_path) as arrays:
+        metadata = json.loads(str(arrays['metadata']))
+        summary = create_table_summary()
+        summary['rows'] = metadata['rows']
+        summary['preview'] = pd.read_csv(io.StringIO(metadata['preview']))
+        summary['columns'] = metadata['columns']
+        for index, column in enumerate(summary['columns']):
+            summary['dtypes'][column] = pd.api.types.pandas_dtype(metadata['dtypes'][index])
+            summary['nulls'][column] = metadata['nulls'][index]
+            if metadata['stats'][index]:
+                summary['stats'][column] = metadata['stats'][index]
+            quantiles = metadata['quantiles'][index]
+            if quantiles:
+                levels = [arrays[f"quantiles_{index}_{level}"] for level in range(quantiles.pop('levels'))]
+                summary['quantiles'][column] = quantiles | {'levels': levels}
+            summary['distinct'][column] = {'precision': metadata['distinct'][index], 'registers': arrays[f"distinct_{index}"]}
+    return summary, metadata['extra']
+
+# Read a range of bytes from a file
+def read_file_range(file_path, start, end):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        return file.read(end - start)
+
+# Read a range of bytes from a file in chunks
+def read_file_range_chunks(file_path, start, end, chunk_size=download_chunk_size):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        while start < end:
+            chunk = file.read(min(chunk_size, end - start))
+            if not chunk:
+                break
+            start += len(chunk)
+            yield chunk
+
+# Get the position just after the last line break of a file, so a line that is still being written is left out
+def find_last_line_end(file_path, chunk_size=download_chunk_size):
+    end = pathlib.Path(file_path).stat().st_size
+    while end > 0:
+        start = max(0, end - chunk_size)
+        position = read_file_range(file_path, start, end).rfind(b'\n')
+        if position >= 0:
+            return start + position + 1
+        end = start
+    return 0
+
+# Fingerprints of a file up to an offset: SHA-256 of its first bytes and of the bytes just before the offset
+def get_append_checks(file_path, offset):
+    return {
+        'offset': offset,
+        'head': hashlib.sha256(read_file_range(file_path, 0, min(offset, incremental_check_size))).hexdigest(),
+        'tail': hashlib.sha256(read_file_range(file_path, max(0, offset - incremental_check_size), offset)).hexdigest(),
+    }
+
+# Check whether a file still starts with the bytes it had up to a saved offset (it was only appended to)
+def is_appended_file(file_path, checks):
+    if pathlib.Path(file_path).stat().st_size < checks['offset']:
+        return False
+    return get_append_checks(file_path, checks['offset']) == checks
+
+# Fetch only the bytes added to a URL since file_path was saved, and append them to the file
+# The last incremental_check_size bytes are requested again and compared with the file, so a source that
+# was rewritten rather than appended to is noticed (it is then downloaded again in full).
+# Returns 'unchanged', 'appended' or 'downloaded'.
+def fetch_appended_bytes(url, file_path, chunk_size=download_chunk_size):
+    file_path = pathlib.Path(file_path)
+    if get_compression_suffix(url):
+        raise ValueError(f"Compressed files cannot be fetched incrementally: {url}")
+    size = file_path.stat().st_size if file_path.exists() else 0
+
+    if size:
+        check_start = max(0, size - incremental_check_size)
+        headers = {'Range': f"bytes={check_start}-", 'Accept-Encoding': 'identity'}
+        with cached_get(url, file_path, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                print(f"Not modified, using saved {file_path}")
+                return 'unchanged'
+            if response.status_code == 416:
+                print(f"No new data for {file_path}")
+                return 'unchanged'
+            response.raise_for_status()  # Raise HTTPError for bad responses
+
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and content_range.startswith(f"bytes {check_start}-"):
+                chunks = response.iter_content(chunk_size=chunk_size)
+                overlap = b''
+                for chunk in chunks:
+                    overlap += chunk
+                    if len(overlap) >= size - check_start:
+                        break
+                if overlap[:size - check_start] == read_file_range(file_path, check_start, size):
+                    with file_path.open('ab') as file:
+                        file.write(overlap[size - check_start:])
+                        for chunk in chunks:
+                            file.write(chunk)
+                    save_http_cache_entry(url, file_path, response)
+                    # Record the grown file as the current version in the artifact store
+                    store_artifact(file_path, url)
+                    print(f"Appended {file_path.stat().st_size - size} new bytes to {file_path}")
+                    return 'appended'
+                print(f"{url} was rewritten, downloading it again")
+
+    download_file(url, file_path, chunk_size)
+    return 'downloaded'
+
+# Analyze an append-only CSV file, reading only the rows added since the last run
+# The statistics and sketches of the rows already seen are saved with the byte offset they reach
+# (<file>.summary.npz); new rows are summarized and merged into them. The report is written again in full,
+# and the histogram comes from the quantile sketch, so neither needs to read the older rows.
+# If quantile_k or distinct_precision differ from the saved sketches, the whole file is analyzed again.
+def analyze_csv_file_incrementally(dataset_name, file_path, chunk_size=csv_chunk_size, quantile_k=None, distinct_precision=None):
+    quantile_k = quantile_sketch_k if quantile_k is None else quantile_k
+    distinct_precision = distinct_sketch_precision if distinct_precision is None else distinct_precision
+    file_path = pathlib.Path(file_path)
+    summary_path = get_table_summary_path(file_path)
+    summary, checks = load_table_summary(summary_path)
+    end = find_last_line_end(file_path)
+
+    if (
+        summary is not None and checks['offset'] <= end and is_appended_file(file_path, checks)
+        and has_sketch_sizes(summary, quantile_k, distinct_precision)
+    ):
+        start = checks['offset']
+        # The header was read on the first run, so new rows are read with the saved column names
+        read_options = {'header': None, 'names': summary['columns']}
+        print(f"Reading {end - start} new bytes of {file_path}")
+    else:
+        summary = create_table_summary()
+        start = 0
+        read_options = {}
+
+    if end > start:
+        stream = io.BufferedReader(ChunkStream(read_file_range_chunks(file_path, start, end)), buffer_size=download_chunk_size)
+        with pd.read_csv(stream, chunksize=chunk_size, **read_options) as reader:
+            for chunk in reader:
+                summary = update_table_summary(summary, chunk, quantile_k, distinct_precision)
+        save_table_summary(summary, summary_path, **get_append_checks(file_path, end))
+
+    analysis_folder_path = write_table_summary_report(dataset_name, summary)
+
+    histograms = compute_sketch_histograms(summary)
+    column = get_histogram_column(histograms)
+    if column is not None:
+        save_and_queue_histogram(histograms, analysis_folder_path, column)
+    return summary
+
+##############################
+# CSV time series (daily deltas, rolling averages and peaks for covid_csv)
+##############################
+
+# Columns of the covid dataset: one row per country per date, with running totals
+covid_date_column = 'Date'
+covid_group_column = 'Country'
+covid_value_columns = ['Confirmed', 'Recovered', 'Deaths']
+
+# Window of the rolling averages, in days
+covid_rolling_days = 7
+
+# Number of rows shown in each table of the time series report
+covid_report_rows = 10
+
+# Check whether a table has the covid columns, so its time series can be aggregated
+def has_covid_columns(columns):
+    return all(column in columns for column in [covid_date_column, covid_group_column, *covid_value_columns])
+
+# Name of the daily new value and rolling average columns for a running total column
+def get_new_column(column):
+    return f"New {column}"
+
+def get_average_column(column):
+    return f"New {column} {covid_rolling_days}-Day Average"
+
+# Add the daily new values and their rolling averages to covid rows, for all countries at once
+# New values are the difference from the previous row of the same country (the first row counts in full),
+# and the rolling sum is the running total minus the total covid_rolling_days rows before.
+# carry holds the last covid_rolling_days rows of each country from earlier chunks, so chunks can be fed
+# one after another; returns (new rows with the added columns, carry for the next chunk).
+def add_covid_daily_columns(df, carry=None):
+    columns = [covid_date_column, covid_group_column, *covid_value_columns]
+    rows = df[columns].copy()
+    rows[covid_date_column] = pd.to_datetime(rows[covid_date_column])
+    carry_size = 0 if carry is None else len(carry)
+    if carry_size:
+        rows = pd.concat([carry, rows], ignore_index=True)
+    rows['is_new'] = np.arange(len(rows)) >= carry_size
+    rows = rows.sort_values([covid_group_column, covid_date_column], kind='stable', ignore_index=True)
+
+    # Rows before a country's first row count as zero (missing values in the data stay missing)
+    grouped = rows.groupby(covid_group_column, sort=False, observed=True)
+    position = grouped.cumcount().to_numpy()
+    previous = grouped[covid_value_columns].shift(1)
+    previous.loc[position < 1] = 0
+    window_start = grouped[covid_value_columns].shift(covid_rolling_days)
+    window_start.loc[position < covid_rolling_days] = 0
+    days_in_window = np.minimum(position + 1, covid_rolling_days)
+
+    for column in covid_value_columns:
+        new_values = rows[column] - previous[column]
+        if pd.api.types.is_integer_dtype(rows[column]):
+            new_values = new_values.astype(rows[column].dtype)
+        rows[get_new_column(column)] = new_values
+        rows[get_average_column(column)] = (rows[column] - window_start[column]) / days_in_window
+
+    carry = rows.groupby(covid_group_column, sort=False, observed=True).tail(covid_rolling_days)[columns]
+    rows = rows[rows['is_new']].drop(columns='is_new').reset_index(drop=True)
+    return rows, carry.reset_index(drop=True)
+
+# Sum the running totals and new values of all countries for each date
+def sum_covid_by_date(daily):
+    columns = [*covid_value_columns, *map(get_new_column, covid_value_columns)]
+    return daily.groupby(covid_date_column)[columns].sum()
+
+# Find the day with the most new values of each country: returns one row per country
+# with the peak of every value column and its date (the earliest date if the peak is repeated)
+def find_covid_peaks(daily):
+    peaks = {}
+    for column in map(get_new_column, covid_value_columns):
+        peak_index = daily.groupby(covid_group_column, observed=True)[column].idxmax()
+        peaks[f"Peak {column}"] = daily.loc[peak_index, column].to_numpy()
+        peaks[f"Peak {column} Date"] = daily.loc[peak_index, covid_date_column].to_numpy()
+    return pd.DataFrame(peaks, index=peak_index.index)
+
+# Merge the peaks found in two parts of the table (ties keep the peak from the first part)
+def merge_covid_peaks(peaks_a, peaks_b):
+    combined = pd.concat([peaks_a, peaks_b]).reset_index()
+    merged = {}
+    for column in map(get_new_column, covid_value_columns):
+        peak_index = combined.groupby(covid_group_column, observed=True)[f"Peak {column}"].idxmax()
+        merged[f"Peak {column}"] = combined.loc[peak_index, f"Peak {column}"].to_numpy()
+        merged[f"Peak {column} Date"] = combined.loc[peak_index, f"Peak {column} Date"].to_numpy()
+    return pd.DataFrame(merged, index=peak_index.index)
+
+# Start aggregating covid rows that arrive in chunks (a whole DataFrame is one chunk)
+# Each country's rows must come in date order across chunks, which is true of the append-only feed.
+# The daily rows are appended to daily_path as they are computed, if it is given, one run sorted by
+# date and country per chunk; the byte range of each run is kept so they can be merged at the end.
+def create_covid_aggregates(daily_path=None):
+    return {
+        'rows': 0, 'carry': None, 'by_date': None, 'peaks': None,
+        'daily_path': daily_path, 'daily_runs': [], 'daily_last_key': None, 'daily_sorted': True,
+    }
+
+# Add one chunk of covid rows to the aggregates
+def update_covid_aggregates(aggregates, chunk):
+    daily, aggregates['carry'] = add_covid_daily_columns(chunk, aggregates['carry'])
+    if daily.empty:
+        return aggregates
+
+    if aggregates['daily_path']:
+        daily = daily.sort_values([covid_date_column, covid_group_column], kind='stable', ignore_index=True)
+        first_key = tuple(daily.loc[0, [covid_date_column, covid_group_column]])
+        if aggregates['daily_last_key'] is not None and first_key < aggregates['daily_last_key']:
+            aggregates['daily_sorted'] = False
+        aggregates['daily_last_key'] = tuple(daily.loc[len(daily) - 1, [covid_date_column, covid_group_column]])
+
+        first_rows = aggregates['rows'] == 0
+        daily_path = pathlib.Path(aggregates['daily_path'])
+        start = 0 if first_rows else daily_path.stat().st_size
+        daily.to_csv(daily_path, mode='w' if first_rows else 'a', header=first_rows, index=False)
+        if first_rows:
+            # The first run starts after the header line
+            with daily_path.open('rb') as file:
+                start = len(file.readline())
+        aggregates['daily_runs'].append((start, daily_path.stat().st_size))
+    aggregates['rows'] += len(daily)
+
+    by_date = sum_covid_by_date(daily)
+    if aggregates['by_date'] is not None:
+        by_date = pd.concat([aggregates['by_date'], by_date]).groupby(level=0).sum()
+    aggregates['by_date'] = by_date
+
+    peaks = find_covid_peaks(daily)
+    if aggregates['peaks'] is not None:
+        peaks = merge_covid_peaks(aggregates['peaks'], peaks)
+    aggregates['peaks'] = peaks
+    return aggregates
+
+# Read the lines of a byte range of a file, one at a time
+def iter_file_range_lines(file_path, start, end):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        while file.tell() < end:
+            yield file.readline()
+
+# Merge the runs of covid_daily.csv into one file sorted by date and country, like the daily rows
+# of a whole table. Runs are read line by line, so only one row per run is held in memory.
+def merge_covid_daily_runs(daily_path, runs):
+    daily_path = pathlib.Path(daily_path)
+    temp_path = daily_path.with_name(daily_path.name + '.tmp')
+
+    # Dates are written as YYYY-MM-DD, so the text of the first two fields sorts like the rows
+    def get_key(line):
+        return tuple(next(csv.reader([line.decode('utf-8')]))[:2])
+
+    with daily_path.open('rb') as file:
+        header = file.readline()
+    with temp_path.open('wb') as file:
+        file.write(header)
+        file.writelines(heapq.merge(*(iter_file_range_lines(daily_path, start, end) for start, end in runs), key=get_key))
+    os.replace(temp_path, daily_path)
+
+# Finish the aggregates: sort the totals per date and add their rolling averages
+# covid_daily.csv is merged into date and country order if its chunks were not already in that order.
+# Returns {'rows', 'by_date': totals per date with rolling averages, 'peaks': peaks per country}
+def finish_covid_aggregates(aggregates):
+    if aggregates['daily_path'] and not aggregates['daily_sorted']:
+        merge_covid_daily_runs(aggregates['daily_path'], aggregates['daily_runs'])
+    by_date = aggregates['by_date']
+    if by_date is not None:
+        by_date = by_date.sort_index()
+        for column in covid_value_columns:
+            by_date[get_average_column(column)] = by_date[get_new_column(column)].rolling(covid_rolling_days, min_periods=1).mean()
+    peaks = aggregates['peaks'].sort_index() if aggregates['peaks'] is not None else None
+    return {'rows': aggregates['rows'], 'by_date': by_date, 'peaks': peaks}
+
+# Aggregate a stream of covid chunks in one pass
+def aggregate_covid_chunks(chunks, daily_path=None):
+    aggregates = create_covid_aggregates(daily_path)
+    for chunk in chunks:
+        update_covid_aggregates(aggregates, chunk)
+    return finish_covid_aggregates(aggregates)
+
+# Write the time series report (covid_analysis.txt) and the per-date and per-country tables as CSV
+def write_covid_report(dataset_name, aggregates):
+    if aggregates['by_date'] is None:
+        print("No rows available for the time series report.")
+        return
+    folder_path = create_folder('csv', dataset_name)
+    by_date = aggregates['by_date']
+    peaks = aggregates['peaks']
+    by_date.to_csv(folder_path.joinpath('covid_by_date.csv'))
+    peaks.to_csv(folder_path.joinpath('covid_country_peaks.csv'))
+
+    analysis = f"Rows: {aggregates['rows']}\n"
+    analysis += f"Countries: {len(peaks)}\n"
+    analysis += f"Dates: {by_date.index.min():%Y-%m-%d} to {by_date.index.max():%Y-%m-%d}\n"
+
+    analysis += f"\nWorldwide Daily Totals (last {covid_report_rows} days):\n"
+    analysis += by_date.tail(covid_report_rows).to_string(float_format=lambda value: f"{value:.1f}")
+
+    for column in map(get_new_column, covid_value_columns):
+        top_peaks = peaks.nlargest(covid_report_rows, f"Peak {column}")[[f"Peak {column}", f"Peak {column} Date"]]
+        analysis += f"\n\nTop {covid_report_rows} Countries by Peak {column}:\n"
+        analysis += top_peaks.to_string()
+
+    save_analysis_results_to_txt(folder_path, 'covid_analysis.txt', analysis)
+
+# Aggregate the covid time series of a whole table and write the report and tables
+# Writes covid_daily.csv (every row with new values and rolling averages), covid_by_date.csv,
+# covid_country_peaks.csv and covid_analysis.txt under data/csv/<dataset>
+def analyze_covid_data(dataset_name, df):
+    folder_path = create_folder('csv', dataset_name)
+    aggregates = aggregate_covid_chunks([df], folder_path.joinpath('covid_daily.csv'))
+    write_covid_report(dataset_name, aggregates)
+    return aggregates
+
+##############################
+# Excel in chunks (streaming workbooks larger than memory)
+##############################
+
+# Rows read at a time when an Excel file is analyzed in chunks
+excel_chunk_size = 10000
+
+# Name the columns of a sheet from its header row, like pd.read_excel: empty headers become "Unnamed: <n>",
+# and repeated headers get a number (a, a.1, a.2) that skips names found elsewhere in the header.
+# Named columns are numbered before unnamed ones, as pandas does.
+def get_excel_column_names(header):
+    names = [name if name is not None and name != '' else f"Unnamed: {index}" for index, name in enumerate(header)]
+    unnamed = [index for index, name in enumerate(header) if name is None or name == '']
+    counts = Counter()
+    for index in [index for index in range(len(names)) if index not in unnamed] + unnamed:
+        name = names[index]
+        count = counts[name]
+        if count > 0:
+            base_name = name
+            while count > 0:
+                counts[base_name] = count + 1
+                name = f"{base_name}.{count}"
+                count = count + 1 if name in names else counts[name]
+            names[index] = name
+        counts[name] = count + 1
+    return names
+
+# Get the positions of the columns to read (all of them if usecols is None)
+def get_excel_column_indexes(names, usecols=None):
+    if usecols is None:
+        return list(range(len(names)))
+    missing = [column for column in usecols if column not in names]
+    if missing:
+        raise ValueError(f"Columns not found in the sheet: {missing}")
+    return sorted(names.index(column) for column in usecols)
+
+# Stream the rows of an .xlsx sheet with openpyxl in read-only mode, without loading the whole workbook
+# Only the cells between the first and last projected column are built.
+def iter_xlsx_rows(file_path, sheet_name=None, usecols=None, skiprows=0, nrows=None):
+    import openpyxl
+
+    with open_dataset_file(file_path) as file:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+            header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+            names = get_excel_column_names(header)
+            indexes = get_excel_column_indexes(names, usecols)
+            yield [names[index] for index in indexes]
+            if not indexes:
+                return
+
+            first_column = indexes[0]
+            offsets = [index - first_column for index in indexes]
+            min_row = 2 + skiprows
+            max_row = min_row + nrows - 1 if nrows is not None else None
+            for row in sheet.iter_rows(min_row=min_row, max_row=max_row, min_col=first_column + 1,
+                                       max_col=indexes[-1] + 1, values_only=True):
+                yield [row[offset] if offset < len(row) else None for offset in offsets]
+        finally:
+            workbook.close()
+
+# Convert the cells of one .xls column to Python values the way pd.read_excel does
+# (whole numbers become ints, dates become datetimes, empty cells become None)
+def convert_xls_cells(values, types, datemode):
+    import xlrd
+
+    converted = []
+    for value, cell_type in zip(values, types):
+        if cell_type in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+            value = None
+        elif cell_type == xlrd.XL_CELL_DATE:
+            value = xlrd.xldate_as_datetime(value, datemode)
+        elif cell_type == xlrd.XL_CELL_BOOLEAN:
+            value = bool(value)
+        elif cell_type == xlrd.XL_CELL_NUMBER and value.is_integer():
+            value = int(value)
+        converted.append(value)
+    return converted
+
+# Stream the rows of an .xls sheet with xlrd, loading only that sheet (on demand)
+# Projected columns are read a chunk of rows at a time, so only the columns used are converted.
+def iter_xls_rows(file_path, sheet_name=None, usecols=None, skiprows=0, nrows=None, chunk_size=excel_chunk_size):
+    import xlrd
+
+    with open_dataset_file(file_path) as file:
+        workbook = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
     try:
-        with file_path.open('w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
-            print(f"JSON data saved to {file_path}")
-    except IOError as e:
-        print(f"IOError occurred while writing file: {e}")
-    except OSError as e:
-        print(f"OSError occurred while creating directories: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred while writing file: {e}")
+        sheet = workbook.sheet_by_name(sheet_name) if sheet_name is not None else workbook.sheet_by_index(0)
+        header = sheet.row_values(0) if sheet.nrows else []
+        names = get_excel_column_names(header)
+        indexes = get_excel_column_indexes(names, usecols)
+        yield [names[index] for index in indexes]
+
+        start = 1 + skiprows
+        end = sheet.nrows if nrows is None else min(sheet.nrows, start + nrows)
+        for chunk_start in range(start, end, chunk_size):
+            chunk_end = min(end, chunk_start + chunk_size)
+            columns = [
+                convert_xls_cells(sheet.col_values(index, chunk_start, chunk_end), sheet.col_types(index, chunk_start, chunk_end), workbook.datemode)
+                for index in indexes
+            ]
+            yield from zip(*columns)
     finally:
-        print("Write operation attempted.")
-    return file_path  # Return the file path for further analysis
+        workbook.release_resources()
+
+# Read an Excel sheet in chunks of chunk_size rows as DataFrames
+# usecols picks columns by name; skiprows and nrows pick the data rows (after the header row)
+def iter_excel_chunks(file_path, sheet_name=None, usecols=None, skiprows=0, nrows=None, chunk_size=excel_chunk_size):
+    file_extension = pathlib.Path(strip_compression_suffix(file_path)).suffix
+    if file_extension == '.xlsx':
+        rows = iter_xlsx_rows(file_path, sheet_name, usecols, skiprows, nrows)
+    elif file_extension == '.xls':
+        rows = iter_xls_rows(file_path, sheet_name, usecols, skiprows, nrows, chunk_size)
+    else:
+        raise ValueError(f"Unsupported file extension: {file_extension}")
+
+    # Number the rows across chunks, like the chunks of pd.read_csv
+    names = next(rows)
+    chunk = []
+    start = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield pd.DataFrame(chunk, columns=names, index=range(start, start + len(chunk)))
+            start += len(chunk)
+            chunk = []
+    if chunk or not start:
+        yield pd.DataFrame(chunk, columns=names, index=range(start, start + len(chunk)))
+
+# Analyze an Excel sheet in chunks, so memory use is bounded by the chunk size and not the workbook
+# Rows go through the same online statistics as CSV files analyzed in chunks (see analyze_csv_file_in_chunks),
+# and the histograms come from the quantile sketches.
+def analyze_excel_file_in_chunks(dataset_name, file_path, chunk_size=excel_chunk_size, usecols=None, skiprows=0, nrows=None, sheet_name=None):
+    summary = create_table_summary()
+    for chunk in iter_excel_chunks(file_path, sheet_name, usecols, skiprows, nrows, chunk_size):
+        summary = update_table_summary(summary, chunk)
+
+    analysis_folder_path = write_table_summary_report(dataset_name, summary, 'excel', 'excel_analysis.txt')
+
+    histograms = compute_sketch_histograms(summary)
+    if 'c1' in histograms['columns']:
+        save_and_queue_histogram(histograms, analysis_folder_path, 'c1', 'Histogram of c1', 'c1', 'Frequency')
+    else:
+        save_histograms(histograms, analysis_folder_path)
+        print("Column 'c1' does not exist in the DataFrame.")
+    return summary
+
+##############################
+# Excel sheets (every sheet of a workbook, in parallel)
+##############################
+
+# Worker processes for the sheets of a workbook (None = one per CPU core)
+excel_sheet_workers = None
+
+# Per-sheet reports go to data/excel/<dataset>/sheets/<sheet>/, next to the combined report
+excel_sheets_folder_name = 'sheets'
+excel_sheets_report_name = 'excel_sheets_analysis.txt'
+
+# List the sheet names of a workbook without loading the sheets
+def list_excel_sheets(file_path):
+    engine = get_excel_engine(file_path)
+    with open_dataset_file(file_path) as file:
+        if engine == 'xlrd':
+            import xlrd
+            workbook = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
+            try:
+                return workbook.sheet_names()
+            finally:
+                workbook.release_resources()
+
+        import openpyxl
+        workbook = openpyxl.load_workbook(file, read_only=True)
+        try:
+            return workbook.sheetnames
+        finally:
+            workbook.close()
+
+# Give each sheet a folder name that is safe on every file system and unique within the workbook
+def get_excel_sheet_folder_names(sheet_names):
+    folder_names = {}
+    used = set()
+    for sheet_name in sheet_names:
+        base_name = re.sub(r'[^\w.-]+', '_', str(sheet_name)).strip('._') or 'sheet'
+        folder_name = base_name
+        number = 2
+        while folder_name.lower() in used:
+            folder_name = f"{base_name}_{number}"
+            number += 1
+        used.add(folder_name.lower())
+        folder_names[sheet_name] = folder_name
+    return folder_names
+
+# Read one sheet of a workbook into a DataFrame (an .xls workbook only loads that sheet)
+def read_excel_sheet(file_path, sheet_name):
+    engine = get_excel_engine(file_path)
+    with open_dataset_file(file_path) as file:
+        if engine == 'xlrd':
+            import xlrd
+            workbook = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
+            try:
+                return pd.read_excel(workbook, sheet_name=sheet_name, engine=engine)
+            finally:
+                workbook.release_resources()
+        return pd.read_excel(file, sheet_name=sheet_name, engine=engine)
+
+# Worker task: read and analyze one sheet, writing its report to data/excel/<dataset>/sheets/<folder_name>/
+# (empty sheets get no report). Returns the sheet's table summary (for the combined report)
+# and the seconds spent reading and analyzing it
+def analyze_excel_sheet(dataset_name, file_path, sheet_name, folder_name):
+    start = time.perf_counter()
+    df = read_excel_sheet(file_path, sheet_name)
+    read_seconds = time.perf_counter() - start
+
+    if len(df.columns) > 0:
+        analysis_folder_path = create_folder('excel', dataset_name).joinpath(excel_sheets_folder_name, folder_name)
+        write_excel_report(analysis_folder_path, df)
+    else:
+        print(f"Sheet {sheet_name} is empty, no report written.")
+    summary = summarize_table_chunk(df)
+    return summary, read_seconds, time.perf_counter() - start - read_seconds
+
+# Build the combined report of a workbook: the time spent on each sheet (slowest first), the sheets that failed,
+# then the statistics of all sheets together (columns with the same name are merged)
+def format_excel_sheets_analysis(sheet_results, errors, folder_names, workers, seconds):
+    timings = pd.DataFrame(
+        [
+            {
+                'Sheet': sheet_name,
+                'Rows': summary['rows'],
+                'Columns': len(summary['columns']),
+                'Read (s)': read_seconds,
+                'Analysis (s)': analysis_seconds,
+                'Total (s)': read_seconds + analysis_seconds,
+                'Report': f"{excel_sheets_folder_name}/{folder_names[sheet_name]}" if summary['columns'] else '(empty sheet)',
+            }
+            for sheet_name, (summary, read_seconds, analysis_seconds) in sheet_results.items()
+        ],
+        columns=['Sheet', 'Rows', 'Columns', 'Read (s)', 'Analysis (s)', 'Total (s)', 'Report'],
+    ).set_index('Sheet').sort_values('Total (s)', ascending=False)
+
+    summary = create_table_summary()
+    for sheet_summary, read_seconds, analysis_seconds in sheet_results.values():
+        summary = merge_table_summaries(summary, sheet_summary)
+
+    analysis = f"Sheets: {len(sheet_results) + len(errors)}, analyzed by {workers} worker(s) in {seconds:.2f} s\n"
+    analysis += "\nSheet Timings (slowest first):\n"
+    analysis += timings.to_string(float_format=lambda value: f"{value:.3f}")
+    if errors:
+        analysis += "\n\nFailed Sheets:\n"
+        analysis += "\n".join(f"{sheet_name}: {error}" for sheet_name, error in errors.items())
+    if not summary['columns']:
+        return analysis
+
+    analysis += "\n\nSummary Statistics (all sheets):\n"
+    analysis += describe_table_summary(summary).to_string()
+    analysis += "\n\nMissing Data (all sheets):\n"
+    analysis += pd.Series(summary['nulls'], index=summary['columns'], dtype='int64').to_string()
+    analysis += "\n\nApproximate Statistics:\n"
+    analysis += format_approximate_statistics(summary)
+    return analysis
+
+# Analyze every sheet of a workbook in worker processes (errors opening the workbook are raised to the caller)
+# Writes a report per sheet under data/excel/<dataset>/sheets/ and the combined report
+# data/excel/<dataset>/excel_sheets_analysis.txt. A sheet that fails is listed in the combined report.
+# Returns ({sheet name: (summary, read seconds, analysis seconds)}, {sheet name: error message})
+def analyze_excel_workbook(dataset_name, file_path, workers=excel_sheet_workers):
+    start = time.perf_counter()
+    sheet_names = list_excel_sheets(file_path)
+    folder_names = get_excel_sheet_folder_names(sheet_names)
+    workers = max(1, min(len(sheet_names), workers or os.cpu_count() or 1))
+
+    results = {}
+    errors = {}
+    if workers == 1:
+        for sheet_name in sheet_names:
+            try:
+                results[sheet_name] = analyze_excel_sheet(dataset_name, file_path, sheet_name, folder_names[sheet_name])
+            except Exception as e:
+                errors[sheet_name] = f"Analysis failed: {e}"
+    else:
+        with create_process_pool(workers) as executor:
+            futures = {
+                executor.submit(analyze_excel_sheet, dataset_name, file_path, sheet_name, folder_names[sheet_name]): sheet_name
+                for sheet_name in sheet_names
+            }
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    errors[futures[future]] = f"Analysis failed: {e}"
+
+    # Keep the workbook's sheet order
+    sheet_results = {sheet_name: results[sheet_name] for sheet_name in sheet_names if sheet_name in results}
+    errors = {sheet_name: errors[sheet_name] for sheet_name in sheet_names if sheet_name in errors}
+
+    analysis = format_excel_sheets_analysis(sheet_results, errors, folder_names, workers, time.perf_counter() - start)
+    save_analysis_results_to_txt(create_folder('excel', dataset_name), excel_sheets_report_name, analysis)
+    return sheet_results, errors
 
-def fetch_and_write_json_data(folder_path, filename, url):
+##############################
+# Columnar cache (parsed CSV and Excel tables as memory-mapped NumPy columns)
+##############################
+
+# Set to False to always parse CSV and Excel files from scratch
+columnar_cache_enabled = True
+
+# The cache of data/csv/<dataset>/<file> is the folder data/csv/<dataset>/<file>.columns
+columnar_cache_suffix = '.columns'
+
+# Get the cache folder of a CSV or Excel file
+def get_columnar_cache_path(file_path):
+    file_path = pathlib.Path(file_path)
+    return file_path.with_name(file_path.name + columnar_cache_suffix)
+
+# Save a parsed table as one .npy file per column plus schema.json, next to the source file
+# Numbers, booleans and dates are saved as they are; other columns are saved as integer codes
+# (-1 for missing values) and a JSON list of their distinct values.
+# The schema records the source file's SHA-256, so the cache is only used while the source is unchanged.
+def save_columnar_cache(df, file_path):
+    file_path = pathlib.Path(file_path)
+    cache_path = get_columnar_cache_path(file_path)
+    temp_path = cache_path.with_name(cache_path.name + '.tmp')
+    shutil.rmtree(temp_path, ignore_errors=True)
+    temp_path.mkdir(parents=True)
+
+    source_stat = file_path.stat()
+    schema = {
+        'source_hash': hash_file(file_path),
+        'source_size': source_stat.st_size,
+        'source_mtime_ns': source_stat.st_mtime_ns,
+        'rows': len(df),
+        'columns': [],
+    }
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise HTTPError for bad responses
-        json_data = response.json()  # Parse the JSON response content
-        file_path = write_json_file(folder_path, filename, json_data)
-        return file_path
-    except requests.RequestException as e:
-        print(f"RequestException occurred while fetching data: {e}")
-    except ValueError as e:
-        print(f"ValueError occurred while processing response content: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred while fetching data: {e}")
-    finally:
-        print("Fetch operation attempted.")
-    return None
+        for index, (name, series) in enumerate(df.items()):
+            column = {'name': name, 'dtype': str(series.dtype), 'file': f"{index}.npy"}
+            if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+                np.save(temp_path.joinpath(column['file']), series.to_numpy())
+            else:
+                codes, categories = pd.factorize(series)
+                np.save(temp_path.joinpath(column['file']), codes.astype(np.int32))
+                column['categories'] = f"{index}.json"
+                with temp_path.joinpath(column['categories']).open('w', encoding='utf-8') as file:
+                    json.dump(categories.tolist(), file, ensure_ascii=False)
+            schema['columns'].append(column)
+        save_json_atomically(temp_path.joinpath('schema.json'), schema)
+    except (TypeError, ValueError) as e:
+        # Values JSON cannot hold (for example times of day) are simply not cached
+        shutil.rmtree(temp_path, ignore_errors=True)
+        print(f"Columnar cache not saved for {file_path}: {e}")
+        return None
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(temp_path, cache_path)
+    print(f"Columnar cache saved to {cache_path}")
+    return cache_path
+
+# Check whether the cache of a file still matches it: same size, and the same modification time or SHA-256
+# (the file is only hashed when its modification time changed)
+def is_columnar_cache_current(file_path, schema):
+    source_stat = pathlib.Path(file_path).stat()
+    if source_stat.st_size != schema['source_size']:
+        return False
+    if source_stat.st_mtime_ns == schema['source_mtime_ns']:
+        return True
+    return hash_file(file_path) == schema['source_hash']
+
+# Load a table from the columnar cache of a file, or return None if there is no current cache
+# Columns are memory-mapped, so only the parts an analysis reads are loaded from disk.
+def load_columnar_cache(file_path):
+    cache_path = get_columnar_cache_path(file_path)
+    schema = load_json_or_default(cache_path.joinpath('schema.json'), None)
+    if schema is None or not is_columnar_cache_current(file_path, schema):
+        return None
+
+    columns = {}
+    try:
+        for column in schema['columns']:
+            values = np.load(cache_path.joinpath(column['file']), mmap_mode='r')
+            if 'categories' in column:
+                with cache_path.joinpath(column['categories']).open('r', encoding='utf-8') as file:
+                    categories = json.load(file)
+                # Rebuilt with the column's original dtype (not as a Categorical), so the table is the same
+                # as a fresh parse: missing values are code -1, which picks the NaN added at the end.
+                # A Series keeps an object dtype, where a bare array would be inferred as str by the DataFrame.
+                values = pd.Series(np.array(categories + [np.nan], dtype=object)[values], dtype=column['dtype'])
+            columns[column['name']] = values
+    except (OSError, ValueError) as e:
+        print(f"Columnar cache of {file_path} could not be read: {e}")
+        return None
+
+    print(f"Loaded {file_path} from columnar cache {cache_path}")
+    return pd.DataFrame(columns, copy=False)
+
+# Load a table from its columnar cache if it is current, otherwise parse it with read_table(file_path)
+# and cache the result for the next analysis
+def read_table_cached(file_path, read_table):
+    if columnar_cache_enabled:
+        df = load_columnar_cache(file_path)
+        if df is not None:
+            return df
+    df = read_table(file_path)
+    if columnar_cache_enabled:
+        save_columnar_cache(df, file_path)
+    return df
+
+################
+# JSON
+###############
 
 def save_simplified_data_to_file(folder_path, filename, data):
     folder_path = pathlib.Path(folder_path)
@@ -365,95 +3266,599 @@ def save_simplified_data_to_file(folder_path, filename, data):
     finally:
         print("Save operation attempted.")
 
-def process_json_file(dataset_name, filename, url):
+# Analyze a saved JSON file and save the simplified data (errors are raised to the caller)
+# Set streaming=True to parse the file in chunks, one astronaut at a time (see analyze_json_file_in_chunks)
+def analyze_json_file(dataset_name, file_path, streaming=False):
+    if streaming:
+        return analyze_json_file_in_chunks(dataset_name, file_path)
+
+    # Load the JSON file into a Python dictionary
+    with open_dataset_file(file_path, 'rt', encoding='utf-8') as file:
+        json_data = json.load(file)
+    analyze_json_data(dataset_name, json_data)
+
+# Analyze JSON data that is already parsed and save the simplified data (errors are raised to the caller)
+def analyze_json_data(dataset_name, json_data):
     folder_path = create_folder('json', dataset_name)
-    # Fetch and write the JSON file
-    file_path = fetch_and_write_json_data(folder_path, filename, url)
-    
-    if file_path:
+    simplified_data = []
+
+    # Example: Extracting information about astronauts in space
+    if "people" in json_data:
+        simplified_data.append("Astronauts currently in space:\n")
+        for person in json_data["people"]:
+            simplified_data.append(format_astronaut(person))
+
+    # Example: Count the number of astronauts
+    num_astronauts = len(json_data.get("people", []))
+    simplified_data.append(f"\nTotal number of astronauts in space: {num_astronauts}")
+
+    # Save the simplified output to a text file
+    save_simplified_data_to_file(folder_path, 'simplified_data.txt', simplified_data)
+
+# Describe one astronaut in the simplified data
+def format_astronaut(person):
+    name = person.get("name")
+    craft = person.get("craft")
+    return f"- {name} aboard {craft}"
+
+# Set streaming=True for large payloads: the download is parsed as it arrives and the simplified data
+# is written one astronaut at a time, so memory use does not grow with the payload
+def process_json_file(dataset_name, filename, url, streaming=False):
+    folder_path = create_folder('json', dataset_name)
+    file_path = folder_path.joinpath(filename)
+    if streaming:
         try:
-            # Load the JSON file into a Python dictionary
-            with open(file_path, 'r', encoding='utf-8') as file:
-                json_data = json.load(file)
-            
-            simplified_data = []
-
-            # Example: Extracting information about astronauts in space
-            if "people" in json_data:
-                simplified_data.append("Astronauts currently in space:\n")
-                for person in json_data["people"]:
-                    name = person.get("name")
-                    craft = person.get("craft")
-                    simplified_data.append(f"- {name} aboard {craft}")
-
-            # Example: Count the number of astronauts
-            num_astronauts = len(json_data.get("people", []))
-            simplified_data.append(f"\nTotal number of astronauts in space: {num_astronauts}")
-
-            # Save the simplified output to a text file
-            save_simplified_data_to_file(folder_path, 'simplified_data.txt', simplified_data)
-        
-        except FileNotFoundError:
-            print(f"File not found: {file_path}")
-        except json.JSONDecodeError:
-            print(f"Error decoding JSON from file: {file_path}")
+            # The raw bytes are saved as they arrive (compressed downloads stay compressed)
+            chunks = decode_text_chunks(decompress_chunks(iter_download_chunks(url, file_path)))
+            analyze_json_items(dataset_name, iter_json_items(chunks))
+        except requests.RequestException as e:
+            print(f"RequestException occurred while fetching data: {e}")
+        except ValueError as e:
+            print(f"Error decoding JSON from {url}: {e}")
         except Exception as e:
             print(f"An error occurred while processing the JSON data: {e}")
         finally:
             print("Analysis operation attempted.")
+        return
+
+    # Fetch the JSON file into memory and parse it once, while the raw bytes are saved as received
+    try:
+        body, writer = fetch_into_buffer(url, file_path)
+    except requests.RequestException as e:
+        print(f"RequestException occurred while fetching data: {e}")
+        return
+    finally:
+        print("Fetch operation attempted.")
+
+    try:
+        if body is None:
+            # Not modified: parse the saved file
+            analyze_json_file(dataset_name, file_path)
+        else:
+            analyze_json_data(dataset_name, json.loads(decompress_bytes(body)))
+    except json.JSONDecodeError:
+        print(f"Error decoding JSON from file: {file_path}")
+    except Exception as e:
+        print(f"An error occurred while processing the JSON data: {e}")
+    finally:
+        wait_for_saved_body(writer)
+        print("Analysis operation attempted.")
 
 # Example usage
 #process_json_file('data-json', 'data.json', 'http://api.open-notify.org/astros.json')
+#process_json_file('data-json', 'data.json', 'http://api.open-notify.org/astros.json', streaming=True)
 
 
 ##############################
-# Main function
+# JSON in chunks (streaming payloads larger than memory)
+##############################
+
+# Path of the array whose items are streamed: object keys separated by dots, with 'item' standing
+# for the elements of an array (so 'item' alone is a top-level array)
+json_items_path = 'people.item'
+
+# Characters that matter when scanning over JSON text
+json_whitespace = re.compile(r'[ \t\n\r]*')
+json_structure = re.compile(r'[][{}"]')
+json_string_special = re.compile(r'["\\]')
+json_scalar_end = re.compile(r'[,\]}\s]')
+
+# JSON text that arrives in chunks, read from left to right
+# Only the text that has not been read yet is kept, plus the value being decoded.
+class JsonChunkReader:
+    def __init__(self, text_chunks):
+        self.chunks = iter(text_chunks)
+        self.text = ''
+        self.pos = 0
+
+    # Append the next chunk, dropping the text already read; False at the end of the input
+    def read_more(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    # Skip whitespace and return the next character without reading it ('' at the end of the input)
+    def peek(self):
+        while True:
+            self.pos = json_whitespace.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.read_more():
+                return ''
+
+    # Read one of the expected characters and return it
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Invalid JSON: expected one of {chars!r}, found {repr(char) if char else 'the end of the data'}")
+        self.pos += 1
+        return char
+
+    # Find where the value at the current position ends, reading more chunks until it is complete
+    # With keep=False the text is dropped as it is passed over, so skipping a huge value takes little memory.
+    def find_value_end(self, keep=True):
+        first = self.peek()
+        if not first:
+            raise ValueError("Invalid JSON: unexpected end of the data")
+        if first not in '{["':
+            # Numbers, true, false and null end at the next delimiter
+            while True:
+                match = json_scalar_end.search(self.text, self.pos)
+                if match:
+                    return match.start()
+                if not self.read_more():
+                    return len(self.text)
+
+        i = self.pos
+        depth = 0
+        in_string = False
+        while True:
+            if in_string:
+                match = json_string_special.search(self.text, i)
+                if match and match.group() == '"':
+                    in_string = False
+                    i = match.end()
+                    if depth == 0:
+                        return i
+                    continue
+                if match and match.end() < len(self.text):
+                    i = match.end() + 1  # Skip the escaped character
+                    continue
+                i = match.start() if match else len(self.text)
+            else:
+                match = json_structure.search(self.text, i)
+                if match:
+                    i = match.end()
+                    if match.group() == '"':
+                        in_string = True
+                    elif match.group() in '[{':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return i
+                    continue
+                i = len(self.text)
+
+            # The value goes on in the next chunk
+            if not keep:
+                self.pos = i
+            offset = i - self.pos
+            if not self.read_more():
+                raise ValueError("Invalid JSON: unexpected end of the data")
+            i = self.pos + offset
+
+    # Read and parse the next value
+    def decode(self):
+        end = self.find_value_end()
+        value = json.loads(self.text[self.pos:end])
+        self.pos = end
+        return value
+
+    # Read past the next value without parsing it
+    def skip(self):
+        self.pos = self.find_value_end(keep=False)
+
+# Yield the values found at the remaining path keys, starting from the value at the reader's position
+def iter_json_path_values(reader, keys):
+    if not keys:
+        yield reader.decode()
+        return
+
+    if keys[0] == 'item':
+        if reader.peek() != '[':
+            reader.skip()
+            return
+        reader.expect('[')
+        if reader.peek() == ']':
+            reader.expect(']')
+            return
+        while True:
+            yield from iter_json_path_values(reader, keys[1:])
+            if reader.expect(',]') == ']':
+                return
+
+    if reader.peek() != '{':
+        reader.skip()
+        return
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(':')
+        if key == keys[0]:
+            yield from iter_json_path_values(reader, keys[1:])
+        else:
+            reader.skip()
+        if reader.expect(',}') == '}':
+            return
+
+# Parse JSON text as it arrives and yield the items at a path like 'people.item', one at a time
+# Memory use depends on the size of one item, not of the whole document.
+# The input is read to the end (so a download being saved on the way is completed) and must hold one document.
+def iter_json_items(text_chunks, path=json_items_path):
+    reader = JsonChunkReader(text_chunks)
+    yield from iter_json_path_values(reader, path.split('.'))
+    if reader.peek():
+        raise ValueError(f"Invalid JSON: extra data after the document, found {reader.peek()!r}")
+
+# Read a saved JSON file (decompressing it if needed) as text chunks
+def read_json_chunks(file_path, chunk_size=download_chunk_size):
+    return decode_text_chunks(decompress_chunks(read_binary_chunks(file_path, chunk_size)))
+
+# Write the simplified data for the astronauts in a stream of items, one line at a time as they are parsed
+# The file is the same as the one analyze_json_data writes, except that the heading is only written
+# once the first astronaut arrives. The lines go to a temporary file that only replaces simplified_data.txt
+# once the whole stream is parsed, so a download that fails halfway keeps the previous file.
+def analyze_json_items(dataset_name, people):
+    folder_path = create_folder('json', dataset_name)
+    file_path = folder_path.joinpath('simplified_data.txt')
+    temp_path = file_path.with_name(file_path.name + '.tmp')
+    num_astronauts = 0
+    try:
+        with temp_path.open('w', encoding='utf-8') as file:
+            for person in people:
+                if num_astronauts == 0:
+                    file.write("Astronauts currently in space:\n")
+                file.write(f"\n{format_astronaut(person)}")
+                num_astronauts += 1
+            file.write(f"\n\nTotal number of astronauts in space: {num_astronauts}")
+        os.replace(temp_path, file_path)
+    except Exception:
+        temp_path.unlink(missing_ok=True)
+        raise
+    print(f"Simplified data saved to {file_path}")
+    return num_astronauts
+
+# Analyze a saved JSON file as a stream of items (errors are raised to the caller)
+def analyze_json_file_in_chunks(dataset_name, file_path, path=json_items_path):
+    return analyze_json_items(dataset_name, iter_json_items(read_json_chunks(file_path), path))
+
+##############################
+# Concurrent pipeline
+##############################
+
+# Limits for the concurrent pipeline: downloads at once, downloads at once from one host,
+# and analysis worker processes (None means one per CPU core)
+max_concurrent_downloads = 8
+max_downloads_per_host = 2
+max_analysis_workers = None
+
+# Rows per chunk when the pipeline analyzes CSV files (None reads each file at once)
+pipeline_csv_chunk_size = None
+
+# File extension used for each type of dataset
+dataset_file_extensions = {'txt': 'txt', 'csv': 'csv', 'excel': 'xls', 'json': 'json'}
+
+# One semaphore per host caps how many downloads hit the same server at once
+host_semaphores = {}
+host_semaphores_lock = threading.Lock()
+
+# Get the semaphore for a host, creating it the first time
+def get_host_semaphore(host):
+    with host_semaphores_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.Semaphore(max_downloads_per_host)
+        return host_semaphores[host]
+
+# File name a dataset is saved as: <dataset>.<extension>, plus .gz (or another compression suffix)
+# if the URL points to a compressed file
+def get_dataset_filename(dataset_name, file_type, url=''):
+    return f"{dataset_name}.{dataset_file_extensions[file_type]}{get_compression_suffix(url)}"
+
+# Path a dataset is saved to: data/<type>/<dataset>/<dataset file name>
+def get_dataset_file_path(dataset_name, file_type, url=''):
+    folder_path = create_folder(file_type, dataset_name)
+    return folder_path.joinpath(get_dataset_filename(dataset_name, file_type, url))
+
+# Download one dataset to data/ and return its path (errors are raised to the caller)
+def download_dataset(dataset_name, file_type, url):
+    file_path = get_dataset_file_path(dataset_name, file_type, url)
+
+    with get_host_semaphore(urlsplit(url).netloc):
+        # CSV, Excel, JSON and compressed files are streamed straight to disk as received and can resume if interrupted
+        # (JSON is not parsed and re-serialized here: the analysis parses it once)
+        if file_type != 'txt' or get_compression_suffix(url):
+            return download_file(url, file_path)
+
+        # Text is decoded as UTF-8 and written as it arrives, the same file process_txt_file saves
+        with cached_get(url, file_path, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                print(f"Not modified, using saved {file_path}")
+                return file_path
+            response.encoding = 'utf-8'
+            chunks = response.iter_content(chunk_size=download_chunk_size, decode_unicode=True)
+            for chunk in write_txt_chunks(file_path.parent, file_path.name, chunks):
+                pass
+
+    save_http_cache_entry(url, file_path, response)
+    store_artifact(file_path, url)
+    return file_path
+
+# Analyze one saved dataset (runs in a worker process; errors are raised to the caller)
+def analyze_dataset(dataset_name, file_type, file_path):
+    if file_type == 'txt':
+        analyze_local_txt_file(dataset_name, file_path.name)
+    elif file_type == 'csv':
+        analyze_csv_file(dataset_name, file_path, pipeline_csv_chunk_size)
+    elif file_type == 'excel':
+        analyze_excel_file(dataset_name, file_path)
+    elif file_type == 'json':
+        analyze_json_file(dataset_name, file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+# Download every dataset in parallel threads and analyze each one in a worker process as soon as it lands
+# Returns {dataset name: error message} for every dataset that failed, in the order of the datasets dict
+def process_datasets_concurrently(datasets, max_downloads=max_concurrent_downloads, analysis_workers=max_analysis_workers):
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=max_downloads) as download_pool, \
+            create_process_pool(analysis_workers) as analysis_pool:
+        downloads = {
+            download_pool.submit(download_dataset, dataset_name, file_type, url): dataset_name
+            for dataset_name, (file_type, url) in datasets.items()
+        }
+
+        analyses = {}
+        for future in as_completed(downloads):
+            dataset_name = downloads[future]
+            try:
+                file_path = future.result()
+            except Exception as e:
+                errors[dataset_name] = f"Download failed: {e}"
+                continue
+            file_type = datasets[dataset_name][0]
+            analyses[analysis_pool.submit(analyze_dataset, dataset_name, file_type, file_path)] = dataset_name
+
+        for future in as_completed(analyses):
+            dataset_name = analyses[future]
+            try:
+                future.result()
+            except Exception as e:
+                errors[dataset_name] = f"Analysis failed: {e}"
+
+    return {dataset_name: errors[dataset_name] for dataset_name in datasets if dataset_name in errors}
+
 ##############################
+# Record and replay (offline copies of every dataset URL)
+##############################
+
+# Folder for recorded responses: <hash>.body holds the body and <hash>.json the status and headers
+fixtures_folder_name = 'fixtures'
+
+# Port the replay server listens on (fixed, so the HTTP cache sees the same URLs on every run)
+replay_port = 8808
+
+# Response headers that are recorded and replayed
+replayed_headers = ['Content-Type', 'ETag', 'Last-Modified']
+
+# Get the paths of the recorded body and metadata for a URL
+def get_fixture_paths(url):
+    url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    folder_path = base_data_path.joinpath(fixtures_folder_name)
+    return folder_path.joinpath(f"{url_hash}.body"), folder_path.joinpath(f"{url_hash}.json")
+
+# Record the response of every dataset URL that has not been recorded yet
+# Set refresh=True to record them all again. Each URL is recorded on its own, so one that fails does not
+# stop the others (an earlier recording of it is kept). Returns {dataset name: error message} for the failures.
+def record_fixtures(datasets, refresh=False):
+    errors = {}
+    for dataset_name, (file_type, url) in datasets.items():
+        body_path, info_path = get_fixture_paths(url)
+        if info_path.exists() and not refresh:
+            continue
+        info_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = body_path.with_name(body_path.name + '.tmp')
 
-def main():
-     '''Main function to demonstrate module capabilities.''' 
+        try:
+            # A plain GET, so the full body is recorded even if the HTTP cache has this URL
+            with get_http_session().get(url, stream=True) as response:
+                response.raise_for_status()
+                with temp_path.open('wb') as file:
+                    for chunk in response.iter_content(chunk_size=download_chunk_size):
+                        file.write(chunk)
+                headers = {name: response.headers[name] for name in replayed_headers if name in response.headers}
+            os.replace(temp_path, body_path)
+            save_json_atomically(info_path, {'url': url, 'status': response.status_code, 'headers': headers})
+            print(f"Recorded {url}")
+        except Exception as e:
+            temp_path.unlink(missing_ok=True)
+            errors[dataset_name] = f"Recording failed: {e}"
+            print(f"An error occurred while recording {url}: {e}")
+
+    return errors
+
+# Parse a Range header for a body of size bytes: bytes=<first>-<last>, bytes=<first>- or bytes=-<suffix length>
+# Returns (start, end) with end included, or None to send the whole body (no header, a malformed one,
+# or several ranges). Raises ValueError if the range lies outside the body, which is answered with 416.
+def parse_byte_range(range_header, size):
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', range_header or '')
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # The last <suffix length> bytes
+        suffix_length = int(last)
+        if suffix_length == 0 or size == 0:
+            raise ValueError(f"Range {range_header} is not satisfiable for {size} bytes")
+        return max(size - suffix_length, 0), size - 1
+    start = int(first)
+    if last != '' and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(f"Range {range_header} is not satisfiable for {size} bytes")
+    return start, size - 1 if last == '' else min(int(last), size - 1)
+
+# Serve recorded responses, with an optional delay before each response and a bandwidth limit
+# Supports the same conditional (If-None-Match) and Range requests (with or without If-Range) as the real servers
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url_hash = self.path.strip('/').split('/')[0]
+        folder_path = self.server.fixtures_path
+        body_path = folder_path.joinpath(f"{url_hash}.body")
+        info = load_json_or_default(folder_path.joinpath(f"{url_hash}.json"), None)
+        if info is None or not body_path.exists():
+            self.send_error(404, "Not recorded")
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        headers = info['headers']
+        etag = headers.get('ETag')
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        # A Range is ignored (and the whole body sent) when its If-Range no longer matches the recording
+        size = body_path.stat().st_size
+        byte_range = None
+        if_range = self.headers.get('If-Range')
+        if if_range is None or if_range in (etag, headers.get('Last-Modified')):
+            try:
+                byte_range = parse_byte_range(self.headers.get('Range'), size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        start, end = byte_range or (0, size - 1)
+
+        self.send_response(206 if byte_range else 200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(end + 1 - start))
+        if byte_range:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        with body_path.open('rb') as file:
+            file.seek(start)
+            remaining = end + 1 - start
+            while remaining > 0:
+                chunk = file.read(min(16 * 1024, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                if self.server.bandwidth:
+                    time.sleep(len(chunk) / self.server.bandwidth)
+
+# Start the replay server in a background thread
+# latency is in seconds per request, bandwidth in bytes per second (None means unlimited)
+def start_replay_server(latency=0.0, bandwidth=None, port=replay_port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), ReplayRequestHandler)
+    server.daemon_threads = True
+    server.fixtures_path = base_data_path.joinpath(fixtures_folder_name)
+    server.latency = latency
+    server.bandwidth = bandwidth
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Replaying recorded datasets at http://127.0.0.1:{server.server_port}")
+    return server
+
+# Point every dataset at the replay server instead of its real URL
+def get_replay_datasets(server, datasets):
+    replay_datasets = {}
+    for dataset_name, (file_type, url) in datasets.items():
+        url_hash = get_fixture_paths(url)[0].stem
+        file_name = urlsplit(url).path.rsplit('/', 1)[-1]
+        replay_url = f"http://127.0.0.1:{server.server_port}/{url_hash}/{file_name}"
+        replay_datasets[dataset_name] = (file_type, replay_url)
+    return replay_datasets
 
-    # URLs for data
+##############################
+# Main function
+##############################
+
+# URLs for data
 datasets = {
-        "romeo_and_juliet_txt": ('txt', 'https://www.gutenberg.org/cache/epub/1513/pg1513.txt'),
-        "happiness_csv": ('csv', 'https://raw.githubusercontent.com/MainakRepositor/Datasets/master/World%20Happiness%20Data/2020.csv'),
-        "excel_data": ('excel', 'https://github.com/bharathirajatut/sample-excel-dataset/raw/master/cattle.xls'),
-        "json_data": ('json', 'http://api.open-notify.org/astros.json'),
-        "princess_bride_txt": ('txt', 'https://www.evenmere.org/~bts/Random-Collected-Documents/princess_bride.html'),
-        "covid_csv":  ('csv', 'https://raw.githubusercontent.com/datasets/covid-19/main/data/countries-aggregated.csv')
-    }
-    # Folder names and filenames for data
-romeo_and_juliet_txt_folder_path = 'romeo_and_juliet_data-txt'
-happiness_csv_folder_path = 'happiness_data-csv'
-excel_folder_path = 'data-excel'
-json_folder_path = 'data-json'
-princess_bride_folder_path = 'princess_bride-txt'
-covid_folder_path = 'covid-csv'
-
-romeo_and_juliet_txt_filename = 'romeo_and_juliet_data.txt'
-happiness_csv_filename = 'happiness_data.csv'
-excel_filename = 'data.xls'
-json_filename = 'data.json'
-princess_bride_filename = 'princess_bride.txt'
-covid_filename = 'covid.csv'
-
-# Process datasets based on type
-for dataset_name, (file_type, url) in datasets.items():
-        if file_type == 'txt':
-            process_txt_file(dataset_name, f"{dataset_name}.txt", url)
-        elif file_type == 'csv':
-            process_csv_file(dataset_name, f"{dataset_name}.csv", url)
-        elif file_type == 'excel':
-            process_excel_file(dataset_name, f"{dataset_name}.xls", url)
-        elif file_type == 'json':
-            process_json_file(dataset_name, f"{dataset_name}.json", url)
-
-if __name__ == "__main__":
-    main()
+    "romeo_and_juliet_txt": ('txt', 'https://www.gutenberg.org/cache/epub/1513/pg1513.txt'),
+    "happiness_csv": ('csv', 'https://raw.githubusercontent.com/MainakRepositor/Datasets/master/World%20Happiness%20Data/2020.csv'),
+    "excel_data": ('excel', 'https://github.com/bharathirajatut/sample-excel-dataset/raw/master/cattle.xls'),
+    "json_data": ('json', 'http://api.open-notify.org/astros.json'),
+    "princess_bride_txt": ('txt', 'https://www.evenmere.org/~bts/Random-Collected-Documents/princess_bride.html'),
+    "covid_csv":  ('csv', 'https://raw.githubusercontent.com/datasets/covid-19/main/data/countries-aggregated.csv')
+}
+
+def main(concurrent=True, replay=False, latency=0.0, bandwidth=None):
+    '''Main function to demonstrate module capabilities.''' 
+
+    # Serve every dataset from recorded copies (recording any that are missing first)
+    replay_server = None
+    run_datasets = datasets
+    if replay:
+        # Datasets that could not be recorded are listed and left out of the run
+        recording_errors = record_fixtures(datasets)
+        for dataset_name, error in recording_errors.items():
+            print(f"{dataset_name}: {error}")
+        replay_server = start_replay_server(latency, bandwidth)
+        run_datasets = get_replay_datasets(replay_server, {
+            dataset_name: dataset for dataset_name, dataset in datasets.items() if dataset_name not in recording_errors
+        })
+
+    if concurrent:
+        # Download all datasets at once and analyze them in worker processes
+        errors = process_datasets_concurrently(run_datasets)
+        for dataset_name in run_datasets:
+            print(f"{dataset_name}: {errors.get(dataset_name, 'OK')}")
+    else:
+        # Process datasets one at a time based on type
+        for dataset_name, (file_type, url) in run_datasets.items():
+            filename = get_dataset_filename(dataset_name, file_type, url)
+            if file_type == 'txt':
+                process_txt_file(dataset_name, filename, url)
+            elif file_type == 'csv':
+                process_csv_file(dataset_name, filename, url)
+            elif file_type == 'excel':
+                process_excel_file(dataset_name, filename, url)
+            elif file_type == 'json':
+                process_json_file(dataset_name, filename, url)
+
+    if replay_server:
+        replay_server.shutdown()
+        replay_server.server_close()
+
+    # Add new or changed text datasets to the inverted index
+    update_txt_index()
+
+    # Wait for the charts that are still being rendered in the background
+    wait_for_charts()
 
 #####################################
 # Conditional Execution
 #####################################
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,364 @@
+'''
+Micro-benchmarks for the analytics pipeline in bethspornitz_analytics.py.
+Each benchmark runs against the data already saved under data/ so results do not depend on the network.
+ '''
+# Standard library imports
+import os
+import re
+import time
+import pathlib
+import tempfile
+import timeit
+import tracemalloc
+from collections import Counter
+
+# External library imports (requires virtual environment)
+import numpy as np
+import pandas as pd
+
+# Local module imports
+import bethspornitz_analytics
+
+
+###############################
+# Declare global variables
+###############################
+
+# Text datasets already saved under data/txt
+txt_benchmark_datasets = ['romeo_and_juliet_txt', 'princess_bride_txt']
+
+# How many times each timing is repeated (the fastest run is reported)
+benchmark_repeat = 5
+
+# Sizes of the large HTML documents, as copies of the princess_bride_txt page
+html_document_copies = [1, 8, 32, 128]
+
+# Network conditions for the replayed pipeline: (seconds of latency per request, bytes per second or None)
+replay_network_conditions = [(0.0, None), (0.05, 1024 * 1024), (0.2, 256 * 1024)]
+
+# Corpus sizes for the scaling benchmarks, as copies of the romeo_and_juliet_txt text
+scaling_corpus_copies = [1, 2, 4, 8, 16]  # at most 26 (one per letter shift)
+
+# Sizes of the generated covid-like tables (rows), the number of countries in them,
+# and the rows per chunk for the streaming aggregation
+covid_benchmark_rows = [10000, 100000, 1000000]
+covid_benchmark_countries = 200
+covid_benchmark_chunk_size = 100000
+
+# Number of histograms saved by the chart benchmark
+chart_benchmark_count = 20
+
+
+##############################
+# Helpers
+##############################
+
+# Time a function and return the fastest time per call in seconds
+def time_call(func, number=10, repeat=benchmark_repeat):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+# Run a function once and return (result, seconds, peak traced memory in bytes)
+def measure_call(func):
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+# Read a saved text dataset into memory
+def read_txt_dataset(dataset_name):
+    file_path = bethspornitz_analytics.base_data_path.joinpath('txt', dataset_name, f"{dataset_name}.txt")
+    with open(file_path, 'r', encoding='utf-8', newline='') as file:
+        return file.read()
+
+
+##############################
+# TXT tokenizer
+##############################
+
+# The chained cleanup process_txt_file used before the single-pass tokenizer (kept as the baseline)
+def legacy_count_words(text_data):
+    text_data = text_data.replace('-', ' ').replace('/', ' ')
+    clean_text = re.sub(r'[^A-Za-z\s]', '', text_data).lower()
+    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+    words = clean_text.split()
+    letter_count = sum(1 for char in text_data if char.isalpha())
+    return len(words), Counter(words), letter_count
+
+# The current single-pass tokenizer
+def tokenizer_count_words(text_data):
+    words, letter_count = bethspornitz_analytics.tokenize_txt_text(text_data)
+    return len(words), Counter(words), letter_count
+
+# Compare the legacy cleanup with the single-pass tokenizer on each saved text dataset
+def benchmark_txt_tokenizer():
+    print("\nTXT tokenizer: legacy cleanup vs single-pass tokenizer")
+    for dataset_name in txt_benchmark_datasets:
+        text_data = read_txt_dataset(dataset_name)
+
+        # Make sure both versions agree before timing them
+        if legacy_count_words(text_data) != tokenizer_count_words(text_data):
+            print(f"{dataset_name}: results differ, skipping timing")
+            continue
+
+        legacy_time = time_call(lambda: legacy_count_words(text_data))
+        tokenizer_time = time_call(lambda: tokenizer_count_words(text_data))
+        print(
+            f"{dataset_name}: {len(text_data)} chars, "
+            f"legacy {legacy_time * 1000:.2f} ms, "
+            f"tokenizer {tokenizer_time * 1000:.2f} ms, "
+            f"speedup {legacy_time / tokenizer_time:.2f}x"
+        )
+
+
+##############################
+# TXT n-grams
+##############################
+
+# Translation table that shifts every letter by a number of places (a -> b -> c ...)
+def letter_shift_table(shift):
+    lower = 'abcdefghijklmnopqrstuvwxyz'
+    upper = lower.upper()
+    shift %= 26
+    return str.maketrans(lower + upper, lower[shift:] + lower[:shift] + upper[shift:] + upper[:shift])
+
+# Yield the text in chunks, repeated to make a larger corpus without holding it all in memory
+# With shift_letters=True each copy has its letters shifted, so the vocabulary grows
+# with the corpus like it would with new documents
+def repeat_txt_chunks(text_data, copies, chunk_size=64 * 1024, shift_letters=True):
+    for copy in range(copies):
+        table = letter_shift_table(copy if shift_letters else 0)
+        for start in range(0, len(text_data), chunk_size):
+            yield text_data[start:start + chunk_size].translate(table)
+        yield '\n'
+
+# Count trigrams exactly or approximately over a repeated corpus
+def count_corpus_trigrams(text_data, copies, approximate):
+    word_batches = (words for words, letter_count in bethspornitz_analytics.split_words_in_chunks(repeat_txt_chunks(text_data, copies)))
+    ngram_batches = bethspornitz_analytics.iter_ngram_batches(word_batches, 3)
+    if approximate:
+        return bethspornitz_analytics.count_ngrams_approximate(ngram_batches)[0]
+    return bethspornitz_analytics.count_ngrams_exact(ngram_batches)[0]
+
+# Show how time and peak memory of exact and approximate trigram counting change with corpus size
+def benchmark_ngrams():
+    print("\nTXT trigrams: exact Counter vs Count-Min sketch as the corpus grows")
+    text_data = read_txt_dataset('romeo_and_juliet_txt')
+    for copies in scaling_corpus_copies:
+        for approximate in (False, True):
+            total, seconds, peak = measure_call(lambda: count_corpus_trigrams(text_data, copies, approximate))
+            mode = 'approximate' if approximate else 'exact'
+            print(
+                f"{copies:>3} copies, {mode:<11}: {total} trigrams, "
+                f"{total / seconds:,.0f} trigrams/s, peak memory {peak / 1024 / 1024:.1f} MB"
+            )
+
+
+##############################
+# HTML text extraction
+##############################
+
+# Stream a large HTML document through the extractor and the word counter
+def count_html_words(html_data, copies):
+    chunks = bethspornitz_analytics.extract_visible_txt_chunks(repeat_txt_chunks(html_data, copies, shift_letters=False))
+    return bethspornitz_analytics.count_words_in_chunks(chunks)[0]
+
+# Show the throughput and peak memory of streaming HTML extraction on larger and larger documents
+def benchmark_html_extraction():
+    print("\nHTML extraction: streaming visible text into the word counter")
+    html_data = read_txt_dataset('princess_bride_txt')
+    for copies in html_document_copies:
+        size_mb = len(html_data) * copies / 1024 / 1024
+        word_count, seconds, peak = measure_call(lambda: count_html_words(html_data, copies))
+        print(
+            f"{size_mb:>7.1f} MB of HTML: {word_count} words, "
+            f"{size_mb / seconds:.1f} MB/s, peak memory {peak / 1024 / 1024:.1f} MB"
+        )
+
+
+##############################
+# CSV time series (covid_csv rollups)
+##############################
+
+# Generate a covid-like table: one row per country per day with growing running totals
+def make_covid_table(row_count, country_count=covid_benchmark_countries):
+    day_count = max(1, row_count // country_count)
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2020-01-22', periods=day_count).strftime('%Y-%m-%d')
+    table = {
+        'Date': np.tile(dates, country_count),
+        'Country': np.repeat([f"Country {index}" for index in range(country_count)], day_count),
+    }
+    for column in bethspornitz_analytics.covid_value_columns:
+        table[column] = rng.integers(0, 1000, size=(country_count, day_count)).cumsum(axis=1).ravel()
+    return pd.DataFrame(table)
+
+# The straightforward version: a Python loop over countries, one diff and rolling mean each (kept as the baseline)
+def loop_covid_daily(df):
+    results = []
+    for country in df['Country'].unique():
+        rows = df[df['Country'] == country].sort_values('Date')
+        for column in bethspornitz_analytics.covid_value_columns:
+            new_values = rows[column].diff().fillna(rows[column])
+            rows = rows.assign(**{
+                f"New {column}": new_values,
+                f"New {column} Average": new_values.rolling(bethspornitz_analytics.covid_rolling_days, min_periods=1).mean(),
+            })
+        results.append(rows)
+    return pd.concat(results)
+
+# Compare the per-country loop with the vectorized aggregation, whole and in chunks, as the table grows
+def benchmark_covid_aggregation():
+    print("\nCSV time series: per-country loop vs vectorized group-by (whole table and streamed in chunks)")
+    for row_count in covid_benchmark_rows:
+        df = make_covid_table(row_count)
+        chunks = [df.iloc[start:start + covid_benchmark_chunk_size] for start in range(0, len(df), covid_benchmark_chunk_size)]
+        loop_time = time_call(lambda: loop_covid_daily(df), number=1, repeat=1)
+        whole_time = time_call(lambda: bethspornitz_analytics.aggregate_covid_chunks([df]), number=1, repeat=3)
+        chunked_time = time_call(lambda: bethspornitz_analytics.aggregate_covid_chunks(chunks), number=1, repeat=3)
+        print(
+            f"{len(df):>9} rows: loop {loop_time * 1000:.0f} ms, "
+            f"vectorized {whole_time * 1000:.0f} ms ({len(df) / whole_time:,.0f} rows/s), "
+            f"streamed {chunked_time * 1000:.0f} ms ({len(df) / chunked_time:,.0f} rows/s)"
+        )
+
+
+##############################
+# Histograms
+##############################
+
+# The straightforward version: np.histogram once per numeric column (kept as the baseline)
+def loop_column_histograms(df):
+    return {column: np.histogram(df[column].dropna(), bins=10) for column in df.select_dtypes(include=['number']).columns}
+
+# Compare one np.histogram call per column with binning every numeric column in one vectorized pass
+def benchmark_histograms():
+    print("\nHistograms: np.histogram per column vs every numeric column in one pass")
+    for row_count in covid_benchmark_rows:
+        df = make_covid_table(row_count)
+        loop_time = time_call(lambda: loop_column_histograms(df), number=1, repeat=3)
+        vectorized_time = time_call(lambda: bethspornitz_analytics.compute_histograms(df), number=1, repeat=3)
+        print(
+            f"{len(df):>9} rows: per column {loop_time * 1000:.0f} ms, "
+            f"one pass {vectorized_time * 1000:.0f} ms ({len(df) / vectorized_time:,.0f} rows/s)"
+        )
+
+
+##############################
+# Charts
+##############################
+
+# The old way: a new pyplot figure for every histogram (kept as the baseline)
+def pyplot_histograms(file_paths, values):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    for file_path in file_paths:
+        plt.hist(values, bins=10)
+        plt.grid(True)
+        plt.savefig(file_path)
+        plt.close()
+
+# Compare a pyplot figure per chart with the reused figure, and show how long queuing keeps the analysis waiting
+def benchmark_chart_rendering():
+    print("\nCharts: pyplot figure per chart vs one reused figure vs queued to the chart pool")
+    values = np.random.default_rng(0).normal(size=10000)
+    counts, bin_edges = np.histogram(values, bins=10)
+    with tempfile.TemporaryDirectory() as temp_folder:
+        file_paths = [pathlib.Path(temp_folder).joinpath(f"histogram_{index}.png") for index in range(chart_benchmark_count)]
+        pyplot_time = time_call(lambda: pyplot_histograms(file_paths, values), number=1, repeat=3)
+        reused_time = time_call(lambda: [bethspornitz_analytics.render_histogram_chart(file_path, counts, bin_edges) for file_path in file_paths], number=1, repeat=3)
+
+        start = time.perf_counter()
+        for file_path in file_paths:
+            bethspornitz_analytics.queue_histogram_chart(file_path, counts, bin_edges)
+        queue_time = time.perf_counter() - start
+        bethspornitz_analytics.wait_for_charts()
+        pool_time = time.perf_counter() - start
+
+    print(
+        f"{chart_benchmark_count} histograms: pyplot {pyplot_time * 1000:.0f} ms, "
+        f"reused figure {reused_time * 1000:.0f} ms, "
+        f"chart pool {pool_time * 1000:.0f} ms of which {queue_time * 1000:.1f} ms on the analysis path"
+    )
+
+
+##############################
+# Full pipeline (recorded datasets)
+##############################
+
+# Run the whole pipeline once in an empty working folder, so every dataset is downloaded in full
+def run_pipeline_in_empty_folder(run_datasets, concurrent):
+    original_cwd = os.getcwd()
+    original_data_path = bethspornitz_analytics.base_data_path
+    with tempfile.TemporaryDirectory() as temp_folder:
+        # Worker processes find data/ from the working folder, so change it as well as the module setting
+        os.chdir(temp_folder)
+        bethspornitz_analytics.base_data_path = pathlib.Path(temp_folder).joinpath('data')
+        try:
+            start = time.perf_counter()
+            if concurrent:
+                errors = bethspornitz_analytics.process_datasets_concurrently(run_datasets)
+            else:
+                errors = {}
+                for dataset_name, (file_type, url) in run_datasets.items():
+                    file_path = bethspornitz_analytics.download_dataset(dataset_name, file_type, url)
+                    bethspornitz_analytics.analyze_dataset(dataset_name, file_type, file_path)
+            return time.perf_counter() - start, errors
+        finally:
+            os.chdir(original_cwd)
+            bethspornitz_analytics.base_data_path = original_data_path
+
+# Time the full pipeline offline against recorded responses under different network conditions
+# The first run records every dataset URL (this needs the network once)
+def benchmark_pipeline_replay():
+    print("\nFull pipeline: replayed datasets, sequential vs concurrent")
+    datasets = bethspornitz_analytics.datasets
+    errors = bethspornitz_analytics.record_fixtures(datasets)
+    if errors:
+        print(f"Skipped: datasets are not recorded yet and could not be fetched ({errors})")
+        return
+
+    for latency, bandwidth in replay_network_conditions:
+        server = bethspornitz_analytics.start_replay_server(latency, bandwidth, port=0)
+        try:
+            run_datasets = bethspornitz_analytics.get_replay_datasets(server, datasets)
+            sequential_time, sequential_errors = run_pipeline_in_empty_folder(run_datasets, concurrent=False)
+            concurrent_time, concurrent_errors = run_pipeline_in_empty_folder(run_datasets, concurrent=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        bandwidth_label = f"{bandwidth / 1024:.0f} KB/s" if bandwidth else "unlimited"
+        print(
+            f"latency {latency * 1000:.0f} ms, bandwidth {bandwidth_label}: "
+            f"sequential {sequential_time:.2f} s, concurrent {concurrent_time:.2f} s"
+            + (f", errors {concurrent_errors}" if concurrent_errors else "")
+        )
+
+
+##############################
+# Main function
+##############################
+
+def main():
+    '''Run every benchmark and print the results.'''
+    benchmark_txt_tokenizer()
+    benchmark_ngrams()
+    benchmark_html_extraction()
+    benchmark_covid_aggregation()
+    benchmark_histograms()
+    benchmark_chart_rendering()
+    benchmark_pipeline_replay()
+
+#####################################
+# Conditional Execution
+#####################################
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1337 @@
+'''
+Tests for bethspornitz_analytics.py.
+Each test checks a streaming, chunked or cached result against the straightforward whole-input answer,
+using temporary data folders (and local servers) so no network is needed. Run with: python -m pytest
+ '''
+# Standard library imports
+import bz2
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import pathlib
+import random
+import re
+import shutil
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# External library imports (requires virtual environment)
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+
+# Local module imports
+import bethspornitz_analytics
+
+
+###############################
+# Helpers
+###############################
+
+# Sizes the inputs are cut into (None keeps the input in one piece)
+chunk_sizes = [1, 2, 3, 7, 64, None]
+
+# Cut a string or list into pieces of chunk_size items
+def split_into_chunks(data, chunk_size):
+    if chunk_size is None:
+        return [data]
+    return [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+# The text cleanup process_txt_file used before text was read in chunks (the reference for its results)
+def legacy_txt_words(text_data):
+    text_data = text_data.replace('-', ' ').replace('/', ' ')
+    clean_text = re.sub(r'[^A-Za-z\s]', '', text_data).lower()
+    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+    return clean_text.split()
+
+# Word count, word frequencies and letter count of a text, the way process_txt_file used to count them
+def legacy_txt_counts(text_data):
+    words = legacy_txt_words(text_data)
+    letter_count = sum(1 for char in text_data if char.isalpha())
+    return len(words), Counter(words), letter_count
+
+# ETag the test server gives a body
+def http_etag(body):
+    return f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+# Status of a plain GET with the given headers
+def get_http_status(url, headers):
+    with requests.get(url, headers=headers, stream=True) as response:
+        return response.status_code
+
+# Serves the bodies in server.files with an ETag, answers If-None-Match with 304, and records every request
+# Range requests ("bytes=<start>-") get a 206 while If-Range still matches; server.cut_after[path] = n
+# drops the connection after n bytes of the next response for that path
+class DatasetRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = http_etag(body)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        start = 0
+        range_match = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if range_match and self.headers.get('If-Range', etag) == etag:
+            start = int(range_match.group(1))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(body)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+
+        cut_after = self.server.cut_after.pop(self.path, None)
+        self.wfile.write(body[start:start + cut_after] if cut_after is not None else body[start:])
+        if cut_after is not None:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+# Start a local HTTP server for one test; server.url(path) gives the address of a file in server.files
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DatasetRequestHandler)
+    server.files = {}
+    server.requests = []
+    server.cut_after = {}
+    server.url = lambda path: f"http://127.0.0.1:{server.server_port}{path}"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+csv_sample = "Country,Score,Rank,Region\n" + "".join(
+    f"Country {index},{(index * 37) % 101 / 10},{index},Region {index % 4}\n" for index in range(200)
+)
+
+json_sample = json.dumps({
+    'message': 'success',
+    'number': 3,
+    'people': [
+        {'name': 'Ann', 'craft': 'ISS'},
+        {'name': 'Bo \u00e9', 'craft': 'Tiangong'},
+        {'name': 'Cy', 'craft': 'ISS'},
+    ],
+})
+
+# Put a text, a CSV and a JSON dataset on the test server and return them the way main() lists datasets
+def serve_sample_datasets(http_server):
+    http_server.files['/sample.txt'] = (txt_sample * 20).encode('utf-8')
+    http_server.files['/sample.csv'] = csv_sample.encode('utf-8')
+    http_server.files['/sample.json'] = json_sample.encode('utf-8')
+    return {
+        'sample_txt': ('txt', http_server.url('/sample.txt')),
+        'sample_csv': ('csv', http_server.url('/sample.csv')),
+        'sample_json': ('json', http_server.url('/sample.json')),
+    }
+
+# The text reports written under a data folder, by path
+def read_reports(folder_path):
+    return {
+        file_path.relative_to(folder_path).as_posix(): file_path.read_bytes()
+        for file_path in sorted(folder_path.rglob('*.txt'))
+    }
+
+# Point the module at an empty data folder for one test
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('data'))
+    return tmp_path.joinpath('data')
+
+
+###############################
+# TXT
+###############################
+
+txt_sample = (
+    "It was the best of times -- it was the worst/of times!\r\n"
+    "Don't   count 42 numbers, e-mail or under_scores.\tCafé naïve façade and spaces ß\n"
+    "WORDS words Words... end"
+)
+
+# Counting a text in chunks gives the same words, frequencies and letters as cleaning it whole
+@pytest.mark.parametrize('chunk_size', chunk_sizes)
+def test_chunked_word_counts_match_whole_text(chunk_size):
+    chunks = split_into_chunks(txt_sample, chunk_size)
+    assert bethspornitz_analytics.count_words_in_chunks(chunks) == legacy_txt_counts(txt_sample)
+
+# A saved text file is analyzed in chunks into the same report as the whole text
+def test_analyze_local_txt_file(data_path):
+    folder_path = bethspornitz_analytics.create_folder('txt', 'sample')
+    folder_path.joinpath('sample.txt').write_text(txt_sample * 50, encoding='utf-8', newline='')
+    analysis = bethspornitz_analytics.analyze_local_txt_file('sample', 'sample.txt', chunk_size=10)
+    assert analysis == bethspornitz_analytics.format_txt_analysis(*legacy_txt_counts(txt_sample * 50))
+    assert folder_path.joinpath('analysis_sample.txt').read_text(encoding='utf-8') == analysis
+
+# The single-pass tokenizer gives the same words and letter count as the original regex cleanup
+@pytest.mark.parametrize('text', [
+    txt_sample,
+    '',
+    '   \n\t  ',
+    'naïve café über-straße/ĳ 東京 — ok',
+    "tab\tnew\nline\rcarriage\x0bvertical\x0cfeed\x1cseparators line",
+    "1234 !!! ??? ___ ...",
+])
+def test_tokenizer_matches_legacy_cleanup(text):
+    word_count, word_freq, letter_count = legacy_txt_counts(text)
+    words, tokenizer_letter_count = bethspornitz_analytics.tokenize_txt_text(text)
+    assert (len(words), Counter(words), tokenizer_letter_count) == (word_count, word_freq, letter_count)
+
+# A corpus gives the same per-document and merged counts with one worker and with several
+def test_corpus_counts_same_for_any_number_of_workers(data_path):
+    folder_path = bethspornitz_analytics.create_folder('txt', 'corpus')
+    documents = [txt_sample * (index + 1) + f" document{'x' * index}" for index in range(6)]
+    for index, document in enumerate(documents):
+        folder_path.joinpath(f"doc_{index}.txt").write_text(document, encoding='utf-8', newline='')
+    file_paths = bethspornitz_analytics.find_txt_files(folder_path)
+
+    sequential = bethspornitz_analytics.process_txt_corpus('corpus', file_paths, workers=1, chunk_size=16)
+    parallel = bethspornitz_analytics.process_txt_corpus('corpus', file_paths, workers=2, chunk_size=16)
+    assert parallel == sequential
+
+    document_counts, corpus_counts = bethspornitz_analytics.count_words_in_corpus(file_paths, workers=2)
+    assert list(document_counts.values()) == [legacy_txt_counts(document) for document in documents]
+    assert corpus_counts == legacy_txt_counts(' '.join(documents))
+
+# The top k words equal the head of a full stable sort, and of an alphabetical sort with alphabetical_ties=True
+@pytest.mark.parametrize('k', [0, 1, 3, 10, 1000])
+def test_top_k_words_match_sorted(k):
+    rng = random.Random(k)
+    word_freq = Counter({f"w{rng.randrange(10 ** 6)}": rng.randrange(1, 6) for _ in range(300)})
+    assert bethspornitz_analytics.top_k_words(word_freq, k) == sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:k]
+    assert bethspornitz_analytics.top_k_words(word_freq, k, alphabetical_ties=True) == sorted(word_freq.items(), key=lambda x: (-x[1], x[0]))[:k]
+
+# Write a text dataset where process_txt_file would save it
+def write_txt_dataset(dataset_name, text):
+    folder_path = bethspornitz_analytics.create_folder('txt', dataset_name)
+    folder_path.joinpath(f"{dataset_name}.txt").write_text(text, encoding='utf-8', newline='')
+
+# Counts saved against the shared vocabulary load back as the same words and frequencies,
+# also for datasets counted before the vocabulary grew
+def test_vocabulary_counts_round_trip(data_path):
+    texts = {'first': txt_sample, 'second': 'words only in the second text, and words'}
+    for dataset_name, text in texts.items():
+        write_txt_dataset(dataset_name, text)
+    bethspornitz_analytics.process_txt_vocabulary(['first'], chunk_size=8)
+    bethspornitz_analytics.process_txt_vocabulary(['second'], chunk_size=8)
+
+    vocabulary, matrix = bethspornitz_analytics.load_word_count_matrix(list(texts))
+    for row, text in zip(matrix, texts.values()):
+        word_freq = Counter({vocabulary['words'][word_id]: int(count) for word_id, count in enumerate(row) if count})
+        assert word_freq == legacy_txt_counts(text)[1]
+
+    analysis = bethspornitz_analytics.compare_txt_datasets('first', 'second')
+    first_words, second_words = (set(legacy_txt_counts(text)[1]) for text in texts.values())
+    assert f"Shared Words Count: {len(first_words & second_words)}\n" in analysis
+    assert f"Words Only in first: {len(first_words - second_words)}\n" in analysis
+    assert f"Words Only in second: {len(second_words - first_words)}\n" in analysis
+
+# Word positions of every occurrence of a term, from the original cleanup
+def legacy_positions(text, term):
+    return [position for position, word in enumerate(legacy_txt_words(text)) if word == term]
+
+# The index answers term, phrase and prefix searches, and only re-reads documents that changed
+def test_txt_index_search(data_path):
+    texts = {'first': txt_sample, 'second': 'it was the end of the worst words ever, it was'}
+    for dataset_name, text in texts.items():
+        write_txt_dataset(dataset_name, text)
+    assert bethspornitz_analytics.update_txt_index(chunk_size=8) == 2
+    assert bethspornitz_analytics.update_txt_index(chunk_size=8) == 0
+
+    assert bethspornitz_analytics.search_txt_term('Words') == {
+        f"txt/{name}/{name}.txt": legacy_positions(text, 'words') for name, text in texts.items()
+    }
+    assert bethspornitz_analytics.search_txt_term('missing') == {}
+    assert bethspornitz_analytics.search_txt_phrase('it was the') == {
+        'txt/first/first.txt': [0, 6], 'txt/second/second.txt': [0],
+    }
+    assert bethspornitz_analytics.search_txt_prefix('wor') == {
+        'words': {'txt/first/first.txt': 3, 'txt/second/second.txt': 1},
+        'worst': {'txt/first/first.txt': 1, 'txt/second/second.txt': 1},
+    }
+
+    data_path.joinpath('txt', 'second', 'second.txt').write_text('no match here at all', encoding='utf-8')
+    data_path.joinpath('txt', 'first', 'first.txt').unlink()
+    assert bethspornitz_analytics.update_txt_index() == 1
+    assert bethspornitz_analytics.search_txt_term('words') == {}
+
+html_sample = (
+    "<!DOCTYPE html><html><head><title>Hidden title</title><style>p { color: red; }</style>"
+    "<script>var hidden = '<p>not text</p>';</script></head>"
+    "<body><h1>Visible&nbsp;heading</h1><p>First<br>line &amp; more</p><!-- a comment -->"
+    "<div>word<b>bold</b>joined</div><ul><li>one</li><li>two</li></ul></body></html>"
+)
+
+# Only the visible text of an HTML page is counted, whatever the chunk size
+@pytest.mark.parametrize('chunk_size', chunk_sizes)
+def test_html_visible_text(chunk_size):
+    chunks = split_into_chunks(html_sample, chunk_size)
+    text = ''.join(bethspornitz_analytics.extract_visible_txt_chunks(chunks))
+    assert text.split() == ['Visible', 'heading', 'First', 'line', '&', 'more', 'wordboldjoined', 'one', 'two']
+    assert bethspornitz_analytics.count_words_in_chunks(bethspornitz_analytics.extract_visible_txt_chunks(chunks)) == legacy_txt_counts(text)
+
+# Plain text is passed through unchanged, even when it mentions tags
+def test_plain_text_is_not_treated_as_html():
+    text = "Use the <p> tag for paragraphs.\n" + txt_sample
+    assert ''.join(bethspornitz_analytics.extract_visible_txt_chunks(split_into_chunks(text, 3))) == text
+    assert ''.join(bethspornitz_analytics.extract_visible_txt_chunks([html_sample], html=False)) == html_sample
+
+
+###############################
+# TXT n-grams
+###############################
+
+# Cut a list of words into batches of random sizes between smallest and largest
+def split_into_random_batches(words, rng, smallest, largest):
+    batches = []
+    start = 0
+    while start < len(words):
+        size = rng.randint(smallest, largest)
+        batches.append(words[start:start + size])
+        start += size
+    return batches
+
+# The n-grams of every word in one list, counted directly
+def count_ngrams_directly(words, n):
+    return Counter(' '.join(words[index:index + n]) for index in range(len(words) - n + 1))
+
+# n-grams that span two batches are counted once, the same as over the whole word list
+@pytest.mark.parametrize('n', [1, 2, 3, 4, 5])
+def test_ngrams_across_batches(n):
+    rng = random.Random(n)
+    words = [rng.choice('abcdef') for _ in range(2000)]
+    expected = count_ngrams_directly(words, n)
+
+    for _ in range(20):
+        batches = split_into_random_batches(words, rng, max(1, n - 1), 50)
+        total, ngram_freq = bethspornitz_analytics.count_ngrams_exact(bethspornitz_analytics.iter_ngram_batches(batches, n))
+        assert (total, ngram_freq) == (sum(expected.values()), expected)
+
+# Count-Min estimates are never below the true counts, and merged sketches equal one sketch over all items
+def test_count_min_sketch_estimates_and_merge():
+    rng = random.Random(7)
+    words = [f"w{int(rng.paretovariate(1.2))}" for _ in range(5000)]
+    word_freq = Counter(words)
+    halves = [Counter(words[:2500]), Counter(words[2500:])]
+
+    sketches = []
+    for half in halves:
+        sketch = bethspornitz_analytics.create_count_min_sketch(epsilon=0.01, delta=0.01)
+        bethspornitz_analytics.update_count_min_sketch(sketch, list(half), list(half.values()))
+        sketches.append(sketch)
+    merged = bethspornitz_analytics.merge_count_min_sketches(sketches)
+
+    whole = bethspornitz_analytics.create_count_min_sketch(epsilon=0.01, delta=0.01)
+    bethspornitz_analytics.update_count_min_sketch(whole, list(word_freq), list(word_freq.values()))
+    assert (merged['table'] == whole['table']).all() and merged['total'] == whole['total'] == len(words)
+
+    estimates = bethspornitz_analytics.query_count_min_sketch(merged, list(word_freq)).tolist()
+    errors = [estimate - freq for estimate, freq in zip(estimates, word_freq.values())]
+    assert min(errors) >= 0
+    assert sum(error > 0.01 * len(words) for error in errors) <= 0.01 * len(errors) + 1
+
+# The exact and approximate reports list the same top bigrams when the sketch is large enough
+def test_process_txt_ngrams(data_path):
+    write_txt_dataset('sample', txt_sample * 20)
+    exact = bethspornitz_analytics.process_txt_ngrams('sample', 'sample.txt', n_values=(2,), top_k=3, chunk_size=16)
+    approximate = bethspornitz_analytics.process_txt_ngrams('sample', 'sample.txt', n_values=(2,), top_k=3, approximate=True, chunk_size=16)
+    expected = bethspornitz_analytics.top_k_words(count_ngrams_directly(legacy_txt_words(txt_sample * 20), 2), 3)
+    for ngram, freq in expected:
+        assert f"{ngram}: {freq}\n" in exact
+        assert f"{ngram}: {freq}\n" in approximate
+
+# n-grams are still counted across batches shorter than n - 1 words, and across empty ones
+@pytest.mark.parametrize('n', [2, 3, 4, 5])
+def test_ngrams_across_short_batches(n):
+    rng = random.Random(n)
+    words = [rng.choice('abcdef') for _ in range(2000)]
+    expected = count_ngrams_directly(words, n)
+
+    for _ in range(20):
+        batches = split_into_random_batches(words, rng, 0, 4)
+        total, ngram_freq = bethspornitz_analytics.count_ngrams_exact(bethspornitz_analytics.iter_ngram_batches(batches, n))
+        assert (total, ngram_freq) == (sum(expected.values()), expected)
+
+
+###############################
+# HTTP
+###############################
+
+# A second download of an unchanged file sends its ETag, gets 304 and reuses the saved file
+def test_unchanged_download_is_not_transferred_again(data_path, http_server):
+    http_server.files['/sample.txt'] = txt_sample.encode('utf-8')
+    url = http_server.url('/sample.txt')
+    analysis_path = data_path.joinpath('txt', 'sample', 'analysis_sample.txt')
+    for _ in range(2):
+        bethspornitz_analytics.process_txt_file('sample', 'sample.txt', url)
+        assert analysis_path.read_text(encoding='utf-8') == bethspornitz_analytics.format_txt_analysis(*legacy_txt_counts(txt_sample))
+        analysis_path.unlink()
+    assert 'If-None-Match' not in http_server.requests[0][1]
+    assert 'If-None-Match' in http_server.requests[1][1]
+
+    # A changed file on the server is downloaded again
+    http_server.files['/sample.txt'] = b'a changed text'
+    bethspornitz_analytics.process_txt_file('sample', 'sample.txt', url, streaming=True)
+    assert data_path.joinpath('txt', 'sample', 'sample.txt').read_bytes() == b'a changed text'
+
+# CSV downloads are revalidated too, but only while the saved file still has the size that was recorded
+def test_conditional_get_checks_saved_file(data_path, http_server):
+    body = b'a,b\n1,2\n3,4\n'
+    http_server.files['/data.csv'] = body
+    url = http_server.url('/data.csv')
+    folder_path = bethspornitz_analytics.create_folder('csv', 'data')
+
+    file_path = bethspornitz_analytics.fetch_and_write_csv_file(folder_path, 'data.csv', url)
+    assert bethspornitz_analytics.fetch_and_write_csv_file(folder_path, 'data.csv', url) == file_path
+    assert 'If-None-Match' in http_server.requests[1][1]
+
+    file_path.write_bytes(b'a,b\n')
+    bethspornitz_analytics.fetch_and_write_csv_file(folder_path, 'data.csv', url)
+    assert 'If-None-Match' not in http_server.requests[2][1]
+    assert file_path.read_bytes() == body
+
+###############################
+# Concurrent pipeline
+###############################
+
+# Downloading and analyzing the datasets concurrently writes the same reports as processing them one at a time
+def test_concurrent_pipeline_matches_sequential(tmp_path, monkeypatch, http_server):
+    datasets = serve_sample_datasets(http_server)
+
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('sequential'))
+    for dataset_name, (file_type, url) in datasets.items():
+        extension = bethspornitz_analytics.dataset_file_extensions[file_type]
+        process = getattr(bethspornitz_analytics, f"process_{file_type}_file")
+        process(dataset_name, f"{dataset_name}.{extension}", url)
+
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('concurrent'))
+    datasets['missing_csv'] = ('csv', http_server.url('/missing.csv'))
+    errors = bethspornitz_analytics.process_datasets_concurrently(datasets, analysis_workers=2)
+    assert list(errors) == ['missing_csv'] and errors['missing_csv'].startswith('Download failed: 404')
+
+    assert read_reports(tmp_path.joinpath('concurrent')) == read_reports(tmp_path.joinpath('sequential'))
+    assert len(read_reports(tmp_path.joinpath('sequential'))) == 4
+
+# Worker processes see settings changed at runtime, not the defaults of a fresh import
+def test_worker_processes_see_runtime_settings(tmp_path, monkeypatch, http_server):
+    changed = {
+        'base_data_path': tmp_path.joinpath('data'),
+        'columnar_cache_enabled': False,
+        'pipeline_csv_chunk_size': 7,
+        'quantile_sketch_k': 64,
+        'distinct_sketch_precision': 9,
+    }
+    for name, value in changed.items():
+        monkeypatch.setattr(bethspornitz_analytics, name, value)
+    with bethspornitz_analytics.create_process_pool(1) as executor:
+        settings = executor.submit(bethspornitz_analytics.get_worker_settings).result()
+    assert settings == bethspornitz_analytics.get_worker_settings()
+    assert {name: settings[name] for name in changed} == changed
+
+    # The pipeline's workers write under the changed data folder, in chunks, without a columnar cache
+    datasets = serve_sample_datasets(http_server)
+    csv_dataset = {'sample_csv': datasets['sample_csv']}
+    assert bethspornitz_analytics.process_datasets_concurrently(csv_dataset, analysis_workers=1) == {}
+    folder_path = tmp_path.joinpath('data', 'csv', 'sample_csv')
+    assert not list(folder_path.glob('*.columns'))
+    pipeline_reports = read_reports(tmp_path.joinpath('data'))
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('direct'))
+    bethspornitz_analytics.analyze_csv_file('sample_csv', folder_path.joinpath('sample_csv.csv'), chunk_size=7)
+    assert len(pipeline_reports) == 1 and pipeline_reports == read_reports(tmp_path.joinpath('direct'))
+
+# An interrupted download resumes from the bytes already saved, and restarts if the file changed meanwhile
+def test_interrupted_download_resumes(data_path, http_server):
+    body = random.Random(11).randbytes(300000)
+    http_server.files['/data.bin'] = body
+    http_server.cut_after['/data.bin'] = 100000
+    file_path = bethspornitz_analytics.create_folder('csv', 'data').joinpath('data.bin')
+    part_path = file_path.with_name('data.bin.part')
+
+    with pytest.raises(requests.RequestException):
+        bethspornitz_analytics.download_file(http_server.url('/data.bin'), file_path)
+    saved_size = part_path.stat().st_size
+    assert 0 < saved_size <= 100000 and not file_path.exists()
+
+    bethspornitz_analytics.download_file(http_server.url('/data.bin'), file_path)
+    assert http_server.requests[-1][1]['Range'] == f"bytes={saved_size}-"
+    assert file_path.read_bytes() == body and not part_path.exists()
+
+    # A new version on the server fails If-Range, so the download starts over
+    file_path.unlink()
+    http_server.cut_after['/data.bin'] = 100000
+    with pytest.raises(requests.RequestException):
+        bethspornitz_analytics.download_file(http_server.url('/data.bin'), file_path)
+    http_server.files['/data.bin'] = body[::-1]
+    bethspornitz_analytics.download_file(http_server.url('/data.bin'), file_path)
+    assert file_path.read_bytes() == body[::-1]
+
+# A saved part that already holds the whole body gets a 416, and the download starts over
+def test_complete_part_restarts_download(data_path, http_server):
+    body = random.Random(12).randbytes(5000)
+    http_server.files['/data.bin'] = body
+    url = http_server.url('/data.bin')
+    file_path = bethspornitz_analytics.create_folder('csv', 'data').joinpath('data.bin')
+    file_path.with_name('data.bin.part').write_bytes(body)
+    file_path.with_name('data.bin.part.json').write_text(json.dumps({'url': url, 'etag': http_etag(body)}), encoding='utf-8')
+
+    bethspornitz_analytics.download_file(url, file_path)
+    assert file_path.read_bytes() == body
+    assert [headers.get('Range') for path, headers in http_server.requests] == ['bytes=5000-', None]
+    assert sorted(path.name for path in file_path.parent.iterdir()) == ['data.bin']
+
+# After a 304 a download yields nothing and leaves the saved file alone; iter_download_chunks yields the saved file,
+# and text datasets of the pipeline are revalidated the same way
+def test_not_modified_download(data_path, http_server):
+    datasets = serve_sample_datasets(http_server)
+    url = datasets['sample_csv'][1]
+    file_path = bethspornitz_analytics.create_folder('csv', 'sample_csv').joinpath('sample_csv.csv')
+    assert b''.join(bethspornitz_analytics.stream_download(url, file_path)) == http_server.files['/sample.csv']
+    assert list(bethspornitz_analytics.stream_download(url, file_path)) == []
+    assert http_server.requests[-1][1]['If-None-Match'] == http_etag(http_server.files['/sample.csv'])
+    assert b''.join(bethspornitz_analytics.iter_download_chunks(url, file_path)) == http_server.files['/sample.csv']
+
+    for _ in range(2):
+        txt_path = bethspornitz_analytics.download_dataset('sample_txt', *datasets['sample_txt'])
+        assert txt_path.read_bytes() == http_server.files['/sample.txt']
+    assert 'If-None-Match' in http_server.requests[-1][1]
+
+# A CSV parsed while it downloads gives the same report as one parsed after the download, and is saved whole
+def test_streamed_csv_matches_downloaded(tmp_path, monkeypatch, http_server):
+    http_server.files['/sample.csv'] = csv_sample.encode('utf-8')
+    for streaming in (False, True):
+        monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath(str(streaming)))
+        bethspornitz_analytics.process_csv_file('sample', 'sample.csv', http_server.url('/sample.csv'), streaming=streaming)
+    assert read_reports(tmp_path.joinpath('True')) == read_reports(tmp_path.joinpath('False'))
+    assert tmp_path.joinpath('True', 'csv', 'sample', 'sample.csv').read_text(encoding='utf-8') == csv_sample
+
+###############################
+# Artifact store
+###############################
+
+# Identical contents are stored once, and every version of a file can be listed and restored
+def test_artifact_store_dedupes_and_restores(data_path):
+    folder_path = bethspornitz_analytics.create_folder('csv', 'sample')
+    file_path = folder_path.joinpath('sample.csv')
+    copy_path = folder_path.joinpath('copy.csv')
+
+    digests = []
+    for version in (b'first', b'second', b'first'):
+        file_path.write_bytes(version)
+        digests.append(bethspornitz_analytics.store_artifact(file_path, 'http://example.com/sample.csv'))
+    copy_path.write_bytes(b'second')
+    assert bethspornitz_analytics.store_artifact(copy_path) == digests[1]
+
+    assert digests[0] == digests[2] == hashlib.sha256(b'first').hexdigest()
+    assert sum(path.is_file() for path in data_path.joinpath('store', 'blobs').rglob('*')) == 2
+    versions = bethspornitz_analytics.list_artifact_versions(file_path)
+    assert [version['hash'] for version in versions] == [digests[1], digests[0]]
+    assert versions[-1]['url'] == 'http://example.com/sample.csv'
+
+    bethspornitz_analytics.restore_artifact_version(file_path, digests[1])
+    assert file_path.read_bytes() == b'second'
+    assert bethspornitz_analytics.list_artifact_versions(file_path)[-1]['hash'] == digests[1]
+
+# Once the store is too large, the least recently used old versions are removed; current versions are kept
+def test_artifact_store_evicts_least_recently_used(data_path, monkeypatch):
+    monkeypatch.setattr(bethspornitz_analytics, 'artifact_store_max_bytes', 350)
+    file_path = bethspornitz_analytics.create_folder('csv', 'sample').joinpath('sample.csv')
+    digests = []
+    for version in range(3):
+        file_path.write_bytes(bytes([version]) * 100)
+        digests.append(bethspornitz_analytics.store_artifact(file_path))
+
+    # Reading the oldest version makes it the most recently used, so the middle one goes first
+    bethspornitz_analytics.get_artifact_version_path(digests[0])
+    file_path.write_bytes(bytes([3]) * 100)
+    digests.append(bethspornitz_analytics.store_artifact(file_path))
+    assert [version['hash'] for version in bethspornitz_analytics.list_artifact_versions(file_path)] == [digests[0], digests[2], digests[3]]
+    with pytest.raises(FileNotFoundError):
+        bethspornitz_analytics.get_artifact_version_path(digests[1])
+
+    # The current version is kept even when it alone is larger than the limit
+    monkeypatch.setattr(bethspornitz_analytics, 'artifact_store_max_bytes', 10)
+    file_path.write_bytes(bytes([4]) * 100)
+    current = bethspornitz_analytics.store_artifact(file_path)
+    assert [version['hash'] for version in bethspornitz_analytics.list_artifact_versions(file_path)] == [current]
+
+# Downloads are added to the store with the URL they came from
+def test_downloads_are_stored(data_path, http_server):
+    datasets = serve_sample_datasets(http_server)
+    bethspornitz_analytics.process_datasets_concurrently(datasets, analysis_workers=1)
+    for dataset_name, (file_type, url) in datasets.items():
+        file_path = bethspornitz_analytics.get_dataset_file_path(dataset_name, file_type)
+        versions = bethspornitz_analytics.list_artifact_versions(file_path)
+        assert [(version['hash'], version['url']) for version in versions] == [(bethspornitz_analytics.hash_file(file_path), url)]
+
+###############################
+# Record and replay
+###############################
+
+# Replaying recorded datasets writes the same reports as downloading them, without going back to the source
+def test_replayed_datasets_match_downloaded(tmp_path, monkeypatch, http_server):
+    datasets = serve_sample_datasets(http_server)
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('downloaded'))
+    assert bethspornitz_analytics.process_datasets_concurrently(datasets, analysis_workers=1) == {}
+
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('replayed'))
+    bethspornitz_analytics.record_fixtures(datasets)
+    request_count = len(http_server.requests)
+
+    server = bethspornitz_analytics.start_replay_server(latency=0.01, port=0)
+    try:
+        replay_datasets = bethspornitz_analytics.get_replay_datasets(server, datasets)
+        assert bethspornitz_analytics.process_datasets_concurrently(replay_datasets, analysis_workers=1) == {}
+
+        # A second run revalidates against the recorded ETags
+        assert bethspornitz_analytics.process_datasets_concurrently(replay_datasets, analysis_workers=1) == {}
+        assert get_http_status(replay_datasets['sample_csv'][1], {'If-None-Match': http_etag(csv_sample.encode('utf-8'))}) == 304
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(http_server.requests) == request_count
+    assert read_reports(tmp_path.joinpath('replayed')) == read_reports(tmp_path.joinpath('downloaded'))
+
+# The replay server answers Range requests like a real server: 206 with the requested bytes (suffix ranges
+# and plain ranges without If-Range included), 416 for a range past the end, and the whole body for a Range
+# it cannot use (malformed, several ranges, or an If-Range that no longer matches)
+def test_replay_server_ranges(data_path, http_server):
+    body = random.Random(13).randbytes(3000)
+    http_server.files['/data.bin'] = body
+    url = http_server.url('/data.bin')
+    assert bethspornitz_analytics.record_fixtures({'data': ('csv', url)}) == {}
+    etag = http_etag(body)
+
+    server = bethspornitz_analytics.start_replay_server(port=0)
+    try:
+        replay_url = bethspornitz_analytics.get_replay_datasets(server, {'data': ('csv', url)})['data'][1]
+        cases = [
+            ({'Range': 'bytes=-500'}, 206, body[-500:]),
+            ({'Range': 'bytes=-5000'}, 206, body),
+            ({'Range': 'bytes=10-19'}, 206, body[10:20]),
+            ({'Range': 'bytes=2990-9999'}, 206, body[2990:]),
+            ({'Range': 'bytes=1000-'}, 206, body[1000:]),
+            ({'Range': 'bytes=1000-', 'If-Range': etag}, 206, body[1000:]),
+            ({'Range': 'bytes=1000-', 'If-Range': '"old"'}, 200, body),
+            ({'Range': 'bytes=20-10'}, 200, body),
+            ({'Range': 'bytes=0-1,5-6'}, 200, body),
+            ({'Range': 'lines=1-2'}, 200, body),
+            ({'Range': 'bytes=3000-'}, 416, b''),
+            ({'Range': 'bytes=-0'}, 416, b''),
+        ]
+        for headers, status, expected in cases:
+            response = requests.get(replay_url, headers=headers)
+            assert (response.status_code, response.content) == (status, expected), headers
+            if status == 206:
+                start = len(body) - len(expected) if headers['Range'].startswith('bytes=-') else int(headers['Range'][6:].split('-')[0])
+                assert response.headers['Content-Range'] == f"bytes {start}-{start + len(expected) - 1}/{len(body)}"
+            elif status == 416:
+                assert response.headers['Content-Range'] == f"bytes */{len(body)}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# A URL that cannot be recorded is returned with its error, the others are still recorded,
+# and an earlier recording of the failing URL is kept
+def test_record_fixtures_reports_failures(data_path, http_server):
+    datasets = serve_sample_datasets(http_server)
+    assert bethspornitz_analytics.record_fixtures(datasets) == {}
+    body_path, info_path = bethspornitz_analytics.get_fixture_paths(datasets['sample_csv'][1])
+    assert body_path.read_bytes() == http_server.files['/sample.csv']
+
+    del http_server.files['/sample.csv']
+    http_server.files['/sample.txt'] += b' more words'
+    datasets['missing_json'] = ('json', http_server.url('/missing.json'))
+    errors = bethspornitz_analytics.record_fixtures(datasets, refresh=True)
+    assert sorted(errors) == ['missing_json', 'sample_csv'] and errors['sample_csv'].startswith('Recording failed: 404')
+    assert body_path.read_bytes() == csv_sample.encode('utf-8') and info_path.exists()
+    assert bethspornitz_analytics.get_fixture_paths(datasets['sample_txt'][1])[0].read_bytes() == http_server.files['/sample.txt']
+    assert not bethspornitz_analytics.get_fixture_paths(datasets['missing_json'][1])[1].exists()
+    assert not list(body_path.parent.glob('*.tmp'))
+
+###############################
+# Compression
+###############################
+
+# Compress a body in each supported format (zstd only when the zstandard package is installed)
+def compress_body(body, compression):
+    if compression == 'gzip':
+        return gzip.compress(body)
+    elif compression == 'bz2':
+        return bz2.compress(body)
+    elif compression == 'xz':
+        return lzma.compress(body)
+    return bethspornitz_analytics.zstandard.ZstdCompressor().compress(body)
+
+compressions = ['gzip', 'bz2', 'xz', pytest.param('zstd', marks=pytest.mark.skipif(
+    bethspornitz_analytics.zstandard is None, reason="zstandard is not installed"))]
+
+# Compressed bodies are detected by their first bytes and decompressed in pieces; other bodies pass through
+@pytest.mark.parametrize('compression', compressions)
+@pytest.mark.parametrize('chunk_size', chunk_sizes)
+def test_decompress_chunks(compression, chunk_size):
+    body = csv_sample.encode('utf-8')
+    compressed = compress_body(body, compression)
+    assert bethspornitz_analytics.detect_compression(compressed) == compression
+    assert b''.join(bethspornitz_analytics.decompress_chunks(split_into_chunks(compressed, chunk_size))) == body
+    assert b''.join(bethspornitz_analytics.decompress_chunks(split_into_chunks(body, chunk_size))) == body
+
+    # Compressed parts back to back are read in full, and a body cut short is an error
+    assert b''.join(bethspornitz_analytics.decompress_chunks([compressed + compressed])) == body + body
+    with pytest.raises(ValueError):
+        b''.join(bethspornitz_analytics.decompress_chunks(split_into_chunks(compressed[:-8], chunk_size)))
+
+# zstandard is optional: without it, Zstandard data is an error that names the missing package
+def test_zstd_without_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(bethspornitz_analytics, 'zstandard', None)
+    body = b'\x28\xb5\x2f\xfd' + bytes(60)
+    file_path = tmp_path.joinpath('sample.csv.zst')
+    file_path.write_bytes(body)
+    with pytest.raises(ValueError, match='zstandard'):
+        bethspornitz_analytics.open_dataset_file(file_path)
+    with pytest.raises(ValueError, match='zstandard'):
+        b''.join(bethspornitz_analytics.decompress_chunks([body]))
+
+# A compressed text URL is saved compressed and gives the same report as the plain text
+@pytest.mark.parametrize('compression', compressions)
+@pytest.mark.parametrize('streaming', [False, True])
+def test_compressed_txt_url(data_path, http_server, compression, streaming):
+    suffix = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz', 'zstd': '.zst'}[compression]
+    body = (txt_sample * 20).encode('utf-8')
+    http_server.files[f"/sample.txt{suffix}"] = compress_body(body, compression)
+    bethspornitz_analytics.process_txt_file('sample', f"sample.txt{suffix}", http_server.url(f"/sample.txt{suffix}"), streaming=streaming)
+
+    folder_path = data_path.joinpath('txt', 'sample')
+    assert folder_path.joinpath(f"sample.txt{suffix}").read_bytes() == http_server.files[f"/sample.txt{suffix}"]
+    with bethspornitz_analytics.open_dataset_file(folder_path.joinpath(f"sample.txt{suffix}")) as file:
+        assert file.read() == body
+    expected = bethspornitz_analytics.format_txt_analysis(*legacy_txt_counts(txt_sample * 20))
+    assert folder_path.joinpath('analysis_sample.txt').read_text(encoding='utf-8') == expected
+
+###############################
+# Table summaries in chunks
+###############################
+
+# Running statistics merged across chunks (some empty, some with missing values) match the whole column
+def test_running_stats_merge():
+    rng = np.random.default_rng(1)
+    values = rng.normal(1000, 50, 10000)
+    values[rng.integers(0, len(values), 300)] = np.nan
+    df = pd.DataFrame({'x': values})
+
+    merged = bethspornitz_analytics.create_running_stats()
+    for chunk in [df.iloc[:0], *split_into_chunks(df, 777), df.iloc[:0]]:
+        merged = bethspornitz_analytics.merge_running_stats(merged, bethspornitz_analytics.compute_running_stats(chunk)['x'])
+
+    column = df['x']
+    assert merged['count'] == column.count()
+    assert merged['mean'] == pytest.approx(column.mean(), rel=1e-12)
+    assert merged['m2'] / (merged['count'] - 1) == pytest.approx(column.var(), rel=1e-9)
+    assert (merged['min'], merged['max']) == (column.min(), column.max())
+
+# A quantile sketch that still holds every value gives the same quantiles as pandas
+def test_quantile_sketch_exact_while_small():
+    values = np.random.default_rng(2).exponential(10, 500)
+    sketches = [bethspornitz_analytics.update_quantile_sketch(bethspornitz_analytics.create_quantile_sketch(), part) for part in np.array_split(values, 4)]
+    merged = bethspornitz_analytics.merge_quantile_sketches(sketches)
+    assert bethspornitz_analytics.is_quantile_sketch_exact(merged)
+    quantiles = [0, 0.25, 0.5, 0.75, 1]
+    np.testing.assert_allclose(bethspornitz_analytics.query_quantile_sketch(merged, quantiles), pd.Series(values).quantile(quantiles), rtol=1e-12)
+
+# Merged quantile sketches keep the count, minimum and maximum, and their quantiles stay within the error bound
+def test_quantile_sketch_merge():
+    k = 100
+    values = np.random.default_rng(3).normal(0, 1, 50000)
+    sketches = [
+        bethspornitz_analytics.update_quantile_sketch(bethspornitz_analytics.create_quantile_sketch(k), part)
+        for part in np.array_split(values, 13)
+    ]
+    merged = bethspornitz_analytics.merge_quantile_sketches(sketches)
+    assert not bethspornitz_analytics.is_quantile_sketch_exact(merged)
+    assert (merged['count'], merged['min'], merged['max']) == (len(values), values.min(), values.max())
+
+    quantiles = np.linspace(0, 1, 21)
+    ranks = np.searchsorted(np.sort(values), bethspornitz_analytics.query_quantile_sketch(merged, quantiles)) / len(values)
+    assert np.abs(ranks - quantiles).max() <= 3.3 / k
+
+# Merging distinct-count sketches gives the sketch of all the values, and an estimate within the expected error
+def test_distinct_sketch_merge():
+    series = pd.Series(np.random.default_rng(4).integers(0, 40000, 100000))
+    whole = bethspornitz_analytics.update_distinct_sketch(
+        bethspornitz_analytics.create_distinct_sketch(), bethspornitz_analytics.hash_column_values(series)
+    )
+    parts = [
+        bethspornitz_analytics.update_distinct_sketch(bethspornitz_analytics.create_distinct_sketch(), bethspornitz_analytics.hash_column_values(part))
+        for part in split_into_chunks(series, 30000)
+    ]
+    merged = bethspornitz_analytics.merge_distinct_sketches(parts)
+    np.testing.assert_array_equal(merged['registers'], whole['registers'])
+
+    # The typical error is 1.04 / sqrt(2 ** precision); allow three times that
+    error = 1.04 / np.sqrt(2 ** bethspornitz_analytics.distinct_sketch_precision)
+    assert bethspornitz_analytics.estimate_distinct_count(merged) == pytest.approx(series.nunique(), rel=3 * error)
+
+# 5 and 5.0 are the same value, wherever they are seen
+def test_distinct_sketch_numbers_hash_as_floats():
+    ints = bethspornitz_analytics.hash_column_values(pd.Series([1, 2, 5]))
+    floats = bethspornitz_analytics.hash_column_values(pd.Series([1.0, 2.0, 5.0, np.nan]))
+    np.testing.assert_array_equal(ints, floats)
+
+# A CSV file with missing values, and a column that only turns to text in a later chunk
+def write_mixed_csv(file_path, rows=300):
+    rng = random.Random(5)
+    lines = ["ints,floats,text,late_text"]
+    for index in range(rows):
+        floats = '' if index % 9 == 0 else f"{rng.uniform(-5, 5):.4f}"
+        late_text = 'late' if index == rows - 2 else str(index)
+        lines.append(f"{rng.randrange(1000)},{floats},word{index % 7},{late_text}")
+    file_path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+# A CSV summarized in chunks has the statistics, missing counts and column types of the whole file
+@pytest.mark.parametrize('chunk_size', [3, 7, 64, 1000])
+def test_chunked_csv_summary_matches_whole_file(data_path, chunk_size):
+    file_path = bethspornitz_analytics.create_folder('csv', 'mixed').joinpath('mixed.csv')
+    write_mixed_csv(file_path)
+    df = pd.read_csv(file_path)
+
+    summary = bethspornitz_analytics.analyze_csv_file_in_chunks('mixed', file_path, chunk_size=chunk_size)
+    assert summary['rows'] == len(df)
+    assert summary['nulls'] == df.isnull().sum().to_dict()
+    assert bethspornitz_analytics.get_summary_numeric_columns(summary) == ['ints', 'floats']
+    pd.testing.assert_frame_equal(bethspornitz_analytics.describe_table_summary(summary), df.describe(), rtol=1e-9)
+    assert bethspornitz_analytics.get_summary_preview(summary).to_string() == df.head(5).to_string()
+
+# Sketch sizes follow the settings as they are when the sketches are made, or the sizes passed in;
+# an incremental run with different sizes than the saved sketches reads the whole file again
+def test_sketch_sizes(data_path, monkeypatch):
+    monkeypatch.setattr(bethspornitz_analytics, 'quantile_sketch_k', 50)
+    monkeypatch.setattr(bethspornitz_analytics, 'distinct_sketch_precision', 8)
+    assert bethspornitz_analytics.create_quantile_sketch()['k'] == 50
+    assert len(bethspornitz_analytics.create_distinct_sketch()['registers']) == 2 ** 8
+
+    file_path = bethspornitz_analytics.create_folder('csv', 'mixed').joinpath('mixed.csv')
+    write_mixed_csv(file_path)
+    def sketch_sizes(summary):
+        return {sketch['k'] for sketch in summary['quantiles'].values()}, {sketch['precision'] for sketch in summary['distinct'].values()}
+
+    assert sketch_sizes(bethspornitz_analytics.analyze_csv_file_in_chunks('mixed', file_path, 64)) == ({50}, {8})
+    assert sketch_sizes(bethspornitz_analytics.analyze_csv_file_in_chunks('mixed', file_path, 64, quantile_k=64, distinct_precision=9)) == ({64}, {9})
+
+    read_starts = []
+    read_file_range_chunks = bethspornitz_analytics.read_file_range_chunks
+    def record_read_start(file_path, start, end, *args):
+        read_starts.append(start)
+        return read_file_range_chunks(file_path, start, end, *args)
+
+    monkeypatch.setattr(bethspornitz_analytics, 'read_file_range_chunks', record_read_start)
+    bethspornitz_analytics.analyze_csv_file_incrementally('mixed', file_path, 64, distinct_precision=9)
+    size = file_path.stat().st_size
+    with file_path.open('a', encoding='utf-8') as file:
+        file.write("5,1.5,word1,6\n")
+    summary = bethspornitz_analytics.analyze_csv_file_incrementally('mixed', file_path, 64, distinct_precision=9)
+    assert read_starts == [0, size] and sketch_sizes(summary) == ({50}, {9})
+    summary = bethspornitz_analytics.analyze_csv_file_incrementally('mixed', file_path, 64, quantile_k=64, distinct_precision=10)
+    assert read_starts == [0, size, 0] and sketch_sizes(summary) == ({64}, {10}) and summary['rows'] == 301
+
+###############################
+# Columnar cache
+###############################
+
+# A parsed table is cached next to its file and reused until the file's contents change
+def test_columnar_cache_invalidation(data_path, monkeypatch):
+    file_path = bethspornitz_analytics.create_folder('csv', 'mixed').joinpath('mixed.csv')
+    write_mixed_csv(file_path)
+    parsed = []
+
+    def read_csv(path):
+        parsed.append(path)
+        return pd.read_csv(path)
+
+    first = bethspornitz_analytics.read_table_cached(file_path, read_csv)
+    cached = bethspornitz_analytics.read_table_cached(file_path, read_csv)
+    assert len(parsed) == 1
+    assert cached.to_string() == first.to_string()
+    for column in ['ints', 'floats']:
+        np.testing.assert_array_equal(cached[column].to_numpy(), first[column].to_numpy())
+        assert cached[column].dtype == first[column].dtype
+
+    # Touching the file without changing it keeps the cache; new contents are parsed again
+    os.utime(file_path, ns=(file_path.stat().st_atime_ns, file_path.stat().st_mtime_ns + 10 ** 9))
+    bethspornitz_analytics.read_table_cached(file_path, read_csv)
+    assert len(parsed) == 1
+    write_mixed_csv(file_path, rows=301)
+    assert len(bethspornitz_analytics.read_table_cached(file_path, read_csv)) == 301
+    assert len(parsed) == 2
+
+    # Same size, different contents
+    file_path.write_bytes(file_path.read_bytes().replace(b'word1', b'word9'))
+    assert 'word1' not in bethspornitz_analytics.read_table_cached(file_path, read_csv)['text'].astype(str).tolist()
+    assert len(parsed) == 3
+
+    monkeypatch.setattr(bethspornitz_analytics, 'columnar_cache_enabled', False)
+    bethspornitz_analytics.read_table_cached(file_path, read_csv)
+    assert len(parsed) == 4
+
+# A cache hit returns the same dtypes as a fresh parse, text columns included (not Categoricals),
+# so group-bys order the groups the same way
+def test_columnar_cache_keeps_dtypes(data_path):
+    file_path = bethspornitz_analytics.create_folder('csv', 'mixed').joinpath('mixed.csv')
+    write_mixed_csv(file_path)
+
+    def read_table(path):
+        df = pd.read_csv(path)
+        df['objects'] = pd.Series(['zulu', 'alpha', None, 'mike'] * (len(df) // 4), dtype=object)
+        return df
+
+    first = bethspornitz_analytics.read_table_cached(file_path, read_table)
+    cached = bethspornitz_analytics.read_table_cached(file_path, read_table)
+    assert cached.dtypes.to_dict() == first.dtypes.to_dict()
+    for column in first.columns:
+        assert cached[column].isna().tolist() == first[column].isna().tolist()
+        assert cached[column].dropna().tolist() == first[column].dropna().tolist()
+    assert cached.groupby('objects').size().index.tolist() == first.groupby('objects').size().index.tolist()
+
+###############################
+# Parsing downloads from memory
+###############################
+
+# CSV and JSON bodies parsed from memory give the same reports as the files saved in the background,
+# and the files hold the bodies exactly as they were received
+def test_parse_from_memory_matches_saved_file(tmp_path, monkeypatch, http_server):
+    datasets = serve_sample_datasets(http_server)
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('memory'))
+    bethspornitz_analytics.process_csv_file('sample_csv', 'sample_csv.csv', datasets['sample_csv'][1])
+    bethspornitz_analytics.process_json_file('sample_json', 'sample_json.json', datasets['sample_json'][1])
+    csv_path = tmp_path.joinpath('memory', 'csv', 'sample_csv', 'sample_csv.csv')
+    json_path = tmp_path.joinpath('memory', 'json', 'sample_json', 'sample_json.json')
+    assert csv_path.read_bytes() == http_server.files['/sample.csv']
+    assert json_path.read_bytes() == http_server.files['/sample.json']
+
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('disk'))
+    bethspornitz_analytics.analyze_csv_file('sample_csv', csv_path)
+    bethspornitz_analytics.analyze_json_file('sample_json', json_path)
+    memory_reports = read_reports(tmp_path.joinpath('memory'))
+    assert len(memory_reports) == 2 and memory_reports == read_reports(tmp_path.joinpath('disk'))
+
+# Chunked and compressed CSV downloads are read from the saved file, and an unchanged download (304)
+# is analyzed again from disk, all with the same reports as the saved file
+@pytest.mark.parametrize('path, chunk_size', [('/sample.csv', None), ('/sample.csv', 50), ('/sample.csv.gz', None)])
+def test_csv_downloads_read_from_disk(tmp_path, monkeypatch, http_server, path, chunk_size):
+    http_server.files[path] = compress_body(csv_sample.encode('utf-8'), 'gzip') if path.endswith('.gz') else csv_sample.encode('utf-8')
+    filename = path.lstrip('/')
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('download'))
+    bethspornitz_analytics.process_csv_file('sample_csv', filename, http_server.url(path), chunk_size=chunk_size)
+    first_reports = read_reports(tmp_path.joinpath('download'))
+    bethspornitz_analytics.process_csv_file('sample_csv', filename, http_server.url(path), chunk_size=chunk_size)
+    assert 'If-None-Match' in http_server.requests[-1][1]
+    assert read_reports(tmp_path.joinpath('download')) == first_reports
+
+    file_path = tmp_path.joinpath('download', 'csv', 'sample_csv', filename)
+    assert file_path.read_bytes() == http_server.files[path]
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('disk'))
+    bethspornitz_analytics.analyze_csv_file('sample_csv', file_path, chunk_size)
+    assert len(first_reports) == 1 and first_reports == read_reports(tmp_path.joinpath('disk'))
+
+###############################
+# Append-only CSV feeds
+###############################
+
+# CSV lines of an append-only feed: a header, then one row per index
+def feed_csv_lines(start, stop):
+    header = ["Date,Value,Label\n"] if start == 0 else []
+    return header + [f"2020-{index % 12 + 1:02d}-01,{(index * 7919) % 1000 / 10},label{index % 5}\n" for index in range(start, stop)]
+
+# Only the bytes appended to a feed are downloaded and read, and the merged statistics match the whole file;
+# a feed that was rewritten instead is downloaded and read again in full
+def test_append_only_csv(data_path, monkeypatch, http_server):
+    url = http_server.url('/feed.csv')
+    file_path = bethspornitz_analytics.create_folder('csv', 'feed').joinpath('feed.csv')
+    read_starts = []
+    read_file_range_chunks = bethspornitz_analytics.read_file_range_chunks
+    def record_read_start(file_path, start, end, *args):
+        read_starts.append(start)
+        return read_file_range_chunks(file_path, start, end, *args)
+
+    monkeypatch.setattr(bethspornitz_analytics, 'read_file_range_chunks', record_read_start)
+
+    def run(expected_fetch):
+        assert bethspornitz_analytics.fetch_appended_bytes(url, file_path) == expected_fetch
+        assert file_path.read_bytes() == http_server.files['/feed.csv']
+        # The current version in the artifact store is the file as it is now, appended or not
+        versions = bethspornitz_analytics.list_artifact_versions(file_path)
+        assert versions[-1]['hash'] == hashlib.sha256(file_path.read_bytes()).hexdigest()
+        summary = bethspornitz_analytics.analyze_csv_file_incrementally('feed', file_path, chunk_size=300)
+        df = pd.read_csv(file_path)
+        assert summary['rows'] == len(df)
+        assert summary['nulls'] == df.isnull().sum().to_dict()
+        description = bethspornitz_analytics.describe_table_summary(summary)
+        pd.testing.assert_frame_equal(description.loc[['count', 'mean', 'std', 'min', 'max']], df.describe().loc[['count', 'mean', 'std', 'min', 'max']], rtol=1e-9)
+
+    http_server.files['/feed.csv'] = ''.join(feed_csv_lines(0, 3000)).encode('utf-8')
+    run('downloaded')
+    first_size = file_path.stat().st_size
+    assert read_starts == [0]
+
+    http_server.files['/feed.csv'] += ''.join(feed_csv_lines(3000, 5000)).encode('utf-8')
+    run('appended')
+    assert read_starts == [0, first_size]
+    assert http_server.requests[-1][1]['Range'] == f"bytes={first_size - bethspornitz_analytics.incremental_check_size}-"
+
+    run('unchanged')
+    assert read_starts == [0, first_size]
+
+    http_server.files['/feed.csv'] = ''.join(feed_csv_lines(0, 6000)).replace('label', 'other').encode('utf-8')
+    run('downloaded')
+    assert read_starts[-1] == 0
+
+###############################
+# Covid time series
+###############################
+
+# A covid table in the feed's order (by date, then country), with running totals that never go down
+def make_covid_table(country_count=6, day_count=40):
+    rng = np.random.default_rng(8)
+    dates = pd.date_range('2020-01-22', periods=day_count).strftime('%Y-%m-%d')
+    table = {
+        'Date': np.repeat(dates, country_count),
+        'Country': np.tile([f"Country {index}" for index in range(country_count)], day_count),
+    }
+    for column in bethspornitz_analytics.covid_value_columns:
+        table[column] = rng.integers(0, 50, size=(day_count, country_count)).cumsum(axis=0).ravel()
+    return pd.DataFrame(table)
+
+# The straightforward pandas version: per-country differences and rolling means, then totals and peaks
+def baseline_covid_aggregates(df):
+    days = bethspornitz_analytics.covid_rolling_days
+    daily = df.assign(Date=pd.to_datetime(df['Date'])).sort_values(['Country', 'Date'], ignore_index=True)
+    for column in bethspornitz_analytics.covid_value_columns:
+        new_values = daily.groupby('Country')[column].diff().fillna(daily[column])
+        daily[f"New {column}"] = new_values
+        daily[f"New {column} {days}-Day Average"] = new_values.groupby(daily['Country']).transform(lambda values: values.rolling(days, min_periods=1).mean())
+
+    new_columns = [f"New {column}" for column in bethspornitz_analytics.covid_value_columns]
+    by_date = daily.groupby('Date')[[*bethspornitz_analytics.covid_value_columns, *new_columns]].sum()
+    peaks = {}
+    for column in new_columns:
+        by_date[f"{column} {days}-Day Average"] = by_date[column].rolling(days, min_periods=1).mean()
+        peak_index = daily.groupby('Country')[column].idxmax()
+        peaks[f"Peak {column}"] = daily.loc[peak_index, column].to_numpy()
+        peaks[f"Peak {column} Date"] = daily.loc[peak_index, 'Date'].to_numpy()
+    return daily, by_date, pd.DataFrame(peaks, index=peak_index.index)
+
+# The vectorized aggregation, whole or in chunks of any size, matches the pandas baseline
+@pytest.mark.parametrize('chunk_size', [5, 13, 50, None])
+def test_covid_aggregates_match_baseline(tmp_path, chunk_size):
+    df = make_covid_table()
+    daily_path = tmp_path.joinpath('covid_daily.csv')
+    aggregates = bethspornitz_analytics.aggregate_covid_chunks(split_into_chunks(df, chunk_size), daily_path)
+    daily, by_date, peaks = baseline_covid_aggregates(df)
+
+    assert aggregates['rows'] == len(df)
+    pd.testing.assert_frame_equal(aggregates['by_date'], by_date, check_dtype=False, check_index_type=False, check_freq=False)
+    pd.testing.assert_frame_equal(aggregates['peaks'], peaks, check_dtype=False, check_index_type=False)
+    saved_daily = pd.read_csv(daily_path, parse_dates=['Date']).sort_values(['Country', 'Date'], ignore_index=True)
+    pd.testing.assert_frame_equal(saved_daily, daily, check_dtype=False)
+
+# covid_daily.csv is written in date and country order, byte for byte the same whole or in chunks,
+# whether the source is ordered by date or by country
+@pytest.mark.parametrize('order', [['Date', 'Country'], ['Country', 'Date']])
+@pytest.mark.parametrize('chunk_size', [13, 50])
+def test_covid_daily_order(tmp_path, order, chunk_size):
+    df = make_covid_table().sort_values(order, ignore_index=True)
+    whole_path = tmp_path.joinpath('whole.csv')
+    chunked_path = tmp_path.joinpath('chunked.csv')
+    bethspornitz_analytics.aggregate_covid_chunks([df], whole_path)
+    bethspornitz_analytics.aggregate_covid_chunks(split_into_chunks(df, chunk_size), chunked_path)
+    assert chunked_path.read_bytes() == whole_path.read_bytes()
+    saved_daily = pd.read_csv(whole_path)
+    assert saved_daily[['Date', 'Country']].equals(saved_daily[['Date', 'Country']].sort_values(['Date', 'Country'], ignore_index=True))
+
+###############################
+# Excel in chunks
+###############################
+
+# The .xls workbook saved in the repository's data folder
+sample_xls_path = pathlib.Path(__file__).parent.joinpath('data', 'excel', 'excel_data', 'excel_data.xls')
+
+# Write an .xlsx workbook with numbers, missing values, text and dates, and a second sheet
+def write_sample_xlsx(file_path, header=('c1', 'floats', 'text', 'when')):
+    import openpyxl
+
+    rng = random.Random(9)
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'first'
+    sheet.append(list(header))
+    for index in range(120):
+        floats = None if index % 11 == 0 else round(rng.uniform(-100, 100), 3)
+        sheet.append([rng.randrange(1000), floats, f"text {index % 6}", datetime.datetime(2020, 1, 1) + datetime.timedelta(days=index)])
+    second = workbook.create_sheet('second')
+    second.append(['c1', 'other'])
+    for index in range(30):
+        second.append([index * 3, f"row {index}"])
+    workbook.save(file_path)
+
+# Excel sheets read in chunks, with or without column and row selection, match pd.read_excel
+@pytest.mark.parametrize('file_name', ['sample.xlsx', 'sample.xls'])
+@pytest.mark.parametrize('usecols, skiprows, nrows', [(None, 0, None), (['c1'], 0, None), (None, 10, 25), (None, 0, 0)])
+@pytest.mark.parametrize('chunk_size', [7, 10000])
+def test_excel_chunks_match_read_excel(tmp_path, file_name, usecols, skiprows, nrows, chunk_size):
+    file_path = tmp_path.joinpath(file_name)
+    if file_name.endswith('.xlsx'):
+        write_sample_xlsx(file_path)
+    else:
+        shutil.copyfile(sample_xls_path, file_path)
+
+    chunks = list(bethspornitz_analytics.iter_excel_chunks(file_path, usecols=usecols, skiprows=skiprows, nrows=nrows, chunk_size=chunk_size))
+    expected = pd.read_excel(file_path, usecols=usecols, skiprows=range(1, 1 + skiprows), nrows=nrows)
+    expected.index = range(len(expected))
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected, check_dtype=False, check_index_type=False)
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+
+# A sheet other than the first can be read by name
+def test_excel_chunks_sheet_name(tmp_path):
+    file_path = tmp_path.joinpath('sample.xlsx')
+    write_sample_xlsx(file_path)
+    chunks = bethspornitz_analytics.iter_excel_chunks(file_path, sheet_name='second', chunk_size=8)
+    pd.testing.assert_frame_equal(pd.concat(list(chunks)), pd.read_excel(file_path, sheet_name='second'), check_index_type=False)
+
+# Repeated and empty headers are named like pd.read_excel names them (a, a.1, ..., Unnamed: <n>),
+# skipping a number that another header already has
+@pytest.mark.parametrize('usecols', [None, ['a.1', 'a.2']])
+def test_excel_chunks_duplicate_headers(tmp_path, usecols):
+    file_path = tmp_path.joinpath('sample.xlsx')
+    write_sample_xlsx(file_path, header=('a', 'a', 'a.1', None))
+    chunks = bethspornitz_analytics.iter_excel_chunks(file_path, usecols=usecols, chunk_size=50)
+    expected = pd.read_excel(file_path, usecols=usecols)
+    if usecols is None:
+        assert list(expected.columns) == ['a', 'a.2', 'a.1', 'Unnamed: 3']
+    pd.testing.assert_frame_equal(pd.concat(list(chunks)), expected, check_dtype=False, check_index_type=False)
+
+# Random headers with repeats, clashing numbers and empty cells are named the way pandas' header parser names them
+def test_excel_column_names_match_pandas():
+    rng = random.Random(12)
+    for _ in range(300):
+        header = [rng.choice(['a', 'a', 'a.1', 'a.2', 'a.1.1', 'b', 'Unnamed: 1', None]) for _ in range(rng.randint(1, 7))]
+        if all(name is None for name in header):
+            continue
+        line = ','.join('' if name is None else name for name in header)
+        expected = pd.read_csv(io.StringIO(line + '\n'), engine='python').columns.tolist()
+        assert bethspornitz_analytics.get_excel_column_names(header) == expected, header
+
+# Every sheet gets its own report, the same with one worker process or several, and the same as analyzing
+# that sheet alone; sheets with names that clash as folder names get separate folders
+def test_excel_workbook_per_sheet_reports(tmp_path, monkeypatch):
+    import openpyxl
+
+    file_path = tmp_path.joinpath('sample.xlsx')
+    write_sample_xlsx(file_path)
+    workbook = openpyxl.load_workbook(file_path)
+    for sheet_name in ['sales 2020', 'sales (2020)']:
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(['c1', 'name'])
+        for index in range(10):
+            sheet.append([index * len(sheet_name), sheet_name])
+    workbook.create_sheet('empty')
+    workbook.save(file_path)
+    sheet_folders = ['first', 'second', 'sales_2020', 'sales_2020_2']
+
+    reports = []
+    for workers in (1, 2):
+        folder_path = tmp_path.joinpath(f"workers_{workers}")
+        monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', folder_path)
+        results, errors = bethspornitz_analytics.analyze_excel_workbook('sample', file_path, workers=workers)
+        assert errors == {} and sorted(results) == ['empty', 'first', 'sales (2020)', 'sales 2020', 'second']
+        sheets_path = folder_path.joinpath('excel', 'sample', 'sheets')
+        assert sorted(path.name for path in sheets_path.iterdir()) == sorted(sheet_folders)
+        reports.append(read_reports(sheets_path))
+        combined = folder_path.joinpath('excel', 'sample', 'excel_sheets_analysis.txt').read_text(encoding='utf-8')
+        assert combined.startswith(f"Sheets: 5, analyzed by {workers} worker(s)")
+    assert reports[0] == reports[1]
+
+    monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath('alone'))
+    bethspornitz_analytics.write_excel_report(tmp_path.joinpath('alone'), pd.read_excel(file_path, sheet_name='sales (2020)'))
+    assert reports[0]['sales_2020_2/excel_analysis.txt'] == tmp_path.joinpath('alone', 'excel_analysis.txt').read_bytes()
+
+###############################
+# Charts
+###############################
+
+# Charts saved by the chart pool are the same images as charts rendered right away in this process,
+# and a chart that cannot be saved is reported by wait_for_charts
+def test_chart_pool_matches_inline_charts(tmp_path, monkeypatch):
+    rng = np.random.default_rng(3)
+    columns = {name: pd.Series(rng.normal(size=500) * scale, name=name) for name, scale in [('a', 1), ('b', 40), ('c', 0.01)]}
+
+    for workers in (0, 2):
+        monkeypatch.setattr(bethspornitz_analytics, 'chart_workers', workers)
+        folder_path = tmp_path.joinpath(f"workers_{workers}")
+        folder_path.mkdir()
+        for name, series in columns.items():
+            counts, bin_edges = np.histogram(series, bins=10)
+            bethspornitz_analytics.queue_histogram_chart(folder_path / f"{name}.png", counts, bin_edges, f"Histogram of {name}", name, 'Frequency')
+        assert bethspornitz_analytics.wait_for_charts() == {}
+
+    for name in columns:
+        inline_chart = tmp_path.joinpath('workers_0', f"{name}.png").read_bytes()
+        assert inline_chart.startswith(b'\x89PNG')
+        assert tmp_path.joinpath('workers_2', f"{name}.png").read_bytes() == inline_chart
+
+    missing_path = tmp_path.joinpath('missing', 'chart.png')
+    bethspornitz_analytics.queue_histogram_chart(missing_path, [1, 2], [0.0, 1.0, 2.0])
+    assert list(bethspornitz_analytics.wait_for_charts()) == [missing_path]
+
+
+
+###############################
+# Histograms
+###############################
+
+histogram_df = pd.DataFrame({
+    'ints': np.random.default_rng(5).integers(-50, 50, 5000),
+    'floats': np.where(np.arange(5000) % 7 == 0, np.nan, np.random.default_rng(6).normal(0, 1e6, 5000)),
+    'constant': 3.0,
+    'missing': np.nan,
+    'tiny': np.random.default_rng(7).uniform(0, 1e-12, 5000),
+    'text': 'not counted',
+})
+
+# The bins of every numeric column are the same as np.histogram's
+@pytest.mark.parametrize('bins', [1, 10, 37])
+def test_histograms_match_numpy(bins):
+    histograms = bethspornitz_analytics.compute_histograms(histogram_df, bins)
+    assert histograms['columns'] == ['ints', 'floats', 'constant', 'missing', 'tiny']
+    for column in histograms['columns']:
+        counts, bin_edges = bethspornitz_analytics.get_column_histogram(histograms, column)
+        expected_counts, expected_edges = np.histogram(histogram_df[column].dropna(), bins=bins)
+        np.testing.assert_array_equal(counts, expected_counts)
+        np.testing.assert_array_equal(bin_edges, expected_edges)
+
+# Histograms counted chunk by chunk and merged are the same as the histograms of the whole table
+def test_histograms_merge():
+    whole = bethspornitz_analytics.compute_histograms(histogram_df)
+    numeric_df = histogram_df[whole['columns']]
+    mins, maxs = numeric_df.min().to_numpy(), numeric_df.max().to_numpy()
+
+    merged = bethspornitz_analytics.create_histograms(whole['columns'], mins, maxs)
+    for chunk in split_into_chunks(histogram_df, 999):
+        part = bethspornitz_analytics.create_histograms(whole['columns'], mins, maxs)
+        merged = bethspornitz_analytics.merge_histograms(merged, bethspornitz_analytics.update_histograms(part, chunk, block_values=300))
+    np.testing.assert_array_equal(merged['counts'], whole['counts'])
+
+    with pytest.raises(ValueError):
+        bethspornitz_analytics.merge_histograms(whole, bethspornitz_analytics.compute_histograms(histogram_df, 5))
+
+
+###############################
+# JSON in chunks
+###############################
+
+# Build a random JSON value with nested objects and arrays, escaped and non-ASCII strings and every kind of number
+def random_json_value(rng, depth=0):
+    kind = rng.choice(['object', 'array', 'string', 'number', 'literal'] if depth < 3 else ['string', 'number', 'literal'])
+    if kind == 'object':
+        return {random_json_string(rng): random_json_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    if kind == 'array':
+        return [random_json_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    if kind == 'string':
+        return random_json_string(rng)
+    if kind == 'number':
+        return rng.choice([rng.randint(-10 ** 6, 10 ** 6), rng.uniform(-1e6, 1e6), 1e-300, 0])
+    return rng.choice([True, False, None])
+
+def random_json_string(rng):
+    return ''.join(rng.choice(['a', 'B', ' ', '"', '\\', '/', '\n', '\t', '{', ']', ',', ':', 'é', '☃', ' ']) for _ in range(rng.randint(0, 8)))
+
+# Streamed items match json.loads for random documents cut into chunks of any size
+@pytest.mark.parametrize('chunk_size', chunk_sizes)
+def test_json_items_match_json_loads(chunk_size):
+    rng = random.Random(chunk_size)
+    for _ in range(50):
+        document = {
+            'message': random_json_value(rng),
+            'people': [random_json_value(rng) for _ in range(rng.randint(0, 5))],
+            'number': random_json_value(rng),
+        }
+        text = json.dumps(document, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+        items = list(bethspornitz_analytics.iter_json_items(split_into_chunks(text, chunk_size)))
+        assert items == json.loads(text)['people']
+
+# 'item' alone streams a top-level array, and a path that is not in the document yields nothing
+@pytest.mark.parametrize('chunk_size', chunk_sizes)
+def test_json_items_paths(chunk_size):
+    text = '[{"a": [1, 2]}, "x", null]'
+    assert list(bethspornitz_analytics.iter_json_items(split_into_chunks(text, chunk_size), 'item')) == json.loads(text)
+    assert list(bethspornitz_analytics.iter_json_items(split_into_chunks(text, chunk_size), 'item.a.item')) == [1, 2]
+    text = '{"message": "success", "number": 0}'
+    assert list(bethspornitz_analytics.iter_json_items(split_into_chunks(text, chunk_size))) == []
+
+# Invalid documents raise ValueError, like json.loads
+@pytest.mark.parametrize('chunk_size', chunk_sizes)
+@pytest.mark.parametrize('text', [
+    '',
+    '{"people": [1, 2',
+    '{"people": [1 2]}',
+    '{"people": [}',
+    '{"people": [tru]}',
+    '{"people": ["unterminated]}',
+    '{"skipped": [1, 2, "people": []}',
+    '{"people" [1]}',
+])
+def test_json_items_invalid(text, chunk_size):
+    with pytest.raises(ValueError):
+        list(bethspornitz_analytics.iter_json_items(split_into_chunks(text, chunk_size)))
+
+# Anything but whitespace after the document raises ValueError, like json.loads
+@pytest.mark.parametrize('chunk_size', chunk_sizes)
+@pytest.mark.parametrize('text', ['{"people": [1]} {}', '{"people": []}x', '[1] [2]'])
+def test_json_items_trailing_data(text, chunk_size):
+    with pytest.raises(ValueError, match='extra data'):
+        list(bethspornitz_analytics.iter_json_items(split_into_chunks(text, chunk_size), 'item' if text.startswith('[') else 'people.item'))
+
+# A streamed download gives the same report as the whole-body path, and the same file as it was received
+def test_streamed_json_download_matches_whole_body(tmp_path, monkeypatch, http_server):
+    datasets = serve_sample_datasets(http_server)
+    for streaming in (False, True):
+        monkeypatch.setattr(bethspornitz_analytics, 'base_data_path', tmp_path.joinpath(str(streaming)))
+        bethspornitz_analytics.process_json_file('sample_json', 'sample_json.json', datasets['sample_json'][1], streaming=streaming)
+        json_path = tmp_path.joinpath(str(streaming), 'json', 'sample_json', 'sample_json.json')
+        assert json_path.read_bytes() == http_server.files['/sample.json']
+    assert read_reports(tmp_path.joinpath('True')) == read_reports(tmp_path.joinpath('False'))
+
+# A document that fails to parse halfway leaves the previous simplified_data.txt in place
+def test_json_items_keep_previous_report_on_error(data_path):
+    folder_path = bethspornitz_analytics.create_folder('json', 'sample_json')
+    file_path = folder_path.joinpath('sample_json.json')
+    file_path.write_text(json_sample, encoding='utf-8')
+    assert bethspornitz_analytics.analyze_json_file_in_chunks('sample_json', file_path) == 3
+    report = folder_path.joinpath('simplified_data.txt').read_bytes()
+
+    file_path.write_text(json_sample[:len(json_sample) // 2], encoding='utf-8')
+    with pytest.raises(ValueError):
+        bethspornitz_analytics.analyze_json_file_in_chunks('sample_json', file_path)
+    assert folder_path.joinpath('simplified_data.txt').read_bytes() == report
+    assert sorted(path.name for path in folder_path.iterdir()) == ['sample_json.json', 'simplified_data.txt']